@@ -0,0 +1,362 @@
+"""
+Dry-run planner for pgn_to_piecevals.py.
+
+Streams a PGN file without calling Stockfish for every position and estimates what a real run would cost:
+- games, plies (positions) and non-king pieces
+- Stockfish searches: 1 per position + 1 per piece whose removal passes is_board_valid (same filter as the real run)
+- unique positions (FENs), estimated from the first ESTIMATE_SAMPLE_GAMES games
+- seconds per search, measured with a short benchmark through evaluate_with_timeout (same code path as the real run)
+  on both original positions and positions with a piece removed, weighted by how many of each the real run searches
+- total core-hours, wall time of the slowest worker for NUM_WORKERS workers, output parquet size and peak memory
+
+Needs PGN_FILE_NAME. SF_PATH is optional: without it, set ESTIMATE_SECS_PER_EVAL instead of benchmarking.
+
+Usage:
+    PGN_FILE_NAME=... SF_PATH=... NUM_WORKERS=128 python -u estimate_pgn_cost.py
+"""
+
+# chess imports
+import chess
+import chess.pgn
+from stockfish import Stockfish
+from pgn_to_piecevals import (
+    is_board_valid, evaluate_with_timeout, get_material_string,
+    STOCKFISH_DEPTH, STOCKFISH_TIMEOUT,
+)
+from eco_codes import eco_code_to_opening_name
+
+# general imports
+import os
+import sys
+import time
+import hashlib
+import tracemalloc
+import numpy as np
+import pandas as pd
+from io import BytesIO, StringIO
+from multiprocessing import cpu_count, Pool
+
+PGN_FILE_NAME = os.environ.get("PGN_FILE_NAME", None) # PGN file with N games
+SF_PATH = os.environ.get("SF_PATH", None) # the big fish (optional here)
+NUM_WORKERS = int(os.environ.get("NUM_WORKERS", min(cpu_count(), 1))) # workers the real run will use
+
+# Estimator config
+ESTIMATE_SAMPLE_GAMES = int(os.environ.get("ESTIMATE_SAMPLE_GAMES", 1000)) # games used for unique position/output size estimates
+BENCHMARK_EVALS = int(os.environ.get("BENCHMARK_EVALS", 50)) # Stockfish searches timed for the benchmark (half of them with a piece removed)
+ESTIMATE_SECS_PER_EVAL = os.environ.get("ESTIMATE_SECS_PER_EVAL", None) # skip the benchmark and use this instead
+SLURM_TIME_LIMIT_MINUTES = float(os.environ.get("SLURM_TIME_LIMIT_MINUTES", 10000)) # --time in pgn_to_pval.sh
+SCAN_PROCESSES = int(os.environ.get("SCAN_PROCESSES", cpu_count())) # processes used to scan the PGN
+
+
+# Split a PGN file into raw game strings without parsing moves (cheap, so the scan can be parallel)
+def iter_raw_games(pgn_file_name):
+    """Yield the raw text of each game in the PGN file"""
+    lines = []
+    seen_moves = False
+    # utf-8-sig drops the byte order mark ChessBase exports start with
+    with open(pgn_file_name, encoding="utf-8-sig", errors="ignore") as pgn:
+        for line in pgn:
+            # A header line after movetext starts the next game
+            if line.startswith("[") and seen_moves:
+                yield "".join(lines)
+                lines = []
+                seen_moves = False
+            elif line.strip() and not line.startswith("["):
+                seen_moves = True
+            lines.append(line)
+    if seen_moves:
+        yield "".join(lines)
+
+# Stable 64-bit FEN hash (python's hash() differs between processes)
+def fen_hash(fen):
+    return int.from_bytes(hashlib.blake2b(fen.encode(), digest_size=8).digest(), "little")
+
+# Count everything a real run would do for one game, without calling Stockfish
+def scan_game(args):
+    """
+    Returns a dict with plies, non-king pieces, Stockfish searches and (if sampled) FEN hashes, benchmark FENs
+    (every position, and one removed-piece FEN per position) and a few example rows for the output size estimate.
+    """
+    game_str, sampled = args
+    game = chess.pgn.read_game(StringIO(game_str))
+    result = {'parsed': game is not None, 'plies': 0, 'pieces': 0, 'valid_removals': 0,
+              'over_positions': 0, 'evals': 0, 'fen_hashes': None, 'rm_fen_hashes': None,
+              'rows': None, 'fens': None, 'rm_fens': None}
+    if game is None:
+        return result
+
+    if sampled:
+        result['fen_hashes'] = []
+        result['rm_fen_hashes'] = []
+        result['rows'] = []
+        result['fens'] = []
+        result['rm_fens'] = []
+    eco_code = game.headers.get("ECO", "")
+    opening = eco_code_to_opening_name(eco_code)
+
+    board = game.board()
+    move_no = 0
+    for move in game.mainline_moves():
+        board.push(move)
+        move_no += 1
+        result['plies'] += 1
+        result['evals'] += 1 # original position is always searched
+
+        # Mate/stalemate positions come back from Stockfish as mate scores and are skipped entirely
+        if board.is_checkmate() or board.is_stalemate():
+            result['over_positions'] += 1
+            continue
+
+        fen = board.fen()
+        if sampled:
+            result['fen_hashes'].append(fen_hash(fen))
+            result['fens'].append(fen)
+            position_rm_fens = []
+
+        for square, piece in board.piece_map().items():
+            if piece.piece_type == chess.KING:
+                continue
+            result['pieces'] += 1
+
+            board_rm = board.copy()
+            board_rm.remove_piece_at(square)
+            if not is_board_valid(board_rm):
+                continue
+            result['valid_removals'] += 1
+            result['evals'] += 1
+
+            if sampled:
+                fen_rm = board_rm.fen()
+                result['rm_fen_hashes'].append(fen_hash(fen_rm))
+                position_rm_fens.append(fen_rm)
+                # Same columns as the real output, evals filled in later
+                result['rows'].append({
+                    'game_id': "w0_g0",
+                    'fen': fen,
+                    'move_number': move_no,
+                    'side_to_move': 'w' if board.turn == chess.WHITE else 'b',
+                    'eco_code': eco_code,
+                    'opening': opening,
+                    'white_material': get_material_string(board, chess.WHITE),
+                    'black_material': get_material_string(board, chess.BLACK),
+                    'piece_type': piece.symbol(),
+                    'rank': chess.square_rank(square),
+                    'file': chess.square_file(square),
+                })
+
+        # One removed-piece FEN per position for the benchmark (rotating through the pieces, not always the first)
+        if sampled and position_rm_fens:
+            result['rm_fens'].append(position_rm_fens[move_no % len(position_rm_fens)])
+    return result
+
+# Time Stockfish searches on sample positions through the same code path as pgn_to_piecevals.py
+def benchmark_stockfish(fens, num_evals):
+    """Return (seconds per search, fraction of searches returning None) over num_evals sample positions,
+    or (None, None) when there are no sample positions to search"""
+    if not fens or num_evals < 1:
+        return None, None
+    stockfish = Stockfish(path=SF_PATH)
+    stockfish._set_option("Threads", 1)
+    stockfish.set_depth(depth_value=STOCKFISH_DEPTH)
+
+    # Spread benchmark positions over the sample (openings are faster to search than middlegames)
+    step = max(1, len(fens) // num_evals)
+    bench_fens = fens[::step][:num_evals]
+    failures = 0
+    start = time.time()
+    for i, fen in enumerate(bench_fens):
+        if evaluate_with_timeout(stockfish, fen, timeout=STOCKFISH_TIMEOUT) is None:
+            failures += 1
+        print(f"  Benchmark search {i + 1}/{len(bench_fens)} ({time.time() - start:.1f}s elapsed)")
+    elapsed = time.time() - start
+    return elapsed / len(bench_fens), failures / len(bench_fens)
+
+# Measure output bytes (parquet, lz4) and in-memory bytes per row from sample rows
+def measure_row_sizes(rows):
+    """Return (parquet bytes/row, DataFrame bytes/row, python dict bytes/row)"""
+    rng = np.random.default_rng(0)
+
+    # Python dicts are what workers hold in memory until they write their parquet
+    tracemalloc.start()
+    dict_rows = [dict(row) for row in rows]
+    for row in dict_rows:
+        row['original_eval'] = int(rng.normal(0, 300))
+        row['eval_without_piece'] = int(rng.normal(0, 300))
+        row['piece_value'] = row['original_eval'] - row['eval_without_piece']
+    dict_bytes = tracemalloc.get_traced_memory()[0] / len(dict_rows)
+    tracemalloc.stop()
+
+    df = pd.DataFrame(dict_rows)
+    df_bytes = df.memory_usage(deep=True).sum() / len(df)
+    buffer = BytesIO()
+    df.to_parquet(buffer, compression='lz4', index=False, engine='pyarrow')
+    parquet_bytes = buffer.tell() / len(df)
+    return parquet_bytes, df_bytes, dict_bytes
+
+# Helper to print byte counts
+def format_bytes(num_bytes):
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if num_bytes < 1024 or unit == "TB":
+            return f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def main():
+    # Validate env variables
+    if PGN_FILE_NAME is None:
+        print("Error: PGN_FILE_NAME must be set. Exiting immediately my liege!")
+        sys.exit(1)
+    if SF_PATH is None and ESTIMATE_SECS_PER_EVAL is None:
+        print("Error: set SF_PATH (to benchmark Stockfish) or ESTIMATE_SECS_PER_EVAL. Exiting immediately my liege!")
+        sys.exit(1)
+
+    print(f"=== Dry Run Configuration ===")
+    print(f"PGN file: {PGN_FILE_NAME} ({format_bytes(os.path.getsize(PGN_FILE_NAME))})")
+    print(f"Workers (planned run): {NUM_WORKERS}")
+    print(f"Stockfish depth: {STOCKFISH_DEPTH}")
+    print(f"Stockfish timeout: {STOCKFISH_TIMEOUT}s")
+    print(f"Sample games: {ESTIMATE_SAMPLE_GAMES}")
+    print(f"Scan processes: {SCAN_PROCESSES}")
+    print("=" * 20)
+
+    # ========================================
+    # Scan the PGN (parallel, streaming)
+    # ========================================
+    print(f"\nScanning {PGN_FILE_NAME}...")
+    start_time = time.time()
+
+    totals = {'games': 0, 'plies': 0, 'pieces': 0, 'valid_removals': 0, 'over_positions': 0, 'evals': 0}
+    evals_per_game = []
+    pgn_bytes_per_game = []
+    sample_fen_hashes, sample_rm_fen_hashes, sample_rows, sample_fens, sample_rm_fens = [], [], [], [], []
+    sample_evals = 0
+
+    def game_args():
+        for game_index, game_str in enumerate(iter_raw_games(PGN_FILE_NAME)):
+            pgn_bytes_per_game.append(len(game_str))
+            yield game_str, game_index < ESTIMATE_SAMPLE_GAMES
+
+    with Pool(SCAN_PROCESSES) as pool:
+        for result in pool.imap(scan_game, game_args(), chunksize=16):
+            totals['games'] += 1
+            for key in ['plies', 'pieces', 'valid_removals', 'over_positions', 'evals']:
+                totals[key] += result[key]
+            evals_per_game.append(result['evals'])
+
+            if result['fen_hashes'] is not None:
+                sample_fen_hashes.extend(result['fen_hashes'])
+                sample_rm_fen_hashes.extend(result['rm_fen_hashes'])
+                sample_rows.extend(result['rows'])
+                sample_fens.extend(result['fens'])
+                sample_rm_fens.extend(result['rm_fens'])
+                sample_evals += result['evals']
+
+            if totals['games'] % 10000 == 0:
+                print(f"Scanned {totals['games']} games ({time.time() - start_time:.0f}s)")
+
+    if totals['games'] == 0:
+        print("No games found in PGN file!")
+        sys.exit(1)
+    print(f"Scanned {totals['games']} games in {time.time() - start_time:.1f} seconds")
+
+    # ========================================
+    # Unique positions (from the sample)
+    # ========================================
+    sample_positions = len(sample_fen_hashes)
+    unique_ratio = len(set(sample_fen_hashes)) / sample_positions if sample_positions else 1.0
+    sample_all = sample_fen_hashes + sample_rm_fen_hashes
+    unique_eval_ratio = len(set(sample_all)) / len(sample_all) if sample_all else 1.0
+
+    # ========================================
+    # Stockfish benchmark
+    # ========================================
+    if ESTIMATE_SECS_PER_EVAL is not None:
+        secs_per_eval = float(ESTIMATE_SECS_PER_EVAL)
+        failure_rate = 0.0
+        print(f"\nUsing ESTIMATE_SECS_PER_EVAL={secs_per_eval}s (no benchmark)")
+    else:
+        num_rm_bench = BENCHMARK_EVALS // 2
+        print(f"\nBenchmarking {BENCHMARK_EVALS} Stockfish searches at depth {STOCKFISH_DEPTH} "
+              f"({BENCHMARK_EVALS - num_rm_bench} original positions, {num_rm_bench} with a piece removed)...")
+        og_secs, og_failure_rate = benchmark_stockfish(sample_fens, BENCHMARK_EVALS - num_rm_bench)
+        if og_secs is None:
+            print("Error: the sampled games have no positions to benchmark. Raise ESTIMATE_SAMPLE_GAMES or set ESTIMATE_SECS_PER_EVAL. Exiting immediately my liege!")
+            sys.exit(1)
+        rm_secs, rm_failure_rate = benchmark_stockfish(sample_rm_fens, num_rm_bench)
+        if rm_secs is None:
+            print("No removed-piece positions benchmarked, using the original position timing for them")
+            rm_secs, rm_failure_rate = og_secs, og_failure_rate
+        print(f"  Original positions: {og_secs:.3f}s per search, with a piece removed: {rm_secs:.3f}s per search")
+
+        # The real run searches every position once plus every valid removal, so weight both by that mix
+        og_evals = totals['evals'] - totals['valid_removals']
+        secs_per_eval = (og_evals * og_secs + totals['valid_removals'] * rm_secs) / max(totals['evals'], 1)
+        # A row is lost if either its position's or its own removed-piece search fails
+        failure_rate = 1 - (1 - og_failure_rate) * (1 - rm_failure_rate)
+
+    # ========================================
+    # Projections
+    # ========================================
+    total_evals = totals['evals']
+    core_hours = total_evals * secs_per_eval / 3600
+
+    # Games are split into contiguous slices exactly like pgn_to_piecevals.main, so the slowest slice sets the wall time
+    games_per_worker, remainder = divmod(totals['games'], NUM_WORKERS)
+    slice_evals = []
+    slice_bytes = []
+    start_idx = 0
+    for i in range(NUM_WORKERS):
+        end_idx = start_idx + games_per_worker + (1 if i < remainder else 0)
+        slice_evals.append(sum(evals_per_game[start_idx:end_idx]))
+        slice_bytes.append(sum(pgn_bytes_per_game[start_idx:end_idx]))
+        start_idx = end_idx
+    slowest_worker_hours = max(slice_evals) * secs_per_eval / 3600
+    balanced_hours = core_hours / NUM_WORKERS
+
+    # Output rows lose searches that time out / fail
+    expected_rows = totals['valid_removals'] * (1 - failure_rate)
+    parquet_bytes, df_bytes, dict_bytes = measure_row_sizes(sample_rows) if sample_rows else (0, 0, 0)
+
+    # Memory: main holds every game string, each worker its slice + rows as dicts (then as a DataFrame when writing),
+    # and the final merge holds all worker DataFrames plus the concatenated copy
+    pgn_memory = sum(pgn_bytes_per_game)
+    rows_per_slice = [evals * totals['valid_removals'] / max(total_evals, 1) for evals in slice_evals]
+    workers_memory = sum(b + rows * (dict_bytes + df_bytes) for b, rows in zip(slice_bytes, rows_per_slice))
+    run_memory = pgn_memory + workers_memory
+    merge_memory = pgn_memory + 2 * expected_rows * df_bytes
+    peak_memory = max(run_memory, merge_memory)
+
+    print("\n=== Corpus ===")
+    print(f"Games: {totals['games']:,}")
+    print(f"Plies (positions): {totals['plies']:,}")
+    print(f"  Finished (mate/stalemate) positions: {totals['over_positions']:,}")
+    print(f"Non-king pieces: {totals['pieces']:,}")
+    print(f"Pieces passing is_board_valid after removal: {totals['valid_removals']:,} "
+          f"({totals['valid_removals'] / max(totals['pieces'], 1):.1%})")
+
+    print("\n=== Stockfish searches ===")
+    print(f"Total searches: {total_evals:,}")
+    print(f"Unique positions (sample of {min(ESTIMATE_SAMPLE_GAMES, totals['games'])} games): "
+          f"{unique_ratio:.1%} of positions, {unique_eval_ratio:.1%} of all searched FENs")
+    print(f"  -> ~{int(total_evals * unique_eval_ratio):,} unique searches (what a FEN cache could reduce it to)")
+    print(f"Seconds per search: {secs_per_eval:.3f}s (failed/mate in benchmark: {failure_rate:.1%})")
+
+    print(f"\n=== Projection for {NUM_WORKERS} workers ===")
+    print(f"Core-hours: {core_hours:,.1f}")
+    print(f"Wall time if perfectly balanced: {balanced_hours:,.1f} hours")
+    print(f"Wall time of slowest worker: {slowest_worker_hours:,.1f} hours ({slowest_worker_hours * 60:,.0f} minutes)")
+    if slowest_worker_hours * 60 > SLURM_TIME_LIMIT_MINUTES:
+        print(f"  WARNING: exceeds SLURM time limit of {SLURM_TIME_LIMIT_MINUTES:.0f} minutes!")
+    else:
+        print(f"  Fits in SLURM time limit of {SLURM_TIME_LIMIT_MINUTES:.0f} minutes "
+              f"({slowest_worker_hours * 60 / SLURM_TIME_LIMIT_MINUTES:.0%} used)")
+    print(f"Expected piece value rows: {int(expected_rows):,}")
+    print(f"Output parquet size: {format_bytes(expected_rows * parquet_bytes)} ({parquet_bytes:.1f} bytes/row)")
+    print(f"Peak memory (workers running): {format_bytes(run_memory)}")
+    print(f"Peak memory (final merge): {format_bytes(merge_memory)}")
+    print(f"Peak memory: {format_bytes(peak_memory)}")
+    print("=" * 20)
+    print("Note: searches per second, timeouts and unique positions are extrapolated from samples.")
+
+# main (main)
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Daemon version of pgn_to_piecevals.py for continuously labelling newly arriving games.
+
+Instead of reading one PGN_FILE_NAME and exiting, this script keeps NUM_WORKERS Stockfish workers
+running and feeds them games as they appear, either from:
+- PGN_WATCH_DIR: a directory polled for new (or appended-to) *.pgn files, or
+- stdin (when PGN_WATCH_DIR is not set), e.g. `cat new_games.pgn | python -u pgn_stream_ingest.py`
+  (SIGINT/SIGTERM stops it even while stdin is idle, the workers still flush before exiting)
+
+Each worker appends its piece values to PVP_DATASET_DIR as small parquet files (part-*.parquet)
+every STREAM_FLUSH_SECS seconds or STREAM_FLUSH_ROWS rows, so the directory is a growing parquet
+dataset that can be read at any time with pd.read_parquet(PVP_DATASET_DIR).
+Rows are identical to pgn_to_piecevals.py, except game_id is "{pgn file name}_g{game index in file}"
+(or "stdin_{hash of the exported game text}") so it stays unique across files and the same across restarts.
+
+Restarting is safe: games whose game_id is already in PVP_DATASET_DIR are skipped (for stdin this means
+replaying the same games skips them, and a game repeated within the input is only evaluated once).
+Games are only written once finished, so a killed worker loses at most its unflushed games,
+which are picked up again on the next start.
+
+Usage:
+    PVP_DATASET_DIR=... SF_PATH=... PGN_WATCH_DIR=... python -u pgn_stream_ingest.py
+"""
+
+# chess imports
+import chess.pgn
+from stockfish import Stockfish
+from pgn_to_piecevals import (
+    process_game, load_games_from_pgn,
+    STOCKFISH_DEPTH, STOCKFISH_TIMEOUT,
+)
+from worker_profiler import WorkerProfiler, forward_profile_requests
+from program_timer import start_timer
+
+# general imports
+import os
+import sys
+import time
+import glob
+import hashlib
+import queue
+import signal
+import threading
+import pandas as pd
+import pyarrow.dataset as ds
+from multiprocessing import cpu_count, Process, Queue
+
+PGN_WATCH_DIR = os.environ.get("PGN_WATCH_DIR", None) # Directory to watch for PGN files (None -> read stdin)
+PVP_DATASET_DIR = os.environ.get("PVP_DATASET_DIR", None) # Growing piece value parquet dataset (directory)
+SF_PATH = os.environ.get("SF_PATH", None) # the big fish
+NUM_WORKERS = int(os.environ.get("NUM_WORKERS", min(cpu_count(), 1))) # number of cores
+
+# Streaming config
+STREAM_FLUSH_SECS = float(os.environ.get("STREAM_FLUSH_SECS", 60)) # max seconds a finished game waits before being written
+STREAM_FLUSH_ROWS = int(os.environ.get("STREAM_FLUSH_ROWS", 50000)) # write early once this many rows are buffered
+WATCH_POLL_SECS = float(os.environ.get("WATCH_POLL_SECS", 10)) # how often PGN_WATCH_DIR is checked for new games
+STDIN_POLL_SECS = float(os.environ.get("STDIN_POLL_SECS", 1)) # how often reading stdin checks for a stop request
+QUEUE_PUT_TIMEOUT_SECS = float(os.environ.get("QUEUE_PUT_TIMEOUT_SECS", 30)) # how often a blocked put checks the workers are alive
+
+# Set by SIGINT/SIGTERM in the main process to shut down cleanly
+stop_requested = False
+
+
+# Write a worker's buffered rows as a new part file of the dataset
+def flush_piece_data(worker_id, piece_data, dataset_dir):
+    """Write rows to dataset_dir/part-w{worker_id}-{time}.parquet (atomically) and clear the buffer"""
+    if not piece_data:
+        return
+    part_file = os.path.join(dataset_dir, f"part-w{worker_id}-{time.time_ns()}.parquet")
+    # Files starting with '.' are ignored by parquet dataset readers until renamed
+    tmp_file = os.path.join(dataset_dir, "." + os.path.basename(part_file) + ".tmp")
+    df = pd.DataFrame(piece_data)
+    df.to_parquet(tmp_file, compression='lz4', index=False, engine='pyarrow')
+    os.replace(tmp_file, part_file)
+    print(f"Worker {worker_id}: Appended {len(df)} piece values to {part_file}")
+    piece_data.clear()
+
+# Worker function that processes games from the task queue until it receives None
+def stream_worker(worker_id, task_queue, dataset_dir, sf_path):
+    """
+    Each streaming worker:
+    1. Takes (game_id, game_pgn_string, eco_code) tasks from task_queue
+    2. Calculates piece values for every position of the game (same as pgn_to_piecevals.py)
+    3. Appends finished games to dataset_dir every STREAM_FLUSH_SECS seconds / STREAM_FLUSH_ROWS rows
+    """
+    # Main process decides when to stop (finish current game, flush, exit on None)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    print(f"Worker {worker_id}: Streaming with Stockfish depth={STOCKFISH_DEPTH}, timeout={STOCKFISH_TIMEOUT}s")
+
+    # Initialize Stockfish for this worker
+    stockfish = Stockfish(path=sf_path)
+    stockfish._set_option("Threads", 1)
+    stockfish.set_depth(depth_value=STOCKFISH_DEPTH)
+
+    piece_data = []
+    processed_games = 0
+    stats = {'positions': 0, 'pieces': 0, 'timeouts': 0}
+    last_flush = time.time()
+
+    worker_state = {'current_game_id': None, 'current_move': None, 'queued_games': None}
+    WorkerProfiler(worker_id, worker_state).install()
+
+    while True:
+        # Wake up at least once per flush interval so finished games never wait too long
+        try:
+            task = task_queue.get(timeout=STREAM_FLUSH_SECS)
+        except queue.Empty:
+            task = False
+
+        if task is None:
+            break
+
+        if task:
+            game_id, game_pgn_str, game_eco_code = task
+            print(f"Worker {worker_id}: Starting game {game_id}")
+            worker_state['current_game_id'] = game_id
+            rows_before_game = len(piece_data)
+            try:
+                if process_game(stockfish, game_id, game_pgn_str, game_eco_code,
+                                piece_data, stats, worker_state):
+                    processed_games += 1
+                    print(f"Worker {worker_id}: Finished game {game_id}, found {len(piece_data) - rows_before_game} pieces")
+            except Exception as e:
+                # Drop partial rows so the game is retried as a whole on the next start
+                del piece_data[rows_before_game:]
+                print(f"Worker {worker_id}: Error processing game {game_id}: {e}")
+            try:
+                worker_state['queued_games'] = task_queue.qsize()
+            except NotImplementedError:
+                pass # macOS
+            worker_state.update(processed_games=processed_games, rows_buffered=len(piece_data), **stats)
+
+        if len(piece_data) >= STREAM_FLUSH_ROWS or time.time() - last_flush >= STREAM_FLUSH_SECS:
+            flush_piece_data(worker_id, piece_data, dataset_dir)
+            last_flush = time.time()
+
+    flush_piece_data(worker_id, piece_data, dataset_dir)
+    print(f"Worker {worker_id}: Stats - {processed_games} games, {stats['positions']} positions, {stats['pieces']} pieces, {stats['timeouts']} timeouts")
+
+# Read game IDs already in the dataset (so restarts don't redo finished games)
+def load_existing_game_ids(dataset_dir):
+    """Return the set of game_ids in dataset_dir (empty set if the dataset has no files yet)"""
+    if not glob.glob(os.path.join(dataset_dir, "*.parquet")):
+        return set()
+    table = ds.dataset(dataset_dir, format="parquet").to_table(columns=['game_id'])
+    return set(table.column('game_id').unique().to_pylist())
+
+# Put a task on the (bounded) task queue without blocking forever if the workers died
+def put_task(task_queue, task, workers):
+    """Wait for room on task_queue, checking every QUEUE_PUT_TIMEOUT_SECS that a worker is still alive to take the task"""
+    while True:
+        try:
+            task_queue.put(task, timeout=QUEUE_PUT_TIMEOUT_SECS)
+            return
+        except queue.Full:
+            if not any(worker.is_alive() for worker in workers):
+                exit_codes = [worker.exitcode for worker in workers]
+                raise RuntimeError(f"All streaming workers exited (exit codes {exit_codes}), no one is taking games")
+
+# Queue new games from a PGN file, skipping the first num_already_queued games
+def queue_games_from_file(pgn_file, num_already_queued, task_queue, done_game_ids, workers):
+    """Put unseen games of pgn_file on task_queue, returns the total number of games in the file"""
+    source = os.path.splitext(os.path.basename(pgn_file))[0]
+    games = load_games_from_pgn(pgn_file_name=pgn_file)
+    queued = 0
+    for game_index, game_str, eco_code in games[num_already_queued:]:
+        game_id = f"{source}_g{game_index}"
+        if game_id in done_game_ids:
+            continue
+        put_task(task_queue, (game_id, game_str, eco_code), workers)
+        queued += 1
+    print(f"Queued {queued} new games from {pgn_file}")
+    return len(games)
+
+# Poll PGN_WATCH_DIR for new or grown PGN files until asked to stop
+def watch_directory(watch_dir, task_queue, done_game_ids, workers):
+    """Queue games from *.pgn files in watch_dir as they appear (files must stop changing before they are read)"""
+    games_queued_per_file = {} # path -> number of games already queued
+    file_signatures = {}       # path -> (size, mtime) at the last poll
+
+    print(f"Watching {watch_dir} for new games every {WATCH_POLL_SECS:.0f}s")
+    while not stop_requested:
+        for pgn_file in sorted(glob.glob(os.path.join(watch_dir, "*.pgn"))):
+            try:
+                stat = os.stat(pgn_file)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+
+            # Only read files that did not change since the last poll (i.e. are done being written)
+            previous_signature = file_signatures.get(pgn_file)
+            file_signatures[pgn_file] = signature
+            if previous_signature != signature:
+                continue
+            if games_queued_per_file.get(pgn_file, {}).get('signature') == signature:
+                continue
+
+            num_already_queued = games_queued_per_file.get(pgn_file, {}).get('games', 0)
+            num_games = queue_games_from_file(pgn_file, num_already_queued, task_queue, done_game_ids, workers)
+            games_queued_per_file[pgn_file] = {'games': num_games, 'signature': signature}
+
+        time.sleep(WATCH_POLL_SECS)
+
+# Parse games from stdin onto game_queue (runs on a daemon thread, None marks EOF)
+def parse_stdin_games(game_queue):
+    while True:
+        game = chess.pgn.read_game(sys.stdin)
+        game_queue.put(game)
+        if game is None:
+            return
+
+# Queue games from stdin as they are read until EOF or until asked to stop
+def read_stdin(task_queue, done_game_ids, workers):
+    """Queue every game read from stdin that is not done yet, returns when stdin is closed or a stop is requested"""
+    # read_game blocks until more input arrives, so it runs on its own thread and this loop
+    # can still notice a stop request (and let the workers flush) while upstream is quiet
+    game_queue = queue.Queue(maxsize=len(workers) * 4)
+    reader = threading.Thread(target=parse_stdin_games, args=(game_queue,), daemon=True)
+    reader.start()
+
+    game_index = 0
+    queued = 0
+    print("Reading games from stdin")
+    while not stop_requested:
+        try:
+            game = game_queue.get(timeout=STDIN_POLL_SECS)
+        except queue.Empty:
+            continue
+        if game is None:
+            break
+        exporter = chess.pgn.StringExporter(headers=True, variations=False, comments=False)
+        game_str = game.accept(exporter)
+        # Stable across restarts: the same game always gets the same game_id
+        game_id = f"stdin_{hashlib.blake2b(game_str.encode('utf-8'), digest_size=8).hexdigest()}"
+        if game_id not in done_game_ids:
+            put_task(task_queue, (game_id, game_str, game.headers.get("ECO", "")), workers)
+            done_game_ids.add(game_id)
+            queued += 1
+        game_index += 1
+    print(f"Finished reading {game_index} games from stdin ({queued} new)")
+
+# Signal handler for SIGINT/SIGTERM in the main process
+def request_stop(signum, frame):
+    global stop_requested
+    stop_requested = True
+
+def main():
+    # Validate env variables
+    print("Checking all env variables are valid")
+    if PVP_DATASET_DIR is None or SF_PATH is None:
+        print("Error: PVP_DATASET_DIR and SF_PATH must be set. Exiting immediately my liege!")
+        sys.exit(1)
+    if NUM_WORKERS < 1:
+        print(f"Error: NUM_WORKERS must be >= 1, got {NUM_WORKERS}")
+        sys.exit(1)
+
+    # CONFIG
+    print(f"=== Streaming Configuration ===")
+    print(f"Workers: {NUM_WORKERS}")
+    print(f"Stockfish depth: {STOCKFISH_DEPTH}")
+    print(f"Stockfish timeout: {STOCKFISH_TIMEOUT}s")
+    print(f"Input: {PGN_WATCH_DIR if PGN_WATCH_DIR else 'stdin'}")
+    print(f"Output dataset: {PVP_DATASET_DIR}")
+    print(f"Flush every: {STREAM_FLUSH_SECS:.0f}s or {STREAM_FLUSH_ROWS} rows")
+    print("=" * 20)
+
+    os.makedirs(PVP_DATASET_DIR, exist_ok=True)
+    done_game_ids = load_existing_game_ids(PVP_DATASET_DIR)
+    print(f"Found {len(done_game_ids)} games already in {PVP_DATASET_DIR}")
+
+    start_timer(thread_update_time_secs=60)
+
+    # Bounded queue so large PGN files are read only as fast as workers take games
+    task_queue = Queue(maxsize=NUM_WORKERS * 4)
+    workers = []
+    forward_profile_requests(workers)
+    for i in range(NUM_WORKERS):
+        p = Process(target=stream_worker, args=(i, task_queue, PVP_DATASET_DIR, SF_PATH))
+        p.start()
+        workers.append(p)
+    print(f"Started {NUM_WORKERS} streaming workers")
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    # Feed games until stdin closes or we are asked to stop
+    if PGN_WATCH_DIR:
+        watch_directory(PGN_WATCH_DIR, task_queue, done_game_ids, workers)
+    else:
+        read_stdin(task_queue, done_game_ids, workers)
+
+    # Workers finish their current game, flush and exit once they reach the sentinels
+    print("Stopping workers after queued games are finished...")
+    for _ in range(sum(worker.is_alive() for worker in workers)):
+        put_task(task_queue, None, workers)
+    for i, worker in enumerate(workers):
+        worker.join()
+        print(f"Worker {i} exited with code {worker.exitcode}")
+
+    print(f"Piece values are in {PVP_DATASET_DIR}")
+    sys.exit(0)
+
+# main (main)
+if __name__ == "__main__":
+    main()
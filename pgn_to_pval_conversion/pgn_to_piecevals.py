@@ -7,6 +7,7 @@ import chess
 import chess.pgn
 from stockfish import Stockfish
 from program_timer import start_timer
+from worker_profiler import WorkerProfiler, forward_profile_requests
 from eco_codes import ECO_CODES, eco_code_to_opening_name
 
 # general imports
@@ -180,6 +181,125 @@ def is_board_valid(board):
         return False
     return True
 
+# Function that calculates piece values for every position in a single game
+def process_game(stockfish, game_id, game_pgn_str, game_eco_code, piece_data_out, stats, worker_state=None):
+    """
+    Calculate piece values for all positions of one game (PGN string) and append one row per piece
+    to piece_data_out (see process_games_worker for the columns).
+    stats is a dict with 'positions', 'pieces' and 'timeouts' counters that is updated in place.
+    Returns False if the PGN string does not contain a game, True otherwise.
+    """
+    # Parse the PGN string into a game object
+    pgn_io = StringIO(game_pgn_str)
+    game = chess.pgn.read_game(pgn_io)
+
+    # Flee if there is no game
+    if game is None:
+        return False
+
+    # Get game's opening name from ECO code
+    opening = eco_code_to_opening_name(game_eco_code)
+
+    # Create board object to flick through game moves one by one
+    board = game.board()
+    move_no = 0
+
+    # For each unique game position (for each position after making a move)...
+    for move in game.mainline_moves():
+        board.push(move)
+        move_no += 1
+        if worker_state is not None:
+            worker_state['current_move'] = move_no
+
+        # Get current position as FEN
+        fen = board.fen()
+
+        # Get side to move ('w' or 'b')
+        side_to_move = 'w' if board.turn == chess.WHITE else 'b'
+
+        # Get material strings
+        white_material = get_material_string(board, chess.WHITE)
+        black_material = get_material_string(board, chess.BLACK)
+
+        # Get og position's SF evaluation (used in all pval calcs for each unique non-K piece)
+        og_eval = evaluate_with_timeout(stockfish, fen, timeout=STOCKFISH_TIMEOUT)
+
+        # Check if position is static/non-static
+        if og_eval is None:
+            # Timeout or mate position - skip this position entirely
+            stats['timeouts'] += 1
+            continue
+
+        stats['positions'] += 1
+        position_pieces = 0
+
+        # For each square in the current position...
+        for square in chess.SQUARES:
+            # Check if there is a piece at the current square being processed
+            piece = board.piece_at(square)
+            if not piece:
+                continue
+
+            # Skip kings
+            if piece.symbol().upper() == 'K':
+                continue
+
+            # If there is a piece at the current square of interest...
+            # Create position with piece of interest removed
+            board_rm = board.copy()
+            board_rm.remove_piece_at(square)
+
+            # Check and skip if removing piece causes an illegal position
+            if not is_board_valid(board_rm):
+                continue
+
+            # Get position with removed piece as FEN
+            fen_rm = board_rm.fen()
+
+            # Get new SF evaluation of position without piece of interest
+            rm_eval = evaluate_with_timeout(stockfish, fen_rm, timeout=STOCKFISH_TIMEOUT)
+
+            # Check if evaluating new position was successful
+            if rm_eval is None:
+                # Timeout or invalid position
+                stats['timeouts'] += 1
+                continue
+
+            # Calculate piece value
+            piece_value = og_eval - rm_eval
+
+            # Get rank and file (0-7)
+            rank = chess.square_rank(square)
+            file = chess.square_file(square)
+
+            # Create pval data entry (a row)
+            piece_data = {
+                'game_id': game_id,
+                'fen': fen,
+                'move_number': move_no,
+                'side_to_move': side_to_move,
+                'eco_code': game_eco_code,
+                'opening': opening,
+                'white_material': white_material,
+                'black_material': black_material,
+                'piece_type': piece.symbol(),
+                'rank': rank,
+                'file': file,
+                'original_eval': og_eval,
+                'eval_without_piece': rm_eval,
+                'piece_value': piece_value,
+            }
+
+            # Add new pval entry to aggregate pval data
+            piece_data_out.append(piece_data)
+            stats['pieces'] += 1
+            position_pieces += 1
+
+        # Print message after processing position
+        # print(f"Finished position (move {move_no}), evaluated {position_pieces} pieces")
+
+    return True
+
 # Worker function that processes a slice of games
 def process_games_worker(worker_id, games_slice, output_file, sf_path):
     """
@@ -215,139 +335,49 @@ def process_games_worker(worker_id, games_slice, output_file, sf_path):
     # Vars to store various stats that are useful
     all_piece_data = []
     processed_games = 0
-    total_positions = 0
-    total_pieces = 0
-    timeouts = 0
+    stats = {'positions': 0, 'pieces': 0, 'timeouts': 0}
+
+    # Snapshot of what this worker is doing, copied into on-demand profile dumps (see worker_profiler.py)
+    worker_state = {
+        'games_assigned': len(games_slice),
+        'games_remaining': len(games_slice),
+        'current_game_id': None,
+        'current_move': None,
+    }
+    WorkerProfiler(worker_id, worker_state).install()
 
     # For each game to be processed...
     for game_num, (original_game_index, game_pgn_str, game_eco_code) in enumerate(games_slice):
         # Set unique id based on what worker was assigned to it
         game_id = f"w{worker_id}_g{game_num}"
         print(f"Worker {worker_id}: Starting game {game_id} (original index {original_game_index})")
+        worker_state['current_game_id'] = game_id
+        worker_state['games_remaining'] = len(games_slice) - game_num
+        rows_before_game = len(all_piece_data)
 
         try:
-            # Parse the PGN string into a game object
-            pgn_io = StringIO(game_pgn_str)
-            game = chess.pgn.read_game(pgn_io)
-
-            # Flee if there is no game
-            if game is None:
+            # Calculate piece values for every position in the game
+            if not process_game(stockfish, game_id, game_pgn_str, game_eco_code,
+                                all_piece_data, stats, worker_state):
                 continue
 
-            # Get game's opening name from ECO code
-            opening = eco_code_to_opening_name(game_eco_code)
-
-            # Create board object to flick through game moves one by one
-            board = game.board()
-            move_no = 0
-
-            # For each unique game position (for each position after making a move)...
-            for move in game.mainline_moves():
-                board.push(move)
-                move_no += 1
-                
-                # Get current position as FEN
-                fen = board.fen()
-
-                # Get side to move ('w' or 'b')
-                side_to_move = 'w' if board.turn == chess.WHITE else 'b'
-
-                # Get material strings
-                white_material = get_material_string(board, chess.WHITE)
-                black_material = get_material_string(board, chess.BLACK)
-
-                # Get og position's SF evaluation (used in all pval calcs for each unique non-K piece)
-                og_eval = evaluate_with_timeout(stockfish, fen, timeout=STOCKFISH_TIMEOUT)
-
-                # Check if position is static/non-static
-                if og_eval is None:
-                    # Timeout or mate position - skip this position entirely
-                    timeouts += 1
-                    continue
-
-                total_positions += 1
-                position_pieces = 0
-
-                # For each square in the current position...
-                for square in chess.SQUARES:
-                    # Check if there is a piece at the current square being processed
-                    piece = board.piece_at(square)
-                    if not piece:
-                        continue
-
-                    # Skip kings
-                    if piece.symbol().upper() == 'K':
-                        continue
-                    
-                    # If there is a piece at the current square of interest...
-                    # Create position with piece of interest removed
-                    board_rm = board.copy()
-                    board_rm.remove_piece_at(square)
-
-                    # Check and skip if removing piece causes an illegal position
-                    if not is_board_valid(board_rm):
-                        continue
-                    
-                    # Get position with removed piece as FEN
-                    fen_rm = board_rm.fen()
-
-                    # Get new SF evaluation of position without piece of interest
-                    rm_eval = evaluate_with_timeout(stockfish, fen_rm, timeout=STOCKFISH_TIMEOUT)
-
-                    # Check if evaluating new position was successful
-                    if rm_eval is None:
-                        # Timeout or invalid position
-                        timeouts += 1
-                        continue
-
-                    # Calculate piece value
-                    piece_value = og_eval - rm_eval
-
-                    # Get rank and file (0-7)
-                    rank = chess.square_rank(square)
-                    file = chess.square_file(square)
-
-                    # Create pval data entry (a row)
-                    piece_data = {
-                        'game_id': game_id,
-                        'fen': fen,
-                        'move_number': move_no,
-                        'side_to_move': side_to_move,
-                        'eco_code': game_eco_code,
-                        'opening': opening,
-                        'white_material': white_material,
-                        'black_material': black_material,
-                        'piece_type': piece.symbol(),
-                        'rank': rank,
-                        'file': file,
-                        'original_eval': og_eval,
-                        'eval_without_piece': rm_eval,
-                        'piece_value': piece_value,
-                    }
-
-                    # Add new pval entry to aggregate pval data
-                    all_piece_data.append(piece_data)
-                    total_pieces += 1
-                    position_pieces += 1
-
-                # Print message after processing position
-                # print(f"Worker {worker_id}: Finished position (move {move_no}), evaluated {position_pieces} pieces")
-            
             # Print confirmation message for a worker after finishing each game with piece count
             processed_games += 1
-            print(f"Worker {worker_id}: Finished game {game_id}, found {len([d for d in all_piece_data if d['game_id'] == game_id])} pieces")
+            print(f"Worker {worker_id}: Finished game {game_id}, found {len(all_piece_data) - rows_before_game} pieces")
+
+            worker_state.update(processed_games=processed_games, rows_buffered=len(all_piece_data), **stats)
 
             # Print confirmation message for worker every X games processed
             if processed_games % 50 == 0:
-                print(f"Worker {worker_id}: Processed {processed_games}/{len(games_slice)} games, {total_positions} positions, {total_pieces} pieces, {timeouts} timeouts")
+                print(f"Worker {worker_id}: Processed {processed_games}/{len(games_slice)} games, {stats['positions']} positions, {stats['pieces']} pieces, {stats['timeouts']} timeouts")
 
         except Exception as e:
             print(f"Worker {worker_id}: Error processing game {game_id}: {e}")
             continue
-    
+
     # Print confirmation message after worker finishes processing all games with stats
     print(f"Worker {worker_id}: Finished processing all games. Writing to {output_file}")
-    print(f"Worker {worker_id}: Stats - {processed_games} games, {total_positions} positions, {total_pieces} pieces, {timeouts} timeouts")
+    print(f"Worker {worker_id}: Stats - {processed_games} games, {stats['positions']} positions, {stats['pieces']} pieces, {stats['timeouts']} timeouts")
 
     # Write results to worker's parquet file
     if all_piece_data:
@@ -429,6 +459,9 @@ def main():
         worker_output_files = []
         start_time = time.time()
 
+        # Pass on-demand profile requests (kill -USR1 <main pid>) to every worker
+        forward_profile_requests(workers)
+
         # Create temp worker output files
         for i in range(NUM_WORKERS):
             output_file = os.path.join(temp_dir, f"worker_{i}.parquet")
@@ -35,6 +35,12 @@ export SF_PATH="./THE_BIG_FISH" # Path to Stockfish
 
 export NUM_WORKERS="128" # Number of cores (1 core per worker)
 
+export PROFILE_DIR="./worker_profiles" # On-demand worker profiles (see worker_profiler.py)
+# Nothing is profiled unless you ask for it while the job is running:
+#   kill -USR1 <main python pid>             -> every worker dumps a profile
+#   touch ./worker_profiles/profile_worker_7 -> only worker 7 dumps a profile
+# Optional: PROFILE_SECONDS (default 30), PROFILE_MODE ("sample" or "cprofile")
+
 # ------------------------------
 # SCRIPT SETUP
 # ------------------------------
@@ -73,6 +79,10 @@ chmod +x ./stockfish_compiled
 # MAIN PVAL GENERATION SCRIPT
 # ------------------------------
 
+# Optional dry run: estimates Stockfish searches, core-hours, wall time, output size and peak memory
+# for NUM_WORKERS workers without running the full job (uncomment to check before using --time=10000)
+# python3 -u estimate_pgn_cost.py
+
 echo ""
 echo "=========================================="
 echo "STEP 1: PGNs -> PVal Parquet"
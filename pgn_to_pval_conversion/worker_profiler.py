@@ -0,0 +1,288 @@
+# Used to dump on-demand profiles of running pgn_to_piecevals.py workers
+# (to check where time goes when a multi-day job starts slowing down)
+#
+# Nothing is profiled until a dump is requested, so this costs nothing while unused
+# (unless PROFILE_HISTORY_SECONDS is set, see below).
+# Request a dump with either:
+# - a signal:       kill -USR1 <worker pid>   (one worker)
+#                   kill -USR1 <main pid>     (forwarded to every worker)
+# - a control file: touch $PROFILE_DIR/profile_worker_<id>   (one worker)
+#                   touch $PROFILE_DIR/profile_all           (every worker)
+#   (control files are only polled when PROFILE_DIR is set explicitly)
+#
+# By default each dump covers the next PROFILE_SECONDS seconds of the worker AFTER the request,
+# not the time leading up to it. To capture the last N seconds before a request instead, set
+# PROFILE_HISTORY_SECONDS=N (sample mode only): every worker then samples its stack all the time
+# into a rolling N second buffer (a small constant overhead), and a request dumps that buffer at once.
+# Dumps are written to $PROFILE_DIR/worker_<id>_profile_<timestamp>_<n>.txt while the worker keeps running.
+
+# imports
+import os
+import sys
+import time
+import signal
+import threading
+import traceback
+import cProfile
+import pstats
+from io import StringIO
+from collections import Counter, deque
+
+PROFILE_DIR = os.environ.get("PROFILE_DIR", None) # Where profile dumps and control files live
+PROFILE_SECONDS = float(os.environ.get("PROFILE_SECONDS", 30)) # How long each dump profiles for (after the request)
+PROFILE_HISTORY_SECONDS = float(os.environ.get("PROFILE_HISTORY_SECONDS", 0)) # >0: dump the last N seconds before the request instead (always-on sampling)
+PROFILE_MODE = os.environ.get("PROFILE_MODE", "sample") # 'sample' (stack sampling) or 'cprofile'
+PROFILE_SAMPLE_INTERVAL = float(os.environ.get("PROFILE_SAMPLE_INTERVAL", 0.01)) # seconds between stack samples
+PROFILE_CONTROL_POLL_SECS = float(os.environ.get("PROFILE_CONTROL_POLL_SECS", 10)) # control file polling period
+
+DEFAULT_PROFILE_DIR = "worker_profiles"
+
+# Signal used to request dumps (not available on Windows, control files still work there)
+PROFILE_SIGNAL = getattr(signal, "SIGUSR1", None)
+
+
+# Helper function to format a frame stack as a single folded line (root first, flamegraph-compatible)
+def _fold_stack(frame):
+    """Fold a frame and its callers into 'file:func:line;...' (outermost call first)"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+
+class WorkerProfiler:
+    """
+    Per-worker profiler that sits idle until a dump is requested by signal or control file.
+
+    worker_state is a dict the worker keeps up to date (current game, counters, games left)
+    and is copied into every dump so the profile can be matched to what the worker was doing.
+    """
+    def __init__(self, worker_id, worker_state, output_dir=None, duration=PROFILE_SECONDS,
+                 mode=PROFILE_MODE, sample_interval=PROFILE_SAMPLE_INTERVAL, history_seconds=PROFILE_HISTORY_SECONDS):
+        self.worker_id = worker_id
+        self.worker_state = worker_state
+        self.output_dir = output_dir or PROFILE_DIR or DEFAULT_PROFILE_DIR
+        self.duration = duration
+        self.mode = mode
+        self.sample_interval = sample_interval
+        self.history_seconds = history_seconds
+        self.pid = os.getpid()
+        self.main_thread_id = threading.main_thread().ident
+        self._busy = threading.Lock()
+        self._cprofile = None
+        self._start_stacks = None
+        self._start_time = None
+        self._num_dumps = 0
+        self._history = None # rolling buffer of (time, folded stack, leaf) samples, only with history_seconds > 0
+        self._history_lock = threading.Lock()
+
+    # Register the signal handler and (if PROFILE_DIR is set) the control file watcher
+    def install(self):
+        if PROFILE_SIGNAL is not None:
+            signal.signal(PROFILE_SIGNAL, self._on_signal)
+        if self.mode == "cprofile" and (PROFILE_SIGNAL is None or not hasattr(signal, "setitimer")):
+            print(f"Worker {self.worker_id}: cProfile dumps need POSIX signals, falling back to stack sampling")
+            self.mode = "sample"
+        if self.history_seconds > 0:
+            if self.mode != "sample":
+                print(f"Worker {self.worker_id}: PROFILE_HISTORY_SECONDS needs stack sampling, using sample mode")
+                self.mode = "sample"
+            self._history = deque()
+            recorder = threading.Thread(target=self._record_history, daemon=True)
+            recorder.start()
+        if PROFILE_DIR is not None and PROFILE_CONTROL_POLL_SECS > 0:
+            watcher = threading.Thread(target=self._watch_control_files, daemon=True)
+            watcher.start()
+        return self
+
+    # Signal handler (always runs in the worker's main thread)
+    # No printing in here, the main thread may be halfway through a print of its own
+    def _on_signal(self, signum, frame):
+        # Child processes forked for Stockfish evals inherit this handler, ignore it there
+        if os.getpid() != self.pid:
+            return
+        # Only one dump at a time, extra requests are dropped
+        if not self._busy.acquire(blocking=False):
+            return
+
+        self._start_time = time.time()
+        self._start_stacks = self._format_thread_stacks()
+
+        if self.mode == "cprofile":
+            # cProfile only sees the thread that enables it, so enable it here and stop it from SIGALRM
+            self._cprofile = cProfile.Profile()
+            signal.signal(signal.SIGALRM, self._on_cprofile_done)
+            self._cprofile.enable()
+            signal.setitimer(signal.ITIMER_REAL, self.duration)
+        else:
+            sampler = threading.Thread(target=self._sample_main_thread, daemon=True)
+            sampler.start()
+
+    # SIGALRM handler that ends a cProfile dump
+    def _on_cprofile_done(self, signum, frame):
+        self._cprofile.disable()
+        stats_stream = StringIO()
+        stats = pstats.Stats(self._cprofile, stream=stats_stream)
+        stats.sort_stats("cumulative").print_stats(60)
+        stats.sort_stats("tottime").print_stats(30)
+        self._cprofile = None
+        # Write from a separate thread so the worker's main thread goes straight back to work
+        writer = threading.Thread(target=self._finish_dump, args=(stats_stream.getvalue(),), daemon=True)
+        writer.start()
+
+    # One (folded stack, leaf function) sample of the main thread, or None if it has no frame
+    def _take_sample(self):
+        frame = sys._current_frames().get(self.main_thread_id)
+        if frame is None:
+            return None
+        code = frame.f_code
+        return _fold_stack(frame), f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+    # Keep the last history_seconds of main thread samples (runs for the worker's lifetime)
+    def _record_history(self):
+        while True:
+            sample = self._take_sample()
+            now = time.time()
+            with self._history_lock:
+                if sample is not None:
+                    self._history.append((now, *sample))
+                while self._history and self._history[0][0] < now - self.history_seconds:
+                    self._history.popleft()
+            time.sleep(self.sample_interval)
+
+    # Sample the main thread's stack every sample_interval seconds for duration seconds,
+    # or take the last history_seconds of samples from the rolling buffer
+    def _sample_main_thread(self):
+        folded_counts = Counter()
+        leaf_counts = Counter()
+        num_samples = 0
+
+        if self._history is not None:
+            print(f"Worker {self.worker_id}: Dumping the last {self.history_seconds:.0f}s (sample)")
+            with self._history_lock:
+                samples = [sample[1:] for sample in self._history]
+        else:
+            print(f"Worker {self.worker_id}: Profiling for {self.duration:.0f}s (sample)")
+            samples = []
+            end_time = time.time() + self.duration
+            while time.time() < end_time:
+                sample = self._take_sample()
+                if sample is not None:
+                    samples.append(sample)
+                time.sleep(self.sample_interval)
+
+        for folded, leaf in samples:
+            folded_counts[folded] += 1
+            leaf_counts[leaf] += 1
+            num_samples += 1
+
+        lines = [f"Samples: {num_samples} (every {self.sample_interval}s)", "", "Hottest functions (leaf samples):"]
+        for name, count in leaf_counts.most_common(30):
+            lines.append(f"  {count / max(num_samples, 1):7.2%}  {name}")
+        lines.extend(["", "Folded stacks (flamegraph.pl compatible):"])
+        for stack, count in folded_counts.most_common():
+            lines.append(f"{stack} {count}")
+        self._finish_dump("\n".join(lines))
+
+    # Write the dump file (atomically) and release the profiler for the next request
+    def _finish_dump(self, profile_text):
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self._start_time))
+            self._num_dumps += 1
+            dump_file = os.path.join(self.output_dir, f"worker_{self.worker_id}_profile_{stamp}_{self._num_dumps}.txt")
+
+            report = [
+                f"Worker {self.worker_id} (pid {self.pid}) profile",
+                f"Mode: {self.mode}",
+                f"Requested: {time.ctime(self._start_time)}",
+                f"Window: {self._window_description()}",
+                "",
+                "=== Worker state ===",
+            ]
+            report.extend(f"{key}: {value}" for key, value in dict(self.worker_state).items())
+            report.extend(["", "=== Thread stacks at request ===", self._start_stacks])
+            report.extend(["=== Thread stacks at dump ===", self._format_thread_stacks()])
+            report.extend([f"=== Profile ({self.mode}) ===", profile_text, ""])
+
+            tmp_file = dump_file + ".tmp"
+            with open(tmp_file, "w") as f:
+                f.write("\n".join(report))
+            os.replace(tmp_file, dump_file)
+            print(f"Worker {self.worker_id}: Wrote profile to {dump_file}")
+        except Exception as e:
+            print(f"Worker {self.worker_id}: Error writing profile: {e}")
+        finally:
+            self._busy.release()
+
+    # Which stretch of time the profile covers, relative to the request
+    def _window_description(self):
+        if self._history is not None:
+            return f"last {self.history_seconds:.1f}s before the request"
+        return f"{time.time() - self._start_time:.1f}s after the request"
+
+    # Current stack of every thread in this process
+    def _format_thread_stacks(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        out = []
+        for thread_id, frame in sys._current_frames().items():
+            out.append(f"--- Thread {names.get(thread_id, thread_id)} ---")
+            out.append("".join(traceback.format_stack(frame)))
+        return "\n".join(out)
+
+    # Poll PROFILE_DIR for control files requesting a dump
+    def _watch_control_files(self):
+        own_file = os.path.join(self.output_dir, f"profile_worker_{self.worker_id}")
+        all_file = os.path.join(self.output_dir, "profile_all")
+        seen_all_mtime = os.path.getmtime(all_file) if os.path.exists(all_file) else None
+
+        while True:
+            time.sleep(PROFILE_CONTROL_POLL_SECS)
+            requested = False
+
+            # Per-worker control file is consumed by the worker that owns it
+            if os.path.exists(own_file):
+                try:
+                    os.remove(own_file)
+                except OSError:
+                    pass
+                requested = True
+
+            # profile_all is shared, so each worker reacts once per touch (mtime change)
+            if os.path.exists(all_file):
+                all_mtime = os.path.getmtime(all_file)
+                if all_mtime != seen_all_mtime:
+                    seen_all_mtime = all_mtime
+                    requested = True
+
+            if requested:
+                if PROFILE_SIGNAL is not None:
+                    # Route through the signal handler so cProfile runs in the main thread
+                    os.kill(self.pid, PROFILE_SIGNAL)
+                elif self._busy.acquire(blocking=False):
+                    self._start_time = time.time()
+                    self._start_stacks = self._format_thread_stacks()
+                    self._sample_main_thread()
+
+
+# Function for the main process to pass profile requests on to all worker processes
+def forward_profile_requests(processes):
+    """Install a handler in the main process that forwards PROFILE_SIGNAL to every live worker"""
+    if PROFILE_SIGNAL is None:
+        return
+    main_pid = os.getpid()
+
+    def _forward(signum, frame):
+        # Workers inherit this handler until they install their own profiler
+        if os.getpid() != main_pid:
+            return
+        for p in processes:
+            if p.pid is not None and p.is_alive():
+                try:
+                    os.kill(p.pid, signum)
+                except OSError:
+                    pass
+
+    signal.signal(PROFILE_SIGNAL, _forward)
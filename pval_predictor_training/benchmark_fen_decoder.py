@@ -0,0 +1,85 @@
+"""
+This file benchmark_fen_decoder.py compares the per-FEN decoder fen_to_board_tensor (chess.Board)
+against the batched numpy decoder fens_to_board_tensors from train_all_models.py.
+
+It checks that both produce bit-identical (N, 12, 8, 8) board tensors for every unique FEN in
+BENCHMARK_PARQUET and reports positions decoded per second for each.
+
+Usage:
+    python benchmark_fen_decoder.py [pval_parquet_file]
+"""
+
+# imports
+import sys
+import time
+import numpy as np
+import pandas as pd
+from train_all_models import fen_to_board_tensor, fens_to_board_tensors
+
+# ==============
+# CONFIG
+# ==============
+
+BENCHMARK_PARQUET = "../sample_run/sample_games_piecevals.parquet" # Any pval parquet with a 'fen' column
+MAX_FENS = 200000 # Unique FENs used for the benchmark
+BATCH_SIZE = 128 # Batch size embedding generation used to decode FENs with (now unpacked from the bitboard cache)
+REPEATS = 3 # Best of REPEATS runs is reported
+
+# ==============
+# MAIN
+# ==============
+
+def best_time(fn, repeats=REPEATS):
+    """Best wall time of fn() over repeats runs, and its last result"""
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parquet_file = sys.argv[1] if len(sys.argv) > 1 else BENCHMARK_PARQUET
+    fens = pd.read_parquet(parquet_file, columns=['fen'])['fen'].unique().tolist()[:MAX_FENS]
+
+    print("="*80)
+    print("FEN DECODER BENCHMARK")
+    print("="*80)
+    print(f"Input file: {parquet_file}")
+    print(f"Unique FENs: {len(fens):,}")
+    print(f"Batch size: {BATCH_SIZE}")
+    print("="*80)
+
+    # Per-FEN decoder (python-chess)
+    single_time, single_tensors = best_time(lambda: np.stack([fen_to_board_tensor(fen) for fen in fens]))
+
+    # Batched decoder, whole list at once and in embedding-generation sized batches
+    batched_time, batched_tensors = best_time(lambda: fens_to_board_tensors(fens))
+    small_batch_time, small_batch_tensors = best_time(lambda: np.concatenate([
+        fens_to_board_tensors(fens[i:i + BATCH_SIZE]) for i in range(0, len(fens), BATCH_SIZE)
+    ]))
+
+    identical = (
+        single_tensors.dtype == batched_tensors.dtype
+        and np.array_equal(single_tensors, batched_tensors)
+        and np.array_equal(single_tensors, small_batch_tensors)
+    )
+
+    print(f"\n{'Decoder':<36} {'Seconds':<10} {'FENs/sec':<14} {'Speedup':<8}")
+    print("-"*80)
+    for name, elapsed in (
+        ("fen_to_board_tensor (per FEN)", single_time),
+        ("fens_to_board_tensors (all)", batched_time),
+        (f"fens_to_board_tensors (batch {BATCH_SIZE})", small_batch_time),
+    ):
+        print(f"{name:<36} {elapsed:<10.4f} {len(fens) / elapsed:<14,.0f} {single_time / elapsed:<8.1f}x")
+    print("-"*80)
+    print(f"Bit-identical output: {identical}")
+    print("="*80)
+
+    return 0 if identical else 1
+
+# main(main)
+if __name__ == "__main__":
+
+    exit(main())
@@ -0,0 +1,133 @@
+"""
+This file benchmark_perf_mode.py trains every model type of train_all_models.py (CNN position autoencoder,
+MLP #1 and a CNN piece value head on a frozen encoder) for BENCHMARK_EPOCHS epochs, once in eager fp32
+and once with PERF_MODE (bf16 autocast, channels_last, torch.compile, tuned thread count).
+
+It reports training throughput next to final accuracy for both runs (val MAE in cp for the piece value
+models, best val BCE for the autoencoder), so the speedup of PERF_MODE can be checked against any
+loss of accuracy. Evaluation always runs in fp32. PERF_MODE times include torch.compile warm-up
+in the first epoch, so use more epochs to see the steady state speedup.
+
+Usage:
+    python benchmark_perf_mode.py [train_parquet val_parquet]
+"""
+
+# imports
+import sys
+import torch
+import train_all_models as tam
+
+# ==============
+# CONFIG
+# ==============
+
+BENCHMARK_EPOCHS = 3 # Epochs trained per model (early stopping disabled)
+BENCHMARK_MAX_ROWS = 200000 # Rows of each of train/val used
+BENCHMARK_EMBEDDING_DIM = 512
+BENCHMARK_NUM_LAYERS = 4
+BENCHMARK_PVAL_HIDDEN_LAYERS = 3 # Key of CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS
+BENCHMARK_OUTPUT_DIR = "benchmark_perf_output"
+
+# ==============
+# MAIN
+# ==============
+
+def fixed_epochs(config):
+    return dict(config, max_epochs=BENCHMARK_EPOCHS, patience=BENCHMARK_EPOCHS + 1)
+
+def run_models(perf_mode, train_df, val_df, norm_params, unique_fens, all_unique_fens):
+    """Train and evaluate every model type, returns {model: (samples/sec, seconds, val metric)}"""
+    tam.PERF_MODE = perf_mode
+    mode = "perf" if perf_mode else "fp32"
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    results = {}
+
+    torch.manual_seed(0)
+    encoder, metadata = tam.train_cnn_position_encoder(
+        unique_fens, fixed_epochs(tam.CNN_POSITION_CONFIG), BENCHMARK_OUTPUT_DIR,
+        embedding_dim=BENCHMARK_EMBEDDING_DIM, num_layers=BENCHMARK_NUM_LAYERS,
+        model_name=f"{mode}_cnn_pos", bitboards=tam.load_bitboard_cache(unique_fens)
+    )
+    results['CNN autoencoder'] = (
+        metadata['epochs_trained'] * metadata['training_positions'] / metadata['training_time_seconds'],
+        metadata['training_time_seconds'],
+        f"{metadata['best_val_loss']:.6f} BCE"
+    )
+
+    torch.manual_seed(0)
+    model, metadata = tam.train_mlp_model(
+        train_df, val_df, fixed_epochs(tam.MLP_CONFIG), include_quadratic=False,
+        model_name=f"{mode}_mlp1", norm_params=norm_params, output_dir=BENCHMARK_OUTPUT_DIR
+    )
+    val_mae = tam.evaluate_mlp_model(model, val_df, include_quadratic=False, norm_params=norm_params, device=device)
+    results['MLP #1'] = (
+        metadata['epochs_trained'] * len(train_df) / metadata['training_time_seconds'],
+        metadata['training_time_seconds'],
+        f"{val_mae:.2f} cp"
+    )
+
+    torch.manual_seed(0)
+    all_fen_bitboards = tam.load_bitboard_cache(all_unique_fens)
+    model, metadata = tam.train_cnn_pieceval_model(
+        train_df, val_df, fixed_epochs(tam.CNN_PIECEVAL_CONFIG), norm_params, BENCHMARK_OUTPUT_DIR,
+        embedding_dim=BENCHMARK_EMBEDDING_DIM,
+        hidden_sizes=tam.CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS[BENCHMARK_PVAL_HIDDEN_LAYERS],
+        dropout_rates=tam.CNN_PIECEVAL_DROPOUT_RATES[BENCHMARK_PVAL_HIDDEN_LAYERS],
+        model_name=f"{mode}_cnn_pval", encoder_mode='frozen', encoder=encoder,
+        bitboards=all_fen_bitboards, position_fens=all_unique_fens
+    )
+    val_mae = tam.evaluate_cnn_pieceval_model(model, val_df, norm_params, device, encoder=encoder,
+                                              bitboards=all_fen_bitboards, position_fens=all_unique_fens)
+    results['CNN pval head (frozen encoder)'] = (
+        metadata['epochs_trained'] * len(train_df) / metadata['training_time_seconds'],
+        metadata['training_time_seconds'],
+        f"{val_mae:.2f} cp"
+    )
+
+    return results
+
+def main():
+    if len(sys.argv) > 2:
+        tam.TRAINING_PARQUET, tam.VALIDATION_PARQUET = sys.argv[1], sys.argv[2]
+    tam.TRAINING_DATA_MODE = 'memory'
+    tam.FOLD_DATASET_DIR = None
+    tam.CHECKPOINT_EVERY_EPOCHS = 0 # only time training
+    tam.RESUME_TRAINING = False
+
+    # Standardized train/val data (trimmed to BENCHMARK_MAX_ROWS rows each)
+    data = tam.load_training_data()
+    train_df = data['train_df'].head(BENCHMARK_MAX_ROWS).reset_index(drop=True)
+    val_df = data['val_df'].head(BENCHMARK_MAX_ROWS).reset_index(drop=True)
+    unique_fens = train_df['fen'].unique().tolist()
+    all_unique_fens = list(dict.fromkeys(unique_fens + val_df['fen'].unique().tolist()))
+
+    default_threads = torch.get_num_threads()
+    fp32_results = run_models(False, train_df, val_df, data['norm_params'], unique_fens, all_unique_fens)
+    torch.set_num_threads(tam.perf_num_threads())
+    perf_results = run_models(True, train_df, val_df, data['norm_params'], unique_fens, all_unique_fens)
+    perf_threads = torch.get_num_threads()
+    torch.set_num_threads(default_threads)
+
+    print("="*80)
+    print("PERF_MODE BENCHMARK")
+    print("="*80)
+    print(f"Train/val rows: {len(train_df):,}/{len(val_df):,}, epochs per model: {BENCHMARK_EPOCHS}")
+    print(f"fp32: {default_threads} threads")
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    autocast_dtype = tam.PERF_AUTOCAST_DTYPE if tam.perf_autocast_supported(device) else None
+    print(f"perf: {perf_threads} threads, autocast {autocast_dtype}, "
+          f"channels_last {tam.PERF_CHANNELS_LAST}, torch.compile {tam.PERF_COMPILE}")
+    print(f"\n{'Model':<32} {'Mode':<6} {'Seconds':>9} {'Samples/sec':>13} {'Speedup':>8} {'Val metric':>16}")
+    print("-"*90)
+    for model_name, (fp32_rate, fp32_seconds, fp32_metric) in fp32_results.items():
+        perf_rate, perf_seconds, perf_metric = perf_results[model_name]
+        print(f"{model_name:<32} {'fp32':<6} {fp32_seconds:>9.1f} {fp32_rate:>13,.0f} {'1.0x':>8} {fp32_metric:>16}")
+        print(f"{'':<32} {'perf':<6} {perf_seconds:>9.1f} {perf_rate:>13,.0f} {perf_rate / fp32_rate:>7.1f}x {perf_metric:>16}")
+    print("="*80)
+
+    return 0
+
+# main(main)
+if __name__ == "__main__":
+
+    exit(main())
@@ -0,0 +1,165 @@
+"""
+This file embedding_store.py stores CNN position embeddings for train_all_models.py.
+
+An embedding store is a directory with:
+- embeddings.bin: one (num_positions, embedding_dim) float32 or float16 matrix (read as a numpy memmap)
+- fens.txt: the FEN of every row, one per line
+- meta.json: shape, dtype and info about the encoder (written last, so a store without it is incomplete)
+
+Piece value rows only keep an int32 row index into the store (see EmbeddingStore.rows_for),
+instead of a copy of their position's embedding, and embedding rows are gathered one batch at a time.
+Opening a store is instant since nothing is read until rows are used. FENs are looked up by their
+64-bit hash (FenIndex), so fens.txt is only read in chunks to build the index and no FEN strings stay in memory.
+
+Stores can grow: append() adds rows for new FENs at the end (existing rows never move), and the
+new row count only counts once meta.json is rewritten by finalize().
+
+This replaces the old embed_*_lookup.pkl files ({fen: np.ndarray} pickles).
+"""
+
+# imports
+import os
+import json
+import shutil
+import numpy as np
+import pandas as pd
+from pathlib import Path
+from pval_train_val_split import hash_strings
+from streaming_dataset import FenIndex, fen_chunks, fen_list_hashes, read_fen_chunks
+
+EMBEDDINGS_FILE = "embeddings.bin"
+FENS_FILE = "fens.txt"
+META_FILE = "meta.json"
+
+
+class EmbeddingStore:
+    """Memmapped matrix of unique position embeddings with a FEN -> row index"""
+    def __init__(self, store_dir, meta, mode='r'):
+        self.store_dir = Path(store_dir)
+        self.meta = meta
+        self.num_positions = meta['num_positions']
+        self.embedding_dim = meta['embedding_dim']
+        self.dtype = np.dtype(meta['dtype'])
+        self.embeddings = np.memmap(
+            self.store_dir / EMBEDDINGS_FILE, dtype=self.dtype, mode=mode,
+            shape=(self.num_positions, self.embedding_dim)
+        )
+        self._fen_index = None
+
+    # Check if a complete store exists in store_dir
+    @staticmethod
+    def exists(store_dir):
+        return (Path(store_dir) / META_FILE).exists()
+
+    # Open an existing store (read-only)
+    @classmethod
+    def open(cls, store_dir):
+        with open(Path(store_dir) / META_FILE) as f:
+            meta = json.load(f)
+        return cls(store_dir, meta, mode='r')
+
+    # Create a new (empty) store for fens (a list or UniqueFenList), fill it with write() and call finalize() when done
+    @classmethod
+    def create(cls, store_dir, fens, embedding_dim, dtype='float32', info=None):
+        store_path = Path(store_dir)
+        if store_path.exists():
+            shutil.rmtree(store_path)
+        store_path.mkdir(parents=True)
+
+        with open(store_path / FENS_FILE, 'w') as f:
+            for chunk in fen_chunks(fens):
+                f.write('\n'.join(chunk))
+                f.write('\n')
+
+        meta = {
+            'num_positions': len(fens),
+            'embedding_dim': int(embedding_dim),
+            'dtype': np.dtype(dtype).name,
+            'info': info or {},
+        }
+        store = cls(store_dir, meta, mode='w+')
+        store._fen_index = FenIndex(fen_list_hashes(fens))
+        return store
+
+    # Add rows for new fens at the end of the store, fill them with write() and call finalize() when done
+    def append(self, fens):
+        """Returns the first new row (rows [start, start + len(fens)) belong to fens)"""
+        start = self.num_positions
+        fen_index = FenIndex(np.concatenate([self.fen_index.hashes, fen_list_hashes(fens)]))
+
+        # Lines after the first num_positions are ignored until meta.json counts them
+        tmp_file = self.store_dir / (FENS_FILE + ".tmp")
+        with open(tmp_file, 'w') as f:
+            for chunk in read_fen_chunks(self.store_dir / FENS_FILE, start):
+                f.write('\n'.join(chunk))
+                f.write('\n')
+            f.write('\n'.join(fens))
+            f.write('\n')
+        os.replace(tmp_file, self.store_dir / FENS_FILE)
+
+        self.num_positions = len(fen_index)
+        self.meta['num_positions'] = self.num_positions
+        self._fen_index = fen_index
+        with open(self.store_dir / EMBEDDINGS_FILE, 'r+b') as f:
+            f.truncate(self.nbytes())
+        self.embeddings = np.memmap(
+            self.store_dir / EMBEDDINGS_FILE, dtype=self.dtype, mode='r+',
+            shape=(self.num_positions, self.embedding_dim)
+        )
+        return start
+
+    # Write embeddings for rows [start, start + len(embeddings))
+    def write(self, start, embeddings):
+        self.embeddings[start:start + len(embeddings)] = embeddings
+
+    # Flush the matrix and write meta.json (marks the store as complete)
+    def finalize(self):
+        self.embeddings.flush()
+        tmp_file = self.store_dir / (META_FILE + ".tmp")
+        with open(tmp_file, 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        os.replace(tmp_file, self.store_dir / META_FILE)
+        # Reopen read-only
+        self.embeddings = np.memmap(
+            self.store_dir / EMBEDDINGS_FILE, dtype=self.dtype, mode='r',
+            shape=(self.num_positions, self.embedding_dim)
+        )
+        return self
+
+    @property
+    def fen_index(self):
+        """FenIndex of the FEN of every row (built from fens.txt on first use)"""
+        if self._fen_index is None:
+            hashes = [hash_strings(chunk) for chunk in read_fen_chunks(self.store_dir / FENS_FILE, self.num_positions)]
+            self._fen_index = FenIndex(np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64))
+        return self._fen_index
+
+    @property
+    def fens(self):
+        return [fen for chunk in read_fen_chunks(self.store_dir / FENS_FILE, self.num_positions) for fen in chunk]
+
+    def rows_for(self, fens):
+        """int32 row of every FEN in fens (raises KeyError if any FEN is not in the store)"""
+        rows = self.fen_index.get_indexer(fens)
+        if (rows < 0).any():
+            missing = pd.Index(fens)[rows < 0].unique()
+            raise KeyError(f"{len(missing):,} FENs not in embedding store {self.store_dir}, e.g. {missing[0]}")
+        return rows.astype(np.int32)
+
+    def missing(self, fens):
+        """FENs of fens (a list or UniqueFenList) that are not in the store (in order)"""
+        missing = []
+        for chunk in fen_chunks(fens):
+            chunk = pd.Index(chunk)
+            missing.extend(chunk[self.fen_index.get_indexer(chunk) < 0])
+        return missing
+
+    def __len__(self):
+        return self.num_positions
+
+    # Pickle (e.g. for DataLoader workers) by reopening the store instead of copying the whole matrix
+    def __reduce__(self):
+        return (EmbeddingStore.open, (str(self.store_dir),))
+
+    def nbytes(self):
+        return self.num_positions * self.embedding_dim * self.dtype.itemsize
@@ -0,0 +1,84 @@
+"""
+This file generate_embeddings.py is the embedding generation stage of train_all_models.py as a standalone script.
+
+For every CNN position encoder of CNN_EMBEDDING_DIMS x CNN_LAYER_DEPTHS with a checkpoint in OUTPUT_DIR it brings
+the encoder's embedding store up to date with the unique train/val FENs of the dataset (only the 'fen' column is read):
+- store written by the same encoder weights (hash of its state_dict in meta.json): only FENs missing from it are
+  encoded and appended
+- no store yet, or a stale store (other encoder weights or EMBEDDING_STORE_DTYPE): rebuilt from scratch
+
+Running it again without new positions or new encoder weights does nothing, so after adding games only this stage
+(not train_all_models.main()) has to run before training piece value heads on the new positions.
+
+Usage:
+    python generate_embeddings.py [train_parquet val_parquet]
+"""
+
+# imports
+import sys
+import pyarrow.parquet as pq
+import torch
+from pathlib import Path
+import train_all_models as tam
+from streaming_dataset import ParquetPieceValueSource, UniqueFenListWriter, SCAN_BATCH_ROWS
+
+# ==============
+# MAIN
+# ==============
+
+def dataset_fens():
+    """
+    Unique FENs of the training and then the validation split (same order as all_unique_fens of train_all_models),
+    as a UniqueFenList in UNIQUE_FENS_DIR (only their hashes are kept in memory)
+    """
+    if tam.FOLD_DATASET_DIR is not None:
+        sources = [
+            ParquetPieceValueSource.from_folds(tam.FOLD_DATASET_DIR, tam.training_folds(tam.FOLD_DATASET_DIR, tam.VAL_FOLDS)),
+            ParquetPieceValueSource.from_folds(tam.FOLD_DATASET_DIR, tam.VAL_FOLDS),
+        ]
+    else:
+        sources = [ParquetPieceValueSource([tam.TRAINING_PARQUET]), ParquetPieceValueSource([tam.VALIDATION_PARQUET])]
+
+    fens_writer = UniqueFenListWriter(tam.unique_fens_path(*sources))
+    for source in sources:
+        for f in source.files:
+            for batch in pq.ParquetFile(f).iter_batches(batch_size=SCAN_BATCH_ROWS, columns=['fen']):
+                fens_writer.add(batch.column(0).to_numpy(zero_copy_only=False))
+    return fens_writer.close()
+
+def main():
+    if len(sys.argv) > 2:
+        tam.TRAINING_PARQUET, tam.VALIDATION_PARQUET = sys.argv[1], sys.argv[2]
+    output_dir = Path(tam.OUTPUT_DIR)
+
+    print("="*80)
+    print("EMBEDDING GENERATION")
+    print("="*80)
+    fens = dataset_fens()
+    print(f"Unique train/val positions: {len(fens):,}")
+
+    # Every trained encoder with its store
+    encoders = {}
+    for embedding_dim in tam.CNN_EMBEDDING_DIMS:
+        for num_layers in tam.CNN_LAYER_DEPTHS:
+            encoder_model_name = f"cnn_pos_{embedding_dim}d_{num_layers}layer"
+            encoder_checkpoint_path = output_dir / f"{encoder_model_name}_encoder.pth"
+            if not encoder_checkpoint_path.exists():
+                print(f"Skipping {encoder_model_name}: no checkpoint at {encoder_checkpoint_path}")
+                continue
+            encoder = tam.ChessCNNEncoder(embedding_dim=embedding_dim, num_layers=num_layers)
+            encoder.load_state_dict(torch.load(encoder_checkpoint_path))
+            encoders[str(output_dir / f"embed_{embedding_dim}d_{num_layers}layer_store")] = (encoder_model_name, encoder)
+    print("="*80)
+
+    if not encoders:
+        print("No trained encoders found, nothing to do")
+        return 1
+
+    tam.generate_embeddings_for_encoders(fens, encoders)
+    return 0
+
+# main(main)
+if __name__ == "__main__":
+
+    exit(main())
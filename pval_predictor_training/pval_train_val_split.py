@@ -20,13 +20,42 @@ Configuration:
 - VAL_FILE: Output file for validation data (~20% of rows)
 - RANDOM_SEED: Random seed for reproducibility
 - TRAIN_SPLIT: Training set proportion (0.8 = 80%)
+- SPLIT_MODE: 'memory' (load everything, shuffle unique game IDs), 'streaming' (hash split, see below)
+  or 'folds' (hash split into NUM_FOLDS folds, see below)
+- POSITION_DISJOINT: Also drop validation rows whose FEN appears in the training set ('memory'/'streaming')
+
+Streaming mode assigns each game to train/val by a seeded 64-bit hash of its game ID, so no global
+shuffle is needed. Row groups are streamed from INPUT_FILE straight into both output files and all
+summary/leakage statistics are computed incrementally, so memory use does not grow with the number
+of rows (only with the number of unique games/FENs, 8 bytes each).
+Note the two modes put different games in each split for the same RANDOM_SEED.
+
+FEN leakage between train and val is measured on 64-bit FEN hashes (sorted numpy arrays and
+np.intersect1d) instead of Python sets of FEN strings, and reported in both directions.
+With POSITION_DISJOINT the validation set is game-disjoint and position-disjoint from training
+(games keep their split, only the shared positions are removed from val). In streaming mode the
+val rows are written to a temporary file during the single pass over INPUT_FILE and filtered once
+all training FENs are known.
+
+Folds mode writes the data once to FOLD_DATASET_DIR as a hive-partitioned parquet dataset
+(FOLD_DATASET_DIR/fold=<k>/...), where a game's fold is its seeded game ID hash modulo NUM_FOLDS.
+Any combination of folds can then be read with load_folds() (a filtered scan that only opens the
+selected fold directories) instead of rewriting train/val files for every seed or fold, e.g.
+    val_df = load_folds(FOLD_DATASET_DIR, [k])
+    train_df = load_folds(FOLD_DATASET_DIR, [f for f in range(NUM_FOLDS) if f != k])
 
 Usage:
     python pval_train_val_split.py
 """
 
 # imports
+import os
+import shutil
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pyarrow.dataset as ds
 from sklearn.model_selection import train_test_split
 from pathlib import Path
 
@@ -46,29 +75,276 @@ VAL_FILE = "val.parquet"
 TRAIN_SPLIT = 0.8  # 80% training, 20% validation
 RANDOM_SEED = 14   # 14
 
+# 'memory' or 'streaming' (use streaming when the dataset does not fit in RAM a few times over)
+SPLIT_MODE = "memory"
+POSITION_DISJOINT = False # True -> remove val rows whose position (FEN) is also in train
+STREAM_BATCH_ROWS = 1_000_000 # Rows read from INPUT_FILE at a time in streaming mode
+UNIQUE_COMPACT_SIZE = 10_000_000 # Pending hashes kept before deduplicating in streaming mode
+
+# Folds mode output (hive-partitioned dataset with a 'fold' column)
+FOLD_DATASET_DIR = "pval_folds"
+NUM_FOLDS = 5
+FOLD_PARTITIONING = ds.partitioning(pa.schema([('fold', pa.int32())]), flavor='hive')
+
+# ==============
+# HASHING HELPERS
+# ==============
+
+def hash_strings(values, seed=0):
+    """Seeded 64-bit hash (uint64) of every string in values"""
+    # hash_array needs a 16 character key
+    return pd.util.hash_array(np.asarray(values, dtype=object), hash_key=f"pval{seed:012d}"[-16:], categorize=True)
+
+def is_train_game(game_ids, seed=RANDOM_SEED, train_split=TRAIN_SPLIT):
+    """Boolean mask of which game IDs go to the training set (same answer for a game ID in every batch)"""
+    # Top 53 bits of the hash as a uniform float in [0, 1)
+    return (hash_strings(game_ids, seed) >> np.uint64(11)).astype(np.float64) / float(2**53) < train_split
+
+def fen_overlap_report(train_fens, val_fens):
+    """
+    Print the FEN overlap b/w train/val in both directions.
+    train_fens/val_fens are sorted unique uint64 FEN hashes, returns the overlapping hashes.
+    """
+    overlapping_fens = np.intersect1d(train_fens, val_fens, assume_unique=True)
+    print(f"\nData leakage check:")
+    print(f"  Unique FENs in train: {len(train_fens):,}")
+    print(f"  Unique FENs in val: {len(val_fens):,}")
+    print(f"  Overlapping FENs: {len(overlapping_fens):,}")
+    print(f"    {len(overlapping_fens)/max(len(val_fens), 1)*100:.1f}% of val FENs are in train")
+    print(f"    {len(overlapping_fens)/max(len(train_fens), 1)*100:.1f}% of train FENs are in val")
+    print(f"  Note: Some FEN overlap is expected from common openings between different games.")
+    return overlapping_fens
+
+def game_fold(game_ids, seed=RANDOM_SEED, num_folds=NUM_FOLDS):
+    """Fold (0 to num_folds-1) of every game ID"""
+    return (hash_strings(game_ids, seed) % np.uint64(num_folds)).astype(np.int32)
+
+def load_folds(dataset_dir, folds, columns=None):
+    """Load the rows of the given folds from a dataset written in folds mode as a DataFrame"""
+    dataset = ds.dataset(dataset_dir, format='parquet', partitioning=FOLD_PARTITIONING)
+    table = dataset.to_table(columns=columns, filter=ds.field('fold').isin(list(folds)))
+    return table.to_pandas()
+
+class RunningStats:
+    """Streaming count/min/max/mean/std (ddof=1, same as pandas) of a numeric column"""
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def update(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return
+        # Chan et al. parallel combine of (count, mean, M2)
+        n, mean, m2 = len(values), values.mean(), ((values - values.mean()) ** 2).sum()
+        delta = mean - self.mean
+        total = self.count + n
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.mean += delta * n / total
+        self.count = total
+        self.min = values.min() if self.min is None else min(self.min, values.min())
+        self.max = values.max() if self.max is None else max(self.max, values.max())
+
+    @property
+    def std(self):
+        return (self.m2 / (self.count - 1)) ** 0.5 if self.count > 1 else float('nan')
+
+    def value_range(self):
+        return f"[{self.min:.0f}, {self.max:.0f}]" if self.count else "[]"
+
+class UniqueHashes:
+    """Streaming set of uint64 hashes, kept as a sorted unique array (8 bytes per unique value)"""
+    def __init__(self):
+        self.unique = np.empty(0, dtype=np.uint64)
+        self.pending = []
+        self.num_pending = 0
+
+    def update(self, hashes):
+        self.pending.append(np.unique(hashes))
+        self.num_pending += len(self.pending[-1])
+        if self.num_pending >= UNIQUE_COMPACT_SIZE:
+            self.compact()
+
+    def compact(self):
+        if self.pending:
+            self.unique = np.unique(np.concatenate([self.unique] + self.pending))
+            self.pending = []
+            self.num_pending = 0
+        return self.unique
+
+    def __len__(self):
+        return len(self.compact())
+
 # ==============
 # MAIN
 # ==============
 
-def main():
-    print("="*80)
-    print("SPLITTING DATASET INTO TRAIN/VALIDATION SETS")
-    print("="*80)
-    print(f"Input file: {INPUT_FILE}")
-    print(f"Train file: {TRAIN_FILE}")
-    print(f"Validation file: {VAL_FILE}")
-    print(f"Split ratio: {TRAIN_SPLIT:.0%} train / {1-TRAIN_SPLIT:.0%} validation (by game)")
-    print(f"Random seed: {RANDOM_SEED}")
-    print("="*80)
+def split_streaming():
+    """Hash split INPUT_FILE into TRAIN_FILE/VAL_FILE one batch of row groups at a time"""
+    input_file = pq.ParquetFile(INPUT_FILE)
+    print(f"Streaming {input_file.metadata.num_rows:,} rows in {input_file.metadata.num_row_groups} row group(s)")
+    print(f"Splitting data {TRAIN_SPLIT:.0%}/{1-TRAIN_SPLIT:.0%} by seeded hash of game ID...")
+    print("  (All positions from a game stay in the same split)")
+    if POSITION_DISJOINT:
+        print("  (Validation rows with positions seen in training are removed afterwards)")
     print()
 
-    # Load the data
-    print("Loading pval data...")
-    input_path = Path(INPUT_FILE)
-    if not input_path.exists():
-        print(f"ERROR: Input file not found: {INPUT_FILE}")
-        return 1
+    # Incremental statistics for all rows and each split
+    names = ['all', 'train', 'val']
+    rows = {name: 0 for name in names}
+    games = {name: UniqueHashes() for name in names}
+    fens = {name: UniqueHashes() for name in names}
+    pvals = {name: RunningStats() for name in names}
+
+    # Val rows can only be filtered by position once every training FEN has been seen
+    val_output = VAL_FILE + ".tmp" if POSITION_DISJOINT else VAL_FILE
+    writers = {
+        'train': pq.ParquetWriter(TRAIN_FILE, input_file.schema_arrow, compression='lz4'),
+        'val': pq.ParquetWriter(val_output, input_file.schema_arrow, compression='lz4'),
+    }
+    try:
+        for batch_num, batch in enumerate(input_file.iter_batches(batch_size=STREAM_BATCH_ROWS)):
+            game_ids = batch.column('game_id').to_numpy(zero_copy_only=False)
+            train_mask = is_train_game(game_ids)
+            game_hashes = hash_strings(game_ids)
+            fen_hashes = hash_strings(batch.column('fen').to_numpy(zero_copy_only=False))
+            piece_values = batch.column('piece_value').to_numpy(zero_copy_only=False)
+
+            for name, mask in (('all', None), ('train', train_mask), ('val', ~train_mask)):
+                if mask is None:
+                    mask = slice(None)
+                else:
+                    writers[name].write_table(pa.Table.from_batches([batch.filter(pa.array(mask))]))
+                rows[name] += len(piece_values[mask])
+                games[name].update(game_hashes[mask])
+                fens[name].update(fen_hashes[mask])
+                pvals[name].update(piece_values[mask])
+
+            print(f"  Batch {batch_num + 1}: {rows['all']:,} rows processed")
+    finally:
+        for writer in writers.values():
+            writer.close()
+    print()
+
+    # Print basic statistics
+    print("Dataset statistics:")
+    print(f"  Total rows: {rows['all']:,}")
+    print(f"  Unique games: {len(games['all']):,}")
+    print(f"  Unique positions: {len(fens['all']):,}")
+    print(f"  Piece value range: {pvals['all'].value_range()}")
+    print(f"  Piece value mean: {pvals['all'].mean:.2f}")
+    print(f"  Piece value std: {pvals['all'].std:.2f}")
+    print()
+
+    print(f"Training set: {rows['train']:,} rows ({rows['train']/max(rows['all'], 1):.1%})")
+    print(f"Validation set: {rows['val']:,} rows ({rows['val']/max(rows['all'], 1):.1%})")
+
+    # Verify amount of FEN overlap b/w train/val set (on FEN hashes)
+    overlapping_fens = fen_overlap_report(fens['train'].compact(), fens['val'].compact())
+
+    if POSITION_DISJOINT:
+        # Second pass over the (much smaller) val rows only, recomputing the val statistics
+        print(f"\nRemoving val rows with positions seen in training...")
+        val_rows_before = rows['val']
+        rows['val'], games['val'], fens['val'], pvals['val'] = 0, UniqueHashes(), UniqueHashes(), RunningStats()
+        val_file = pq.ParquetFile(val_output)
+        with pq.ParquetWriter(VAL_FILE, val_file.schema_arrow, compression='lz4') as writer:
+            for batch in val_file.iter_batches(batch_size=STREAM_BATCH_ROWS):
+                fen_hashes = hash_strings(batch.column('fen').to_numpy(zero_copy_only=False))
+                keep = ~np.isin(fen_hashes, overlapping_fens)
+                writer.write_table(pa.Table.from_batches([batch.filter(pa.array(keep))]))
+                rows['val'] += keep.sum()
+                games['val'].update(hash_strings(batch.column('game_id').to_numpy(zero_copy_only=False))[keep])
+                fens['val'].update(fen_hashes[keep])
+                pvals['val'].update(batch.column('piece_value').to_numpy(zero_copy_only=False)[keep])
+        os.remove(val_output)
+        print(f"  Removed {val_rows_before - rows['val']:,} val rows, {rows['val']:,} left ({rows['val']/max(rows['all'], 1):.1%} of all rows)")
+    print()
+
+    for name, title in (('train', "Training"), ('val', "Validation")):
+        print(f"{title} set statistics:")
+        print(f"  Unique games: {len(games[name]):,}")
+        print(f"  Unique positions: {len(fens[name]):,}")
+        print(f"  Piece value range: {pvals[name].value_range()}")
+        print(f"  Piece value mean: {pvals[name].mean:.2f}")
+        print()
+
+    print(f"Saved to {TRAIN_FILE} and {VAL_FILE}")
+    print()
+    return rows['train'], rows['val']
+
+def split_folds():
+    """Hash split INPUT_FILE into NUM_FOLDS folds written once as a partitioned dataset"""
+    input_file = pq.ParquetFile(INPUT_FILE)
+    print(f"Streaming {input_file.metadata.num_rows:,} rows in {input_file.metadata.num_row_groups} row group(s)")
+    print(f"Splitting data into {NUM_FOLDS} folds by seeded hash of game ID...")
+    print("  (All positions from a game stay in the same fold)")
+    print()
+
+    # Incremental statistics per fold
+    rows = np.zeros(NUM_FOLDS, dtype=np.int64)
+    games = [UniqueHashes() for _ in range(NUM_FOLDS)]
+    fens = [UniqueHashes() for _ in range(NUM_FOLDS)]
+    pvals = [RunningStats() for _ in range(NUM_FOLDS)]
+
+    # pandas metadata would not match the extra fold column
+    schema = input_file.schema_arrow.remove_metadata().append(pa.field('fold', pa.int32()))
 
+    def batches_with_fold():
+        for batch in input_file.iter_batches(batch_size=STREAM_BATCH_ROWS):
+            game_ids = batch.column('game_id').to_numpy(zero_copy_only=False)
+            folds = game_fold(game_ids, num_folds=NUM_FOLDS)
+            game_hashes = hash_strings(game_ids)
+            fen_hashes = hash_strings(batch.column('fen').to_numpy(zero_copy_only=False))
+            piece_values = batch.column('piece_value').to_numpy(zero_copy_only=False)
+            for fold in range(NUM_FOLDS):
+                mask = folds == fold
+                rows[fold] += mask.sum()
+                games[fold].update(game_hashes[mask])
+                fens[fold].update(fen_hashes[mask])
+                pvals[fold].update(piece_values[mask])
+            print(f"  {rows.sum():,} rows processed")
+            yield pa.RecordBatch.from_arrays(batch.columns + [pa.array(folds)], schema=schema)
+
+    # Remove any previous split first: delete_matching only replaces the fold=<k> directories being written,
+    # so folds left over from a split with more NUM_FOLDS would otherwise be picked up as training data
+    if os.path.exists(FOLD_DATASET_DIR):
+        shutil.rmtree(FOLD_DATASET_DIR)
+    ds.write_dataset(
+        pa.RecordBatchReader.from_batches(schema, batches_with_fold()),
+        FOLD_DATASET_DIR,
+        format='parquet',
+        partitioning=FOLD_PARTITIONING,
+        file_options=ds.ParquetFileFormat().make_write_options(compression='lz4'),
+        existing_data_behavior='delete_matching'
+    )
+    print()
+
+    # A fold's FENs that appear in any other fold leak into validation when that fold is held out
+    all_fens = np.concatenate([f.compact() for f in fens])
+    fen_hashes, fen_counts = np.unique(all_fens, return_counts=True)
+    shared_fens = fen_hashes[fen_counts > 1]
+
+    print("Fold statistics:")
+    print(f"{'Fold':<6} {'Rows':<14} {'Games':<10} {'FENs':<12} {'FENs in other folds':<22} {'Pval mean':<10}")
+    for fold in range(NUM_FOLDS):
+        num_fens = len(fens[fold])
+        num_shared = np.isin(fens[fold].compact(), shared_fens, assume_unique=True).sum()
+        shared = f"{num_shared:,} ({num_shared / max(num_fens, 1):.1%})"
+        print(f"{fold:<6} {rows[fold]:<14,} {len(games[fold]):<10,} {num_fens:<12,} {shared:<22} {pvals[fold].mean:<10.2f}")
+    print(f"  Unique positions over all folds: {len(fen_hashes):,}")
+    print(f"  Note: Some FEN overlap is expected from common openings between different games.")
+    print()
+
+    print(f"Saved to {FOLD_DATASET_DIR}")
+    print()
+    return rows
+
+def split_in_memory():
+    """Load INPUT_FILE into memory and split its shuffled unique game IDs with train_test_split"""
     # Read pval DF in from parquet
     df = pd.read_parquet(INPUT_FILE)
     print(f"Loaded {len(df):,} rows")
@@ -117,16 +393,17 @@ def main():
     print(f"\nTraining set: {len(train_df):,} rows ({len(train_df)/len(df):.1%})")
     print(f"Validation set: {len(val_df):,} rows ({len(val_df)/len(df):.1%})")
 
-    # Verify amount of FEN overlap b/w train/val set
+    # Verify amount of FEN overlap b/w train/val set (on FEN hashes)
     # (Some overlap is expected due to shared openings among different games) 
-    train_fens = set(train_df['fen'].unique())
-    val_fens = set(val_df['fen'].unique())
-    overlapping_fens = train_fens & val_fens
-    print(f"\nData leakage check:")
-    print(f"  Unique FENs in train: {len(train_fens):,}")
-    print(f"  Unique FENs in val: {len(val_fens):,}")
-    print(f"  Overlapping FENs: {len(overlapping_fens):,} ({len(overlapping_fens)/len(val_fens)*100:.1f}% of val FENs)")
-    print(f"  Note: Some FEN overlap is expected from common openings between different games.")
+    train_fen_hashes = hash_strings(train_df['fen'])
+    val_fen_hashes = hash_strings(val_df['fen'])
+    overlapping_fens = fen_overlap_report(np.unique(train_fen_hashes), np.unique(val_fen_hashes))
+
+    if POSITION_DISJOINT:
+        print(f"\nRemoving val rows with positions seen in training...")
+        val_rows_before = len(val_df)
+        val_df = val_df[~np.isin(val_fen_hashes, overlapping_fens)]
+        print(f"  Removed {val_rows_before - len(val_df):,} val rows, {len(val_df):,} left ({len(val_df)/len(df):.1%} of all rows)")
     print()
 
     # Print train split statistics
@@ -156,12 +433,54 @@ def main():
     print(f"Saved to {VAL_FILE}")
     print()
 
+    return len(train_df), len(val_df)
+
+def main():
+    print("="*80)
+    print("SPLITTING DATASET INTO TRAIN/VALIDATION SETS")
+    print("="*80)
+    print(f"Input file: {INPUT_FILE}")
+    if SPLIT_MODE == "folds":
+        print(f"Fold dataset: {FOLD_DATASET_DIR}")
+        print(f"Folds: {NUM_FOLDS} (by game)")
+    else:
+        print(f"Train file: {TRAIN_FILE}")
+        print(f"Validation file: {VAL_FILE}")
+        print(f"Split ratio: {TRAIN_SPLIT:.0%} train / {1-TRAIN_SPLIT:.0%} validation (by game)")
+    print(f"Random seed: {RANDOM_SEED}")
+    print(f"Split mode: {SPLIT_MODE}")
+    print("="*80)
+    print()
+
+    # Load the data
+    print("Loading pval data...")
+    input_path = Path(INPUT_FILE)
+    if not input_path.exists():
+        print(f"ERROR: Input file not found: {INPUT_FILE}")
+        return 1
+
+    if SPLIT_MODE == "folds":
+        fold_rows = split_folds()
+        print("="*80)
+        print("SPLIT COMPLETE!")
+        print("="*80)
+        print(f"Fold dataset: {FOLD_DATASET_DIR} ({fold_rows.sum():,} rows in {NUM_FOLDS} folds)")
+        print("="*80)
+        return 0
+    elif SPLIT_MODE == "streaming":
+        num_train_rows, num_val_rows = split_streaming()
+    elif SPLIT_MODE == "memory":
+        num_train_rows, num_val_rows = split_in_memory()
+    else:
+        print(f"ERROR: Unknown SPLIT_MODE: {SPLIT_MODE}")
+        return 1
+
     # Print confirmation message and stats
     print("="*80)
     print("SPLIT COMPLETE!")
     print("="*80)
-    print(f"Training data: {TRAIN_FILE} ({len(train_df):,} rows)")
-    print(f"Validation data: {VAL_FILE} ({len(val_df):,} rows)")
+    print(f"Training data: {TRAIN_FILE} ({num_train_rows:,} rows)")
+    print(f"Validation data: {VAL_FILE} ({num_val_rows:,} rows)")
     print("="*80)
 
     # return(return)
@@ -0,0 +1,303 @@
+"""
+This file streaming_dataset.py streams piece value rows from parquet files for train_all_models.py
+(TRAINING_DATA_MODE = 'streaming'), so training never holds the whole train/val DataFrames in memory.
+
+- ParquetPieceValueSource: the parquet files of a split and the mean/std used to standardize piece_value.
+  It stands in for train_df/val_df in train_all_models.py (len() is its number of rows).
+- scan_piece_value_files: one streaming pass over a split for its statistics (mean/std/min/max, unique
+  games and positions), optionally spilling its unique FENs to a UniqueFenListWriter.
+  summarize_piece_values returns the same for a DataFrame (plus the list of unique FENs).
+- UniqueFenList: unique FENs in order of first appearance, in a text file on disk instead of a list in memory
+  (only their 64-bit hashes stay in RAM). It stands in for the list of unique FENs (len(), fen_chunks()).
+- FenIndex: FEN -> row lookup of a FEN list by 64-bit hash (replaces pd.Index(fens), which keeps every FEN string).
+- StreamingPieceValueDataset: IterableDataset that reads the projected columns one row group at a time,
+  shuffles rows through a buffer of shuffle_buffer_rows rows and yields whole batches (same layout as the
+  in-memory batch loaders of train_all_models.py).
+
+Row groups are read in a new random order every epoch and split between DataLoader workers, and rows are
+shuffled within the buffer, so memory per worker is bounded by the buffer plus one row group.
+"""
+
+# imports
+import os
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import torch
+from pathlib import Path
+from torch.utils.data import IterableDataset, get_worker_info
+from pval_train_val_split import RunningStats, UniqueHashes, hash_strings
+
+# Columns needed to build MLP/CNN piece value datasets
+STREAM_COLUMNS = ['fen', 'piece_type', 'rank', 'file', 'piece_value']
+SCAN_BATCH_ROWS = 1_000_000 # Rows read at a time by scan_piece_value_files
+FEN_CHUNK_ROWS = 1_000_000 # FENs read at a time from a UniqueFenList
+
+
+class ParquetPieceValueSource:
+    """Parquet files of one split, read a row group at a time (piece_value standardized with norm_params)"""
+    def __init__(self, files, norm_params=None, columns=STREAM_COLUMNS):
+        self.files = [str(f) for f in files]
+        self.columns = list(columns)
+        self.norm_params = norm_params
+        self.row_groups = []
+        self.num_rows = 0
+        for f in self.files:
+            metadata = pq.ParquetFile(f).metadata
+            self.row_groups.extend((f, i) for i in range(metadata.num_row_groups))
+            self.num_rows += metadata.num_rows
+
+    # Source for some folds of a fold dataset written by pval_train_val_split.py (SPLIT_MODE = 'folds')
+    @classmethod
+    def from_folds(cls, dataset_dir, folds, **kwargs):
+        files = [f for fold in sorted(folds) for f in sorted(Path(dataset_dir).glob(f"fold={fold}/*.parquet"))]
+        return cls(files, **kwargs)
+
+    def __len__(self):
+        return self.num_rows
+
+    def read_row_group(self, row_group):
+        f, i = row_group
+        df = pq.ParquetFile(f).read_row_group(i, columns=self.columns).to_pandas()
+        if self.norm_params is not None:
+            df['piece_value'] = (df['piece_value'] - self.norm_params['mean']) / self.norm_params['std']
+        return df
+
+
+class StreamingPieceValueDataset(IterableDataset):
+    """
+    Batches of make_dataset(rows) streamed from source (use with DataLoader(batch_size=None)).
+    make_dataset builds a train_all_models dataset with as_tensors() (and embedding_table) from a DataFrame,
+    it must be picklable when the DataLoader has workers (e.g. functools.partial of the dataset class).
+    """
+    def __init__(self, source, make_dataset, batch_size, shuffle=False, shuffle_buffer_rows=1_000_000):
+        self.source = source
+        self.make_dataset = make_dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.shuffle_buffer_rows = shuffle_buffer_rows
+
+    def __len__(self):
+        # Exact without workers, each worker can add one partial batch
+        return (len(self.source) + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        worker = get_worker_info()
+        if worker is None:
+            worker_id, num_workers = 0, 1
+            seed = int(torch.randint(2**62, ()).item())
+        else:
+            # Every worker gets base_seed + id, so all of them agree on the row group order
+            worker_id, num_workers = worker.id, worker.num_workers
+            seed = worker.seed - worker.id
+
+        row_groups = list(self.source.row_groups)
+        if self.shuffle:
+            row_groups = [row_groups[i] for i in np.random.default_rng(seed).permutation(len(row_groups))]
+        row_groups = row_groups[worker_id::num_workers]
+        rng = np.random.default_rng([seed, worker_id])
+
+        buffer = []
+        buffered_rows = 0
+        for row_group in row_groups:
+            df = self.source.read_row_group(row_group)
+            buffer.append(df)
+            buffered_rows += len(df)
+            if buffered_rows >= self.shuffle_buffer_rows:
+                remainder = yield from self._emit(buffer, rng, keep_remainder=True)
+                buffer = [remainder]
+                buffered_rows = len(remainder)
+        if buffered_rows:
+            yield from self._emit(buffer, rng, keep_remainder=False)
+
+    def _emit(self, buffer, rng, keep_remainder):
+        """Yield full batches of the (shuffled) buffer, return the rows left over for the next buffer"""
+        df = pd.concat(buffer, ignore_index=True) if len(buffer) > 1 else buffer[0]
+        if self.shuffle:
+            df = df.take(rng.permutation(len(df)))
+        num_rows = len(df) // self.batch_size * self.batch_size if keep_remainder else len(df)
+        if num_rows == 0:
+            return df
+
+        dataset = self.make_dataset(df.iloc[:num_rows])
+        tensors = dataset.as_tensors()
+        embedding_table = getattr(dataset, 'embedding_table', None)
+        for start in range(0, num_rows, self.batch_size):
+            batch = [t[start:start + self.batch_size] for t in tensors]
+            if embedding_table is not None:
+                batch[0] = torch.from_numpy(np.asarray(embedding_table[batch[0].numpy()], dtype=np.float32))
+            yield tuple(batch)
+        return df.iloc[num_rows:]
+
+
+class UniqueFenList:
+    """
+    Unique FENs in order of first appearance, one per line in a text file (row i is line i).
+    Only hashes (uint64 hash_strings of every FEN, in row order) are kept in memory, FENs are read back in chunks.
+    Distinct FENs are assumed to have distinct 64-bit hashes (as in the split statistics).
+    """
+    def __init__(self, path, hashes):
+        self.path = Path(path)
+        self.hashes = hashes
+
+    def __len__(self):
+        return len(self.hashes)
+
+    # The first num_rows FENs (e.g. the training FENs at the start of the train + val list)
+    def head(self, num_rows):
+        return UniqueFenList(self.path, self.hashes[:num_rows])
+
+    def iter_chunks(self, chunk_rows=FEN_CHUNK_ROWS):
+        """Yield the FENs as lists of up to chunk_rows"""
+        yield from read_fen_chunks(self.path, len(self), chunk_rows)
+
+
+class UniqueFenListWriter:
+    """Builds a UniqueFenList by appending batches of FENs, FENs already written are skipped"""
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        self.file = open(self.tmp_path, 'w')
+        self.hashes = [] # hashes of the FENs written, in row order
+        self.levels = [] # the same hashes as sorted arrays of decreasing size (merged as they grow)
+        self.num_rows = 0
+
+    def __len__(self):
+        return self.num_rows
+
+    def _written(self, hashes):
+        written = np.zeros(len(hashes), dtype=bool)
+        for level in self.levels:
+            pos = np.minimum(np.searchsorted(level, hashes), len(level) - 1)
+            written |= level[pos] == hashes
+        return written
+
+    def add(self, fens):
+        fens = pd.unique(np.asarray(fens, dtype=object))
+        hashes = hash_strings(fens)
+        new = ~self._written(hashes)
+        if not new.any():
+            return
+        fens, hashes = fens[new], hashes[new]
+        self.file.write('\n'.join(fens))
+        self.file.write('\n')
+        self.hashes.append(hashes)
+        self.num_rows += len(hashes)
+
+        # Each level stays at least twice the size of the next, so there are at most log2(rows) levels to search
+        self.levels.append(np.sort(hashes))
+        while len(self.levels) > 1 and len(self.levels[-2]) < 2 * len(self.levels[-1]):
+            self.levels[-2:] = [np.sort(np.concatenate(self.levels[-2:]))]
+
+    def close(self):
+        """Move the file into place and return its UniqueFenList"""
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+        hashes = np.concatenate(self.hashes) if self.hashes else np.empty(0, dtype=np.uint64)
+        self.hashes, self.levels = [], []
+        return UniqueFenList(self.path, hashes)
+
+
+class FenIndex:
+    """Row of a FEN in a list of unique FENs, looked up by 64-bit hash (the FEN strings are not kept)"""
+    def __init__(self, hashes):
+        self.rows = np.argsort(hashes, kind='stable')
+        self.sorted_hashes = hashes[self.rows]
+
+    @classmethod
+    def from_fens(cls, fens):
+        """Index of a list of FENs or a UniqueFenList"""
+        return cls(fen_list_hashes(fens))
+
+    def __len__(self):
+        return len(self.sorted_hashes)
+
+    @property
+    def hashes(self):
+        """Hashes in row order"""
+        hashes = np.empty_like(self.sorted_hashes)
+        hashes[self.rows] = self.sorted_hashes
+        return hashes
+
+    def get_indexer(self, fens):
+        """Row of every FEN in fens, -1 if it is not in the index (like pd.Index.get_indexer)"""
+        hashes = hash_strings(fens)
+        if len(self) == 0:
+            return np.full(len(hashes), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_hashes, hashes), len(self) - 1)
+        return np.where(self.sorted_hashes[pos] == hashes, self.rows[pos], -1)
+
+
+# Helper functions so a list of FENs and a UniqueFenList can be used interchangeably
+def fen_list_hashes(fens):
+    """uint64 hash of every FEN of a list of FENs or a UniqueFenList, in order"""
+    return fens.hashes if isinstance(fens, UniqueFenList) else hash_strings(fens)
+
+def fen_chunks(fens, chunk_rows=FEN_CHUNK_ROWS):
+    """Yield a list of FENs or a UniqueFenList as lists of up to chunk_rows FENs"""
+    if isinstance(fens, UniqueFenList):
+        yield from fens.iter_chunks(chunk_rows)
+    else:
+        for start in range(0, len(fens), chunk_rows):
+            yield fens[start:start + chunk_rows]
+
+def read_fen_chunks(path, num_rows, chunk_rows=FEN_CHUNK_ROWS):
+    """Yield the first num_rows lines of a FEN file (one FEN per line) as lists of up to chunk_rows"""
+    chunk = []
+    with open(path) as f:
+        for _, line in zip(range(num_rows), f):
+            chunk.append(line.rstrip('\n'))
+            if len(chunk) == chunk_rows:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def summarize_piece_values(df):
+    """Statistics of a piece value DataFrame (same keys as scan_piece_value_files, plus the list of unique FENs)"""
+    unique_fens = df['fen'].unique().tolist()
+    return {
+        'rows': len(df),
+        'unique_positions': len(unique_fens),
+        'unique_games': df['game_id'].nunique(),
+        'min': df['piece_value'].min(),
+        'max': df['piece_value'].max(),
+        'mean': df['piece_value'].mean(),
+        'std': df['piece_value'].std(),
+        'game_hashes': np.unique(hash_strings(df['game_id'])),
+        'fen_hashes': np.unique(hash_strings(unique_fens)),
+        'unique_fens': unique_fens,
+    }
+
+def scan_piece_value_files(source, fens_writer=None, batch_rows=SCAN_BATCH_ROWS):
+    """
+    Statistics of the (raw, unstandardized) piece values in source from one streaming pass.
+    The unique FENs are not returned (that list grows with the corpus), they are added to fens_writer if given,
+    in order of first appearance (same order as df['fen'].unique()).
+    """
+    value_stats = RunningStats()
+    games = UniqueHashes()
+    fens = UniqueHashes()
+
+    for f in source.files:
+        for batch in pq.ParquetFile(f).iter_batches(batch_size=batch_rows, columns=['game_id', 'fen', 'piece_value']):
+            df = batch.to_pandas()
+            value_stats.update(df['piece_value'].values)
+            games.update(hash_strings(df['game_id']))
+            fens.update(hash_strings(df['fen']))
+            if fens_writer is not None:
+                fens_writer.add(df['fen'].values)
+
+    return {
+        'rows': value_stats.count,
+        'unique_positions': len(fens),
+        'unique_games': len(games),
+        'min': value_stats.min,
+        'max': value_stats.max,
+        'mean': value_stats.mean,
+        'std': value_stats.std,
+        'game_hashes': games.compact(),
+        'fen_hashes': fens.compact(),
+    }
@@ -0,0 +1,505 @@
+"""
+This file sweep_executor.py runs the model grid of train_all_models.py as a graph of jobs on a process pool,
+instead of training every model one after another in one process.
+
+Jobs are expanded from the config dicts in train_all_models.py:
+- mlp/<name>:        MLP baselines (no dependencies)
+- encoder/<name>:    CNN position autoencoders (no dependencies)
+- embeddings/<name>: embedding store of an encoder (needs encoder/<name>, only if CNN_ENCODER_MODE = 'precomputed')
+- pval/<name>:       CNN piece value heads (needs the encoder or its embeddings, one job for all heads
+                     of an encoder if CNN_PIECEVAL_MULTI_HEAD)
+- eval/<name>:       train/val MAE of a trained model (needs the job that trained it)
+
+Jobs whose dependencies are done run at the same time on SWEEP_WORKERS processes (sized to the cores and
+free memory of the machine if None). The state and result of every job is saved to OUTPUT_DIR/sweep_state.json
+as soon as it finishes, so running the sweep again after an interruption only runs the jobs that are not done
+(jobs also rerun if their config or a dependency changed). Each job prints to OUTPUT_DIR/sweep_logs/<job>.log.
+Once every job is done, all_models_metrics.json is written in the same format as train_all_models.py.
+
+Usage:
+    python sweep_executor.py [--restart]
+
+--restart forgets the saved job states and runs every job again.
+"""
+
+# imports
+import os
+import sys
+import json
+import time
+import hashlib
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+import torch
+import train_all_models as tam
+from embedding_store import EmbeddingStore
+
+# ==============
+# CONFIG
+# ==============
+
+SWEEP_WORKERS = None # Number of job processes (None = as many as cores and SWEEP_WORKER_MEMORY_GB allow)
+SWEEP_WORKER_MEMORY_GB = 16 # Approximate peak memory of one job (each worker loads its own copy of train/val)
+SWEEP_STATE_FILE = "sweep_state.json" # Saved in OUTPUT_DIR
+SWEEP_LOG_DIR = "sweep_logs" # Saved in OUTPUT_DIR
+
+# MLP baselines: name -> (config dict name in train_all_models.py, include_quadratic)
+MLP_BASELINES = {
+    'mlp1': ('MLP_CONFIG', False),
+    'mlp2': ('MLP_CONFIG', True),
+    'chessable2023': ('CHESSABLE_RESEARCH_2023_CONFIG', False),
+}
+
+# ==============
+# JOB GRAPH
+# ==============
+
+def build_jobs():
+    """Expand the grid of train_all_models.py into a topologically ordered list of jobs"""
+    output_dir = Path(tam.OUTPUT_DIR)
+    data_source = {
+        'training_parquet': tam.TRAINING_PARQUET,
+        'validation_parquet': tam.VALIDATION_PARQUET,
+        'fold_dataset_dir': tam.FOLD_DATASET_DIR,
+        'val_folds': list(tam.VAL_FOLDS),
+    }
+    jobs = []
+
+    def add_job(job_id, kind, spec, deps=()):
+        jobs.append({'id': job_id, 'kind': kind, 'deps': list(deps), 'spec': dict(spec, data=data_source)})
+        return job_id
+
+    # MLP baselines
+    for model_name, (config_name, include_quadratic) in MLP_BASELINES.items():
+        config = getattr(tam, config_name)
+        train_job = add_job(f"mlp/{model_name}", 'mlp', {
+            'model_name': model_name,
+            'config': config,
+            'include_quadratic': include_quadratic,
+        })
+        add_job(f"eval/{model_name}", 'eval', {
+            'model_type': 'mlp',
+            'model_name': model_name,
+            'config': config,
+            'include_quadratic': include_quadratic,
+        }, deps=[train_job])
+
+    # CNN position encoders -> embeddings -> pval heads -> evaluation
+    for embedding_dim in tam.CNN_EMBEDDING_DIMS:
+        for num_layers in tam.CNN_LAYER_DEPTHS:
+            encoder_model_name = f"cnn_pos_{embedding_dim}d_{num_layers}layer"
+            embed_column_name = f"embed_{embedding_dim}d_{num_layers}layer"
+            encoder_spec = {
+                'encoder_model_name': encoder_model_name,
+                'embed_column': embed_column_name,
+                'embedding_store': str(output_dir / f"{embed_column_name}_store"),
+                'embedding_dim': embedding_dim,
+                'num_layers': num_layers,
+            }
+            encoder_job = add_job(f"encoder/{encoder_model_name}", 'encoder',
+                                  dict(encoder_spec, config=tam.CNN_POSITION_CONFIG))
+
+            head_deps = [encoder_job]
+            if tam.CNN_ENCODER_MODE == 'precomputed':
+                head_deps = [add_job(f"embeddings/{encoder_model_name}", 'embeddings',
+                                     dict(encoder_spec, dtype=tam.EMBEDDING_STORE_DTYPE), deps=[encoder_job])]
+
+            heads = []
+            for num_hidden_layers in sorted(tam.CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS.keys()):
+                hidden_sizes = tam.CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS[num_hidden_layers]
+                heads.append({
+                    'model_name': f"{encoder_model_name}_pval_{'-'.join(map(str, hidden_sizes))}",
+                    'hidden_sizes': hidden_sizes,
+                    'dropout_rates': tam.CNN_PIECEVAL_DROPOUT_RATES[num_hidden_layers],
+                })
+
+            head_spec = dict(encoder_spec, config=tam.CNN_PIECEVAL_CONFIG, encoder_mode=tam.CNN_ENCODER_MODE)
+            if tam.CNN_PIECEVAL_MULTI_HEAD:
+                head_groups = [(f"pval/{encoder_model_name}", heads)]
+            else:
+                head_groups = [(f"pval/{head['model_name']}", [head]) for head in heads]
+
+            for job_id, group in head_groups:
+                train_job = add_job(job_id, 'pval', dict(head_spec, heads=group), deps=head_deps)
+                for head in group:
+                    add_job(f"eval/{head['model_name']}", 'eval',
+                            dict(head_spec, model_type='cnn', **head), deps=[train_job])
+
+    return jobs
+
+def spec_hash(job):
+    """Hash of a job's spec, a done job reruns when it changes"""
+    return hashlib.blake2b(json.dumps(job['spec'], sort_keys=True).encode(), digest_size=8).hexdigest()
+
+# Load saved job states ({job_id: {...}})
+def load_state(state_file):
+    if not state_file.exists():
+        return {}
+    with open(state_file) as f:
+        return json.load(f)
+
+# Save job states (written to a temp file first so an interrupted save never corrupts the state)
+def save_state(state, state_file):
+    tmp_file = state_file.with_name(state_file.name + ".tmp")
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, state_file)
+
+def find_done_jobs(jobs, state):
+    """Ids of jobs that are done with their current spec and whose dependencies are all done"""
+    done = set()
+    for job in jobs:
+        job_state = state.get(job['id'], {})
+        if (job_state.get('status') == 'done' and job_state.get('spec_hash') == spec_hash(job)
+                and all(dep in done for dep in job['deps'])):
+            done.add(job['id'])
+    return done
+
+def sweep_worker_count(max_parallel_jobs):
+    """Number of worker processes from the cores and free memory of this machine (or SWEEP_WORKERS)"""
+    if SWEEP_WORKERS:
+        return SWEEP_WORKERS
+    workers = os.cpu_count() or 1
+    try:
+        available_gb = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1e9
+        workers = min(workers, int(available_gb // SWEEP_WORKER_MEMORY_GB))
+    except (ValueError, OSError, AttributeError):
+        pass # no sysconf (e.g. Windows), only limit by cores
+    return max(1, min(workers, max_parallel_jobs))
+
+# ==============
+# DATA
+# ==============
+
+def load_data():
+    """Load train/val data like train_all_models.main() (standardized piece values and unique FENs)"""
+    return tam.load_training_data()
+
+# ==============
+# WORKER
+# ==============
+
+_worker_data = None # Train/val data of this worker process (loaded by its first job)
+
+def _init_worker(settings, num_threads):
+    """Apply the parent's train_all_models config (workers are spawned, so overrides would be lost) and threads"""
+    for name, value in settings.items():
+        setattr(tam, name, value)
+    torch.set_num_threads(num_threads)
+
+def _get_data():
+    global _worker_data
+    if _worker_data is None:
+        _worker_data = load_data()
+    return _worker_data
+
+def _load_encoder(spec, encoder_model_name):
+    encoder = tam.ChessCNNEncoder(embedding_dim=spec['embedding_dim'], num_layers=spec['num_layers'])
+    encoder.load_state_dict(torch.load(Path(tam.OUTPUT_DIR) / f"{encoder_model_name}_encoder.pth"))
+    return encoder
+
+def _all_fen_bitboards(spec, data):
+    if spec['encoder_mode'] == 'precomputed':
+        return None
+    return tam.load_bitboard_cache(data['all_unique_fens'], tam.BITBOARD_CACHE_DIR, tam.BITBOARD_CACHE_WORKERS)
+
+def run_mlp_job(spec):
+    data = _get_data()
+    _, metadata = tam.train_mlp_model(
+        data['train_df'], data['val_df'], spec['config'],
+        include_quadratic=spec['include_quadratic'],
+        model_name=spec['model_name'],
+        norm_params=data['norm_params'],
+        output_dir=Path(tam.OUTPUT_DIR)
+    )
+    return metadata
+
+def run_encoder_job(spec):
+    data = _get_data()
+    bitboards = tam.load_bitboard_cache(data['unique_fens'], tam.BITBOARD_CACHE_DIR, tam.BITBOARD_CACHE_WORKERS)
+    _, metadata = tam.train_cnn_position_encoder(
+        data['unique_fens'], spec['config'], Path(tam.OUTPUT_DIR),
+        embedding_dim=spec['embedding_dim'],
+        num_layers=spec['num_layers'],
+        model_name=spec['encoder_model_name'],
+        bitboards=bitboards
+    )
+    return metadata
+
+def run_embeddings_job(spec):
+    data = _get_data()
+    store = tam.generate_embeddings_for_fens(
+        data['all_unique_fens'],
+        _load_encoder(spec, spec['encoder_model_name']),
+        spec['embedding_store'],
+        model_name=spec['encoder_model_name'],
+        dtype=spec['dtype']
+    )
+    return {'embedding_store': str(store.store_dir), 'num_positions': len(store)}
+
+def run_pval_job(spec):
+    data = _get_data()
+    embedding_store = None
+    encoder = None
+    if spec['encoder_mode'] == 'precomputed':
+        embedding_store = EmbeddingStore.open(spec['embedding_store'])
+    else:
+        encoder = _load_encoder(spec, spec['encoder_model_name'])
+    kwargs = dict(
+        embedding_dim=spec['embedding_dim'],
+        embed_column=spec['embed_column'],
+        embedding_store=embedding_store,
+        encoder_mode=spec['encoder_mode'],
+        encoder=encoder,
+        bitboards=_all_fen_bitboards(spec, data),
+        position_fens=data['all_unique_fens']
+    )
+    train_args = (data['train_df'], data['val_df'], spec['config'], data['norm_params'], Path(tam.OUTPUT_DIR))
+
+    if len(spec['heads']) > 1:
+        head_results = tam.train_cnn_pieceval_heads(*train_args, spec['heads'], **kwargs)
+        return {model_name: metadata for model_name, (_, metadata) in head_results.items()}
+
+    head = spec['heads'][0]
+    _, metadata = tam.train_cnn_pieceval_model(
+        *train_args,
+        hidden_sizes=head['hidden_sizes'],
+        dropout_rates=head['dropout_rates'],
+        model_name=head['model_name'],
+        **kwargs
+    )
+    return {head['model_name']: metadata}
+
+def run_eval_job(spec):
+    data = _get_data()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    output_dir = Path(tam.OUTPUT_DIR)
+
+    if spec['model_type'] == 'mlp':
+        config = spec['config']
+        model = tam.SimplePieceValueMLP(
+            input_dim=14 if spec['include_quadratic'] else 12,
+            hidden_sizes=config['hidden_sizes'],
+            dropout=config['dropout']
+        ).to(device)
+        model.load_state_dict(torch.load(output_dir / f"{spec['model_name']}_model.pth"))
+        errors = [tam.evaluate_mlp_model(model, df, include_quadratic=spec['include_quadratic'],
+                                         norm_params=data['norm_params'], device=device)
+                  for df in (data['train_df'], data['val_df'])]
+    else:
+        model = tam.CNNPieceValuePredictor(
+            embedding_dim=spec['embedding_dim'],
+            hidden_sizes=spec['hidden_sizes'],
+            dropout_rates=spec['dropout_rates']
+        ).to(device)
+        model.load_state_dict(torch.load(output_dir / f"{spec['model_name']}_model.pth"))
+
+        # Same encoder/embeddings the head was trained with (its own encoder copy if finetuned)
+        embedding_store = None
+        encoder = None
+        if spec['encoder_mode'] == 'precomputed':
+            embedding_store = EmbeddingStore.open(spec['embedding_store'])
+        elif spec['encoder_mode'] == 'finetune':
+            encoder = _load_encoder(spec, spec['model_name'])
+        else:
+            encoder = _load_encoder(spec, spec['encoder_model_name'])
+        bitboards = _all_fen_bitboards(spec, data)
+        errors = [tam.evaluate_cnn_pieceval_model(model, df, norm_params=data['norm_params'], device=device,
+                                                  embedding_store=embedding_store, encoder=encoder,
+                                                  bitboards=bitboards, position_fens=data['all_unique_fens'])
+                  for df in (data['train_df'], data['val_df'])]
+
+    return {'train_error_cp': errors[0], 'val_error_cp': errors[1]}
+
+JOB_RUNNERS = {
+    'mlp': run_mlp_job,
+    'encoder': run_encoder_job,
+    'embeddings': run_embeddings_job,
+    'pval': run_pval_job,
+    'eval': run_eval_job,
+}
+
+def run_job(job):
+    """Run one job in a worker, its output goes to its log file"""
+    log_dir = Path(tam.OUTPUT_DIR) / SWEEP_LOG_DIR
+    log_dir.mkdir(exist_ok=True, parents=True)
+    start_time = time.time()
+    with open(log_dir / (job['id'].replace('/', '__') + ".log"), 'w') as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        try:
+            result = JOB_RUNNERS[job['kind']](job['spec'])
+        except Exception:
+            traceback.print_exc()
+            raise
+    return {'result': result, 'seconds': time.time() - start_time}
+
+# ==============
+# RESULTS
+# ==============
+
+def write_metrics(jobs, state, data_info, output_dir):
+    """Write all_models_metrics.json from the job results (same layout as train_all_models.main())"""
+    results_by_id = {job_id: job_state['result'] for job_id, job_state in state.items()}
+    mlp_models = {model_name: results_by_id[f"mlp/{model_name}"] for model_name in MLP_BASELINES}
+    evaluation_results = {job_id.split('/', 1)[1]: result
+                          for job_id, result in results_by_id.items() if job_id.startswith('eval/')}
+
+    cnn_models_metadata = {}
+    for job in jobs:
+        spec = job['spec']
+        if job['kind'] == 'encoder':
+            cnn_models_metadata[spec['encoder_model_name']] = {
+                'encoder': results_by_id[job['id']],
+                'embed_column': spec['embed_column']
+            }
+        elif job['kind'] == 'pval':
+            for model_name, pieceval_metadata in results_by_id[job['id']].items():
+                cnn_models_metadata[model_name] = {
+                    'encoder': cnn_models_metadata[spec['encoder_model_name']]['encoder'],
+                    'embed_column': spec['embed_column'],
+                    'pieceval': pieceval_metadata
+                }
+
+    results = {
+        'dataset_info': data_info,
+        'optimizations': {
+            'optimizer': 'AdamW',
+            'weight_decay': tam.CNN_PIECEVAL_CONFIG['weight_decay'],
+            'loss_function': f'HuberLoss(delta={tam.HUBER_DELTA})',
+            'normalization': 'standardization (zero mean, unit variance)',
+            'mlp_batchnorm': True,
+            'graduated_dropout': True,
+            'dropout_rates': {str(k): v for k, v in tam.CNN_PIECEVAL_DROPOUT_RATES.items()},
+            'game_level_split': 'recommended (via optimized_create_val_train_splits.py)'
+        },
+        'mlp_models': mlp_models,
+        'cnn_models': cnn_models_metadata,
+        'evaluation': evaluation_results
+    }
+
+    metrics_file = output_dir / "all_models_metrics.json"
+    with open(metrics_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved metrics to {metrics_file}\n")
+
+    print(f"\n{'Rank':<6} {'Model':<50} {'Val MAE':>12} {'Train-Val Gap':>14}")
+    print(f"{'-'*6} {'-'*50} {'-'*12} {'-'*14}")
+    sorted_models = sorted(evaluation_results.items(), key=lambda x: x[1]['val_error_cp'])
+    for rank, (model_name, metrics) in enumerate(sorted_models, 1):
+        gap = metrics['val_error_cp'] - metrics['train_error_cp']
+        print(f"{rank:<6} {model_name:<50} {metrics['val_error_cp']:>11.2f} cp {gap:>+13.2f} cp")
+
+# ==============
+# MAIN
+# ==============
+
+def main():
+    output_dir = Path(tam.OUTPUT_DIR)
+    output_dir.mkdir(exist_ok=True, parents=True)
+    state_file = output_dir / SWEEP_STATE_FILE
+
+    jobs = build_jobs()
+    jobs_by_id = {job['id']: job for job in jobs}
+    state = {} if '--restart' in sys.argv[1:] else load_state(state_file)
+    # Forget states of jobs that are no longer in the grid
+    state = {job_id: job_state for job_id, job_state in state.items() if job_id in jobs_by_id}
+    done = find_done_jobs(jobs, state)
+    pending = [job for job in jobs if job['id'] not in done]
+
+    num_workers = sweep_worker_count(len(pending))
+    num_threads = max(1, (os.cpu_count() or 1) // num_workers)
+
+    print("="*80)
+    print("MODEL GRID SWEEP")
+    print("="*80)
+    print(f"Jobs: {len(jobs)} ({len(done)} already done, {len(pending)} to run)")
+    print(f"Workers: {num_workers} processes x {num_threads} threads")
+    print(f"State file: {state_file}")
+    print(f"Job logs: {output_dir / SWEEP_LOG_DIR}")
+    print("="*80)
+    for job in pending:
+        deps = f" <- {', '.join(job['deps'])}" if job['deps'] else ""
+        print(f"  {job['id']}{deps}")
+
+    # Load the data once here for the dataset info and to build the bitboard caches before the workers need them
+    # (workers are daemonic and can't start their own pools)
+    data = load_data()
+    data_info = {
+        'training_file': tam.TRAINING_PARQUET,
+        'validation_file': tam.VALIDATION_PARQUET,
+        'training_rows': len(data['train_df']),
+        'validation_rows': len(data['val_df']),
+        'unique_positions_train': len(data['unique_fens']),
+        'normalization': data['norm_params']
+    }
+    if any(job['kind'] == 'encoder' for job in pending):
+        tam.load_bitboard_cache(data['unique_fens'], tam.BITBOARD_CACHE_DIR, tam.BITBOARD_CACHE_WORKERS)
+    if tam.CNN_ENCODER_MODE != 'precomputed' and any(job['kind'] in ('pval', 'eval') for job in pending):
+        tam.load_bitboard_cache(data['all_unique_fens'], tam.BITBOARD_CACHE_DIR, tam.BITBOARD_CACHE_WORKERS)
+    del data
+
+    # train_all_models config (incl. overrides made by whoever imported it) for the worker processes
+    settings = {name: value for name, value in vars(tam).items() if name.isupper() and not name.startswith('_')}
+
+    sweep_start = time.time()
+    failed = set()
+    running = {}
+    with ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=_init_worker,
+        initargs=(settings, num_threads)
+    ) as pool:
+        while pending or running:
+            # Submit every job whose dependencies are done, drop jobs whose dependencies failed
+            for job in list(pending):
+                if any(dep in failed for dep in job['deps']):
+                    pending.remove(job)
+                    failed.add(job['id'])
+                    state[job['id']] = {'status': 'skipped', 'spec_hash': spec_hash(job),
+                                        'error': 'a dependency failed'}
+                elif all(dep in done for dep in job['deps']):
+                    pending.remove(job)
+                    running[pool.submit(run_job, job)] = job
+                    state[job['id']] = {'status': 'running', 'spec_hash': spec_hash(job), 'started': time.time()}
+                    print(f"[{time.time() - sweep_start:8.1f}s] started  {job['id']}")
+            save_state(state, state_file)
+
+            if not running:
+                break
+
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                job = running.pop(future)
+                try:
+                    outcome = future.result()
+                    state[job['id']] = {'status': 'done', 'spec_hash': spec_hash(job), 'result': outcome['result'],
+                                        'seconds': outcome['seconds'], 'finished': time.time()}
+                    done.add(job['id'])
+                    print(f"[{time.time() - sweep_start:8.1f}s] finished {job['id']} ({outcome['seconds']:.1f}s)")
+                except Exception as e:
+                    state[job['id']] = {'status': 'failed', 'spec_hash': spec_hash(job), 'error': repr(e)}
+                    failed.add(job['id'])
+                    print(f"[{time.time() - sweep_start:8.1f}s] FAILED   {job['id']}: {e!r}")
+            save_state(state, state_file)
+
+    print(f"\n{'='*80}")
+    print(f"SWEEP FINISHED IN {(time.time() - sweep_start)/60:.1f} MINUTES")
+    print(f"{'='*80}")
+    if failed:
+        print(f"{len(failed)} jobs failed or were skipped (see {output_dir / SWEEP_LOG_DIR}):")
+        for job_id in sorted(failed):
+            print(f"  {job_id}: {state[job_id]['error']}")
+        print("Run the sweep again to retry them.")
+        return 1
+
+    write_metrics(jobs, state, data_info, output_dir)
+    return 0
+
+# main(main)
+if __name__ == "__main__":
+
+    exit(main())
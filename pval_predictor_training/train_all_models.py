@@ -25,6 +25,7 @@ Important things to note about the architecture:
    so we use it for all of our final tests.
 7. When running this code yourself, you may need to load the parquet file in chunks. we had access to
    supercompute via Sol so loading the entire 12m+ row DF in memory was fine for us.
+   On smaller machines set TRAINING_DATA_MODE = 'streaming' to stream row groups from the parquet files instead.
 8. DO NOT save position embeddings to the rows containing piece value data entries directly! This
    causes an explosion in file size (40+ GB).
 
@@ -42,6 +43,7 @@ Output:
 
 Usage:
     python train_all_models.py
+    torchrun --standalone --nproc_per_node=4 train_all_models.py   (data parallel, see DISTRIBUTED_BACKEND)
 
 """
 
@@ -51,7 +53,9 @@ import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import Dataset, DataLoader
+import torch.distributed as dist
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Dataset, DataLoader, BatchSampler, RandomSampler, SequentialSampler, DistributedSampler
 from sklearn.model_selection import train_test_split
 from pathlib import Path
 import json
@@ -60,8 +64,21 @@ import os
 import sys
 import chess
 from tqdm import tqdm
-import pickle
 import gc
+import hashlib
+import copy
+import functools
+import contextlib
+import weakref
+from multiprocessing import Pool
+try:
+    import resource # peak RSS (not on Windows)
+except ImportError:
+    resource = None
+from pval_train_val_split import load_folds, hash_strings
+from embedding_store import EmbeddingStore
+from streaming_dataset import (ParquetPieceValueSource, StreamingPieceValueDataset, UniqueFenListWriter, FenIndex,
+                               summarize_piece_values, scan_piece_value_files, fen_chunks, fen_list_hashes)
 
 # ========================================
 # GENERAL CONFIG
@@ -72,6 +89,125 @@ TRAINING_PARQUET = "train.parquet"
 VALIDATION_PARQUET = "val.parquet"
 OUTPUT_DIR = "output" # output files placed in this dir
 
+# Optional: read train/val from a fold dataset written by pval_train_val_split.py (SPLIT_MODE = "folds")
+# instead of TRAINING_PARQUET/VALIDATION_PARQUET. VAL_FOLDS are held out, all other folds are trained on.
+FOLD_DATASET_DIR = None # e.g. "pval_folds"
+VAL_FOLDS = [0]
+
+# Packed bitboard cache for CNN autoencoder training (12x64 bits per unique position)
+# Built once from the training FENs and reused by every encoder in CNN_LAYER_DEPTHS (and later runs)
+BITBOARD_CACHE_DIR = "bitboard_cache"
+BITBOARD_CACHE_WORKERS = os.cpu_count() or 1 # processes used to build the cache
+
+# With TRAINING_DATA_MODE = 'streaming' the unique train/val FENs are written here (one FEN per line) instead of
+# being kept in memory, only their 64-bit hashes stay in RAM (the bitboard cache and embedding stores read the file in chunks)
+UNIQUE_FENS_DIR = "unique_fens"
+
+# Feature cache for the piece location features of every split (piece type one-hot, rank/file, rank^2/file^2)
+# Computed once and saved as .npy files keyed by feature spec and a hash of the piece_type/rank/file columns.
+# The MLPs, CNN piece value heads and evaluation all read the same memmapped matrix (MLP #1 reads the first 12 columns)
+# None = compute the features every time a dataset is built (streamed shuffle buffers are never cached)
+FEATURE_CACHE_DIR = "feature_cache"
+
+# How piece location features are stored in the MLP/CNN piece value datasets
+# 'codes'  -> 3 int8 codes per row (piece type, rank, file), the first layer of the model looks up the weight column
+#             of the piece type and only multiplies the rank/file features (same weights and checkpoints as 'onehot')
+# 'onehot' -> 12/14 float32 features per row (10-dim piece type one-hot + rank/file features)
+PIECE_FEATURE_ENCODING = 'codes'
+
+# Where MLP/CNN piece value datasets live while training (whole batches are sliced at once)
+# 'device' -> on the GPU (fastest, needs the whole dataset to fit in GPU memory)
+# 'pinned' -> in CPU memory, batches gathered into pinned buffers and copied to the GPU asynchronously
+# 'none'   -> original per-sample DataLoader
+DATASET_TENSOR_PLACEMENT = 'pinned'
+
+# How piece value rows are read for MLP/CNN pval training
+# 'memory'    -> train/val DataFrames loaded whole (needs RAM for the full dataset, e.g. the 256 GB Sol nodes)
+# 'streaming' -> needed columns streamed from parquet row groups through a shuffle buffer, memory stays bounded
+#                (needs CNN_ENCODER_MODE = 'precomputed')
+TRAINING_DATA_MODE = 'memory'
+STREAM_SHUFFLE_BUFFER_ROWS = 2_000_000 # Rows shuffled together (per loader worker)
+STREAM_NUM_WORKERS = 0 # DataLoader worker processes reading row groups
+
+# How CNN piece value predictors get their position embeddings
+# 'precomputed' -> gathered from the saved embedding store of each encoder
+# 'frozen'      -> encoder runs on the fly (once per unique position in a batch), encoder weights fixed
+# 'finetune'    -> same as frozen but the encoder is trained together with the pval head (CNN_PIECEVAL_CONFIG['encoder_lr'])
+CNN_ENCODER_MODE = 'precomputed'
+
+# Train all CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS heads of an encoder together, one pass over the data per epoch
+# (batches are gathered/copied to the device once for all heads, each head keeps its own optimizer,
+# scheduler and early stopping and drops out of the loop when it stops)
+CNN_PIECEVAL_MULTI_HEAD = False
+
+# Full training state checkpoints (weights, optimizer, scheduler, early stopping and RNG state) saved to
+# OUTPUT_DIR/{model_name}_training_state.pth every CHECKPOINT_EVERY_EPOCHS epochs (0 = off), removed when training finishes.
+# With RESUME_TRAINING a killed run (preempted/time-limited SLURM job) continues after the last saved epoch
+CHECKPOINT_EVERY_EPOCHS = 1
+RESUME_TRAINING = True
+
+# Opt-in performance mode for all training loops (mostly for CPU-only nodes):
+# bf16 autocast (if the CPU/GPU supports it), channels_last weights/inputs for the conv stacks,
+# torch.compile of the models and PERF_NUM_THREADS intra-op threads (None = CPUs this process may use, e.g. the SLURM allocation)
+# Losses are still computed in fp32. Compare against fp32 with benchmark_perf_mode.py
+PERF_MODE = False
+PERF_AUTOCAST_DTYPE = 'bfloat16' # None = no autocast
+PERF_CHANNELS_LAST = True
+PERF_COMPILE = True
+PERF_NUM_THREADS = None
+
+# Data parallel training over several processes (CPU cores of one node, or several nodes) with torch.distributed.
+# Launch the script with torchrun instead of python, e.g. on one node:
+#     torchrun --standalone --nproc_per_node=4 train_all_models.py
+# or on every node of a multi-node job:
+#     torchrun --nnodes=2 --nproc_per_node=4 --rdzv_backend=c10d --rdzv_endpoint=<first node>:29500 train_all_models.py
+# Each rank trains on its shard of every batch (batch_size is split between the ranks, so the effective batch size
+# and learning rate stay the same), gradients are all-reduced and losses are averaged over the ranks, so early
+# stopping and LR schedules agree everywhere. Only rank 0 writes checkpoints/files and prints.
+# Covers the autoencoder, MLP and CNN pval loops with TRAINING_DATA_MODE = 'memory' and CNN_ENCODER_MODE = 'precomputed'
+DISTRIBUTED_BACKEND = 'gloo'
+DISTRIBUTED_SEED = 42 # Shuffle order shared by all ranks (changes every epoch)
+
+# Throughput instrumentation of every training loop, saved as 'throughput' in the metadata of each model in
+# all_models_metrics.json: seconds per epoch spent on data loading, host-to-device copies, forward, backward,
+# optimizer steps and validation, samples/sec and peak RSS (input-bound vs compute-bound at a glance).
+# On GPUs each phase waits for its kernels to finish so the split is accurate (costs a little speed).
+# Epochs listed in PROFILE_EPOCHS are also recorded with torch.profiler and saved as chrome traces
+# to OUTPUT_DIR/profiles/{model_name}_epoch{epoch}.json (open in chrome://tracing or ui.perfetto.dev)
+PROFILE_EPOCHS = [] # e.g. [2]
+
+# Validation policy of the MLP/CNN piece value loops (opt-in, off by default)
+# None -> the full val set is evaluated every epoch (the selected checkpoint is exactly the best full val loss)
+# N    -> every epoch is validated on a fixed subsample of N val rows (stratified by piece type), the full val set is
+#         only evaluated every VAL_FULL_EVERY_EPOCHS epochs and whenever the subsample losses are not worse than those
+#         of the best epoch by more than VAL_NOISE_STDS standard errors (i.e. the epoch may be a new best). Only full
+#         pass losses can make a checkpoint the best one, epochs without a full pass count as not improved for early
+#         stopping and the LR scheduler, and an epoch that would stop training or cut the LR always gets a full pass.
+# Tradeoff: this saves most of the validation time, but it can change which checkpoint is selected. Every epoch that is
+# a true new best has up to ~2.3% chance (VAL_NOISE_STDS = 2.0, one-sided) that its subsample looks worse by chance and its
+# full pass is skipped, and over hundreds of epochs those chances add up. Raise VAL_NOISE_STDS to make it rarer
+# (3.0 -> ~0.13% per epoch, with more full passes), and leave this off when checkpoints must match full validation.
+# Streamed val data and val sets under 2 * VAL_SUBSAMPLE_ROWS rows always get full passes.
+VAL_SUBSAMPLE_ROWS = None # e.g. 200_000
+VAL_FULL_EVERY_EPOCHS = 10
+VAL_NOISE_STDS = 2.0
+
+# Evaluation of all saved models (STEP 6): each split is read once, EVAL_CHUNK_ROWS rows at a time, and every
+# batch of EVAL_BATCH_SIZE rows is run through every model (embedding stores gathered and encoders run once per batch).
+# EVAL_STACK_WEIGHTS runs models with the same architecture as one vmapped call over their stacked weights (torch.func)
+# EVAL_BY_PIECE_TYPE adds the MAE of every piece type to the results
+EVAL_BATCH_SIZE = 8192
+EVAL_CHUNK_ROWS = 1_000_000
+EVAL_STACK_WEIGHTS = True
+EVAL_BY_PIECE_TYPE = True
+
+# Precision of saved CNN position embeddings ('float16' halves the store size, 'float32' for full precision)
+EMBEDDING_STORE_DTYPE = 'float16'
+
+# Embedding generation (precomputed mode): boards are decoded once into the packed bitboard cache of all train/val FENs
+# (by BITBOARD_CACHE_WORKERS processes), then EMBEDDING_BATCH_SIZE boards at a time go through every encoder in one pass
+EMBEDDING_BATCH_SIZE = 4096
+
 # Chunk size (in rows) for reading large parquet files 
 CHUNK_SIZE = 10000  # Set this or you will get many memory errors!
 
@@ -133,6 +269,7 @@ CHESSABLE_RESEARCH_2023_CONFIG = {
 CNN_PIECEVAL_CONFIG = {
     'batch_size': 1024,
     'lr': 0.001,
+    'encoder_lr': 0.0001, # only used when CNN_ENCODER_MODE = 'finetune'
     'weight_decay': 1e-4,
     'patience': 50
 }
@@ -274,6 +411,93 @@ def fen_to_board_tensor(fen):
     # Transpose to (12, 8, 8) for PyTorch
     return np.transpose(board_tensor, (2, 0, 1))
 
+# Lookup table for the batched FEN decoder
+# Byte value -> channel (12 = empty square, 255 = not a valid piece placement character)
+_FEN_BYTE_TO_CHANNEL = np.full(256, 255, dtype=np.uint8)
+_FEN_BYTE_TO_CHANNEL[ord('.')] = 12
+_FEN_BYTE_TO_CHANNEL[[ord(symbol) for symbol in PIECE_CHANNELS]] = list(PIECE_CHANNELS.values())
+
+def _expand_fen_placements(placements):
+    """Expand digits to that many empty squares ('.') and drop the '/' separators of joined placement fields"""
+    expanded = '/'.join(placements).encode('ascii')
+    for n in range(1, 9):
+        expanded = expanded.replace(str(n).encode(), b'.' * n)
+    return expanded.replace(b'/', b'')
+
+# Batched version of fen_to_board_tensor (no chess.Board, output is bit-identical)
+def fens_to_board_tensors(fens):
+    """Convert a list of FENs to a (N, 12, 8, 8) float32 board tensor array"""
+    num_fens = len(fens)
+
+    # Expand the piece placement fields of every FEN into one byte string of 64 squares per board
+    placements = [fen.split(' ', 1)[0] for fen in fens]
+    expanded = _expand_fen_placements(placements)
+    if len(expanded) != 64 * num_fens:
+        bad = [fen for fen, placement in zip(fens, placements) if len(_expand_fen_placements([placement])) != 64]
+        raise ValueError(f"Invalid FEN piece placement: {bad[:5]}")
+
+    # (N, 64) channel per square, FEN order is rank 8 -> rank 1 so flip ranks to put rank 1 at index 0
+    channels = _FEN_BYTE_TO_CHANNEL[np.frombuffer(expanded, dtype=np.uint8)].reshape(num_fens, 8, 8)
+    if (channels == 255).any():
+        bad = [fens[i] for i in np.unique(np.nonzero(channels == 255)[0])]
+        raise ValueError(f"Invalid FEN piece placement: {bad[:5]}")
+    channels = channels[:, ::-1, :].reshape(num_fens, 1, 64)
+
+    # One-hot over 13 channels (12 pieces + empty), then drop the empty channel
+    board_tensors = np.zeros((num_fens, 13, 64), dtype=np.float32)
+    np.put_along_axis(board_tensors, channels.astype(np.intp), 1.0, axis=1)
+    return np.ascontiguousarray(board_tensors[:, :12].reshape(num_fens, 12, 8, 8))
+
+# Helper functions to store 12x8x8 board tensors as 96 packed bytes (1 bit per square per channel)
+def pack_board_tensor(board_tensor):
+    """Pack a 12x8x8 board tensor into 96 uint8 (same channel/rank/file order)"""
+    return np.packbits(board_tensor.reshape(-1) > 0)
+
+def unpack_board_tensors(packed_boards):
+    """Unpack (batch, 96) uint8 into a (batch, 12, 8, 8) float32 array identical to fen_to_board_tensor"""
+    return np.unpackbits(packed_boards, axis=1).reshape(-1, 12, 8, 8).astype(np.float32)
+
+def _fill_bitboard_cache_chunk(args):
+    """Pool worker: pack the board tensors of one chunk of FENs into rows [start, start+len(fens)) of the cache"""
+    cache_file, num_fens, start, fens = args
+    packed = np.memmap(cache_file, dtype=np.uint8, mode='r+', shape=(num_fens, 96))
+    board_tensors = fens_to_board_tensors(fens)
+    packed[start:start + len(fens)] = np.packbits(board_tensors.reshape(len(fens), -1) > 0, axis=1)
+    packed.flush()
+    return len(fens)
+
+def load_bitboard_cache(fens, cache_dir=BITBOARD_CACHE_DIR, num_workers=BITBOARD_CACHE_WORKERS, chunk_size=10000):
+    """
+    Return a read-only (len(fens), 96) uint8 memmap of packed board tensors (row i is fens[i]).
+    fens is a list of FENs or a UniqueFenList (read in chunks while the cache is built).
+    The cache file is keyed by a hash of the FEN list, so it is only built the first time
+    (by rank 0 when distributed, the other ranks wait for it).
+    """
+    fen_list_hash = hashlib.blake2b(fen_list_hashes(fens).tobytes(), digest_size=8).hexdigest()
+    cache_path = Path(cache_dir)
+    cache_path.mkdir(exist_ok=True, parents=True)
+    cache_file = cache_path / f"bitboards_{len(fens)}_{fen_list_hash}.u8"
+
+    if not cache_file.exists() and is_main_process():
+        print(f"Building packed bitboard cache for {len(fens):,} positions with {num_workers} workers...")
+        build_start = time.time()
+        tmp_file = cache_path / (cache_file.name + ".tmp")
+        np.memmap(tmp_file, dtype=np.uint8, mode='w+', shape=(len(fens), 96)).flush()
+
+        # Generator, so FEN chunks are only read as fast as the pool takes them
+        tasks = ((str(tmp_file), len(fens), i * chunk_size, chunk) for i, chunk in enumerate(fen_chunks(fens, chunk_size)))
+        num_tasks = (len(fens) + chunk_size - 1) // chunk_size
+        with Pool(num_workers) as pool:
+            for _ in tqdm(pool.imap_unordered(_fill_bitboard_cache_chunk, tasks), total=num_tasks, desc="Packing positions"):
+                pass
+        os.replace(tmp_file, cache_file)
+        print(f"Saved {cache_file} ({len(fens) * 96 / 1e6:.1f} MB) in {time.time() - build_start:.1f}s")
+    else:
+        print(f"Using packed bitboard cache {cache_file}")
+    distributed_barrier()
+
+    return np.memmap(cache_file, dtype=np.uint8, mode='r', shape=(len(fens), 96))
+
 # Object to store chess positions
 class ChessPositionDataset(Dataset):
     """Dataset for chess positions (autoencoder training)"""
@@ -288,6 +512,25 @@ class ChessPositionDataset(Dataset):
         board_tensor = fen_to_board_tensor(fen)
         return torch.from_numpy(board_tensor)
 
+# Batched version of ChessPositionDataset that reads from the packed bitboard cache
+class PackedPositionBatchDataset(Dataset):
+    """
+    Dataset over rows of a packed bitboard cache (autoencoder training).
+    Indexed with a list of positions (use with a BatchSampler and batch_size=None),
+    returns the whole (batch, 12, 8, 8) float tensor unpacked at once.
+    """
+    def __init__(self, packed_boards, indices):
+        self.packed_boards = packed_boards
+        self.indices = np.asarray(indices)
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, batch_positions):
+        # Sorted rows read the memmap in order (order within a batch does not matter for the loss)
+        rows = np.sort(self.indices[batch_positions])
+        return torch.from_numpy(unpack_board_tensors(self.packed_boards[rows]))
+
 # Helper class to stop training in case of overfitting
 class EarlyStopping:
     """Early stopping to prevent overfitting"""
@@ -311,9 +554,399 @@ class EarlyStopping:
                 self.should_stop = True
         return self.should_stop
 
+    def state_dict(self):
+        return dict(vars(self))
+
+    def load_state_dict(self, state):
+        vars(self).update(state)
+
+# Helper function to check if device supports bf16 autocast
+def perf_autocast_supported(device):
+    if device.type == 'cuda':
+        return torch.cuda.is_bf16_supported()
+    try:
+        return bool(torch.ops.mkldnn._is_mkldnn_bf16_supported())
+    except (AttributeError, RuntimeError):
+        return False
+
+# Helper function to get the number of intra-op threads to use in PERF_MODE
+def perf_num_threads():
+    if PERF_NUM_THREADS:
+        return PERF_NUM_THREADS
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+# Helper class to apply PERF_MODE to the models of one training run
+class PerfMode:
+    """
+    Sets up models for PERF_MODE (channels_last conv weights, in place torch.compile which keeps state_dict
+    keys unchanged) and provides the autocast context for forward passes. Everything is a no-op without PERF_MODE.
+    """
+    def __init__(self, device, models):
+        self.enabled = PERF_MODE
+        self.device = device
+        self.autocast_dtype = None
+        self.channels_last = False
+        if not self.enabled:
+            return
+
+        if PERF_AUTOCAST_DTYPE and perf_autocast_supported(device):
+            self.autocast_dtype = getattr(torch, PERF_AUTOCAST_DTYPE)
+        for model in models:
+            if PERF_CHANNELS_LAST and any(isinstance(m, nn.Conv2d) for m in model.modules()):
+                model.to(memory_format=torch.channels_last)
+                self.channels_last = True
+            if PERF_COMPILE:
+                model.compile()
+
+    def autocast(self):
+        if self.autocast_dtype is None:
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=self.autocast_dtype)
+
+    def boards(self, boards):
+        """Board tensor batch in the memory format of the conv stacks"""
+        return boards.contiguous(memory_format=torch.channels_last) if self.channels_last else boards
+
+    def info(self):
+        return {
+            'enabled': self.enabled,
+            'autocast_dtype': PERF_AUTOCAST_DTYPE if self.autocast_dtype is not None else None,
+            'channels_last': self.channels_last,
+            'compile': self.enabled and PERF_COMPILE,
+            'num_threads': torch.get_num_threads(),
+        }
+
+# Helper class to time the phases of every training epoch
+class EpochTimer:
+    """
+    Collects per epoch phase times (see PROFILE_EPOCHS). Iterate the train loader through batches()
+    (times data loading and counts samples), wrap the other phases in phase(name) and call
+    start_epoch()/end_epoch() around each epoch. summary() goes into the model metadata.
+    """
+    PHASES = ('data', 'h2d', 'forward', 'backward', 'optimizer', 'validation')
+
+    def __init__(self, device, profile_dir=None, model_name="model"):
+        self.device = device
+        self.profile_dir = Path(profile_dir) if profile_dir is not None else None
+        self.model_name = model_name
+        self.epochs = []
+        self.profiles = []
+        self.profiler = None
+
+    def _sync(self):
+        if self.device.type == 'cuda':
+            torch.cuda.synchronize(self.device)
+
+    def start_epoch(self, epoch):
+        self.epoch = epoch
+        self.times = dict.fromkeys(self.PHASES, 0.0)
+        self.samples = 0
+        if epoch in PROFILE_EPOCHS and self.profile_dir is not None:
+            activities = [torch.profiler.ProfilerActivity.CPU]
+            if self.device.type == 'cuda':
+                activities.append(torch.profiler.ProfilerActivity.CUDA)
+            self.profiler = torch.profiler.profile(activities=activities)
+            self.profiler.start()
+        self._sync()
+        self.epoch_start = time.perf_counter()
+
+    def batches(self, loader):
+        """Yield the batches of loader, timing how long each one takes to arrive"""
+        batch_iter = iter(loader)
+        while True:
+            start = time.perf_counter()
+            with self._record('data'):
+                batch = next(batch_iter, None)
+            self.times['data'] += time.perf_counter() - start
+            if batch is None:
+                return
+            self.samples += len(batch[-1]) if isinstance(batch, (tuple, list)) else len(batch)
+            yield batch
+
+    def _record(self, name):
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return torch.profiler.record_function(name)
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        with self._record(name):
+            yield
+            self._sync()
+        self.times[name] += time.perf_counter() - start
+
+    def end_epoch(self):
+        """Finish the epoch, returns its record"""
+        self._sync()
+        seconds = time.perf_counter() - self.epoch_start
+        train_seconds = seconds - self.times['validation']
+        record = {
+            'epoch': self.epoch,
+            'seconds': seconds,
+            **{f"{name}_seconds": t for name, t in self.times.items()},
+            'other_seconds': seconds - sum(self.times.values()),
+            'samples': self.samples,
+            'samples_per_sec': self.samples / train_seconds if train_seconds > 0 else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        if self.device.type == 'cuda':
+            record['peak_gpu_memory_mb'] = torch.cuda.max_memory_allocated(self.device) / 2**20
+
+        if self.profiler is not None:
+            self.profiler.stop()
+            if is_main_process():
+                self.profile_dir.mkdir(exist_ok=True, parents=True)
+                trace_file = self.profile_dir / f"{self.model_name}_epoch{self.epoch}.json"
+                self.profiler.export_chrome_trace(str(trace_file))
+                self.profiles.append(str(trace_file))
+                print(f"Saved torch.profiler trace to {trace_file}")
+            self.profiler = None
+
+        self.epochs.append(record)
+        return record
+
+    def summary(self):
+        """Per epoch records plus totals and the share of training time spent waiting for input"""
+        totals = {f"{name}_seconds": sum(e[f"{name}_seconds"] for e in self.epochs) for name in self.PHASES}
+        train_seconds = sum(e['seconds'] for e in self.epochs) - totals['validation_seconds']
+        input_seconds = totals['data_seconds'] + totals['h2d_seconds']
+        input_fraction = input_seconds / train_seconds if train_seconds > 0 else 0.0
+        return {
+            'totals': totals,
+            'samples_per_sec': sum(e['samples'] for e in self.epochs) / train_seconds if train_seconds > 0 else 0.0,
+            'peak_rss_mb': max((e['peak_rss_mb'] for e in self.epochs if e['peak_rss_mb'] is not None), default=None),
+            'input_fraction': input_fraction,
+            'bound': 'input' if input_fraction > 0.5 else 'compute',
+            'profiles': self.profiles,
+            'epochs': self.epochs,
+        }
+
+    def describe(self):
+        summary = self.summary()
+        peak_rss = f", peak RSS {summary['peak_rss_mb']:,.0f} MB" if summary['peak_rss_mb'] is not None else ""
+        return (f"{summary['samples_per_sec']:,.0f} samples/s, {summary['input_fraction']:.0%} of training time "
+                f"loading/copying data ({summary['bound']}-bound){peak_rss}")
+
+# Helper function to get the peak resident memory of this process so far (MB)
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10 # bytes on macOS, KB on Linux
+
+# Helper function to get the fixed validation subsample of a val set
+def validation_subsample(val_df, seed=42):
+    """VAL_SUBSAMPLE_ROWS rows of val_df stratified by piece type, or None to always validate on the full set"""
+    if not VAL_SUBSAMPLE_ROWS or isinstance(val_df, ParquetPieceValueSource) or len(val_df) < 2 * VAL_SUBSAMPLE_ROWS:
+        return None
+    return val_df.groupby('piece_type', group_keys=False).sample(frac=VAL_SUBSAMPLE_ROWS / len(val_df), random_state=seed)
+
+# Helper function to run one validation pass
+def validation_losses(loader, batch_losses, num_losses=1):
+    """
+    batch_losses(batch) returns num_losses losses (one per model validated together).
+    Returns the mean batch loss of each model (over all ranks) and the (num_batches, num_losses) losses of this rank.
+    """
+    local_losses = np.asarray([batch_losses(batch) for batch in loader], dtype=np.float64).reshape(-1, num_losses)
+    totals = np.append(local_losses.sum(axis=0), len(local_losses))
+    if distributed_world()[1] > 1:
+        totals_tensor = torch.from_numpy(totals)
+        dist.all_reduce(totals_tensor)
+        totals = totals_tensor.numpy()
+    return totals[:-1] / totals[-1], local_losses
+
+# Helper class to decide when a model needs a full validation pass
+class ValidationPolicy:
+    """
+    Validation plan of one model (see VAL_SUBSAMPLE_ROWS).
+    The subsample is fixed, so its batches line up between epochs: an epoch may be a new best unless its
+    subsample batch losses are worse than those of the current best epoch by more than VAL_NOISE_STDS standard
+    errors of the paired (per batch) difference. run() validates an epoch and returns (full val loss or None,
+    subsample loss or None), use monitored_loss() of the full loss for early stopping and the LR scheduler.
+    Pass decision_due() so epochs that decide early stopping or an LR cut always get a full pass.
+    """
+    def __init__(self, val_loader, subsample_loader=None):
+        self.val_loader = val_loader
+        self.subsample_loader = subsample_loader
+        self.best_val_loss = float('inf')
+        self.best_batch_losses = None # subsample batch losses of the best epoch (this rank's batches)
+
+    def full_pass(self, epoch, subsample_batch_losses=None, decision_due=False):
+        """True if the epoch may be a new best, is due for a periodic full pass or decides early stopping/the LR"""
+        if subsample_batch_losses is None or self.best_batch_losses is None or decision_due:
+            return True
+        diff = subsample_batch_losses - self.best_batch_losses
+        totals = np.array([diff.sum(), (diff ** 2).sum(), len(diff)])
+        if distributed_world()[1] > 1:
+            totals_tensor = torch.from_numpy(totals)
+            dist.all_reduce(totals_tensor)
+            totals = totals_tensor.numpy()
+        mean_diff = totals[0] / totals[2]
+        std_error = np.sqrt(max(totals[1] / totals[2] - mean_diff ** 2, 0.0) / totals[2])
+        return mean_diff <= VAL_NOISE_STDS * std_error or epoch % VAL_FULL_EVERY_EPOCHS == 0
+
+    def update(self, val_loss, subsample_batch_losses=None):
+        """Record the full pass loss of an epoch"""
+        if val_loss is not None and val_loss < self.best_val_loss:
+            self.best_val_loss = val_loss
+            self.best_batch_losses = subsample_batch_losses
+
+    def run(self, epoch, batch_losses, decision_due=False):
+        subsample_loss = subsample_batch_losses = None
+        if self.subsample_loader is not None:
+            (subsample_loss,), subsample_batch_losses = validation_losses(self.subsample_loader, batch_losses)
+            subsample_batch_losses = subsample_batch_losses[:, 0]
+        val_loss = None
+        if self.full_pass(epoch, subsample_batch_losses, decision_due):
+            (val_loss,), _ = validation_losses(self.val_loader, batch_losses)
+        self.update(val_loss, subsample_batch_losses)
+        return val_loss, subsample_loss
+
+    # True if an epoch without improvement would stop training or make the scheduler cut the LR
+    @staticmethod
+    def decision_due(early_stopping, scheduler):
+        stops = early_stopping.counter + 1 >= early_stopping.patience
+        cuts_lr = scheduler.cooldown_counter == 0 and scheduler.num_bad_epochs + 1 > scheduler.patience
+        return stops or cuts_lr
+
+    # Epochs without a full pass are never an improvement
+    @staticmethod
+    def monitored_loss(val_loss):
+        return float('inf') if val_loss is None else val_loss
+
+    @staticmethod
+    def describe(val_loss, subsample_loss):
+        """Loss shown in the epoch log"""
+        if val_loss is None:
+            return f"{subsample_loss:.6f} (subsample)"
+        return f"{val_loss:.6f}"
+
+    # Batch losses are per rank, a resumed distributed run does full passes until its next best epoch
+    def state_dict(self):
+        return {'best_val_loss': self.best_val_loss, 'best_batch_losses': self.best_batch_losses,
+                'world_size': distributed_world()[1]}
+
+    def load_state_dict(self, state):
+        self.best_val_loss = state['best_val_loss']
+        if state['world_size'] == 1 and distributed_world()[1] == 1:
+            self.best_batch_losses = state['best_batch_losses']
+
+# Helper function to save the full training state of a model (written to a temp file first, so a job
+# killed while saving never leaves a broken state behind)
+def save_training_state(state_file, epoch, components, signature, **extra):
+    """
+    components is {name: object with state_dict()} (models, optimizers, schedulers, early stopping),
+    signature is the config the state belongs to and extra holds any other values to restore (best loss, ...)
+    """
+    state = {
+        'epoch': epoch,
+        'signature': signature,
+        'components': {name: component.state_dict() for name, component in components.items()},
+        'torch_rng': torch.get_rng_state(),
+        'cuda_rng': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else None,
+        'numpy_rng': np.random.get_state(),
+        'extra': extra,
+    }
+    tmp_file = state_file.with_name(state_file.name + ".tmp")
+    torch.save(state, tmp_file)
+    os.replace(tmp_file, state_file)
+
+# Helper function to resume from a saved training state
+def load_training_state(state_file, components, signature):
+    """
+    Restore components and RNG state from state_file.
+    Returns (last finished epoch, extra), or (0, None) if there is no state to resume (or it is for another config).
+    """
+    if not RESUME_TRAINING or not state_file.exists():
+        return 0, None
+    state = torch.load(state_file, map_location='cpu', weights_only=False)
+    if state['signature'] != signature:
+        print(f"Ignoring {state_file} (saved with a different config)\n")
+        return 0, None
+
+    for name, component in components.items():
+        component.load_state_dict(state['components'][name])
+    torch.set_rng_state(state['torch_rng'])
+    if state['cuda_rng'] is not None and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda_rng'])
+    np.random.set_state(state['numpy_rng'])
+
+    print(f"Resuming from {state_file} after epoch {state['epoch']}\n")
+    return state['epoch'], state['extra']
+
+# Helper function to remove the training state once the final model is saved
+def clear_training_state(state_file):
+    if state_file.exists():
+        state_file.unlink()
+
+# Helper function to join the process group when launched by torchrun (no-op for a plain python run)
+def init_distributed():
+    """Returns (rank, world_size), (0, 1) without torchrun"""
+    if int(os.environ.get('WORLD_SIZE', '1')) <= 1:
+        return 0, 1
+    dist.init_process_group(backend=DISTRIBUTED_BACKEND)
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+
+    # Split the CPUs of this node between its ranks (torchrun sets OMP_NUM_THREADS=1 otherwise)
+    local_world_size = int(os.environ.get('LOCAL_WORLD_SIZE', world_size))
+    torch.set_num_threads(max(1, perf_num_threads() // local_world_size))
+
+    # Only rank 0 prints
+    if rank != 0:
+        sys.stdout = open(os.devnull, 'w')
+    return rank, world_size
+
+# Helper function to get (rank, world_size) of this process
+def distributed_world():
+    if dist.is_available() and dist.is_initialized():
+        return dist.get_rank(), dist.get_world_size()
+    return 0, 1
+
+# Helper function to check if this process writes files (rank 0, or the only process)
+def is_main_process():
+    return distributed_world()[0] == 0
+
+# Helper function to wait until all ranks get here (e.g. for a file written by rank 0)
+def distributed_barrier():
+    if distributed_world()[1] > 1:
+        dist.barrier()
+
+# Helper function to average a loss summed over num_batches batches of each rank (same result on every rank)
+def distributed_mean(total, num_batches):
+    if distributed_world()[1] > 1:
+        sums = torch.tensor([total, num_batches], dtype=torch.float64)
+        dist.all_reduce(sums)
+        total, num_batches = sums.tolist()
+    return total / num_batches
+
+# Helper function to wrap a model so its gradients are all-reduced in backward (the model itself when not distributed)
+def distributed_model(model):
+    if distributed_world()[1] > 1:
+        return DistributedDataParallel(model)
+    return model
+
+# Helper function to get the per rank batch size of a batch_size batch split between all ranks
+def local_batch_size(batch_size):
+    world_size = distributed_world()[1]
+    return (batch_size + world_size - 1) // world_size
+
+# Helper function to reshuffle a sharded loader for epoch (every rank draws the same order)
+def set_loader_epoch(loader, epoch):
+    sampler = getattr(loader, 'sampler', loader)
+    sampler = getattr(sampler, 'sampler', sampler) # BatchSampler -> its sampler
+    if hasattr(sampler, 'set_epoch'):
+        sampler.set_epoch(epoch)
+
 # Function to train CNN position autoencoder
-def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=512, num_layers=4, model_name="cnn"):
-    """Train CNN position encoder using autoencoder approach"""
+def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=512, num_layers=4, model_name="cnn",
+                               bitboards=None):
+    """
+    Train CNN position encoder using autoencoder approach.
+    bitboards is the packed bitboard cache of unique_fens (loaded/built here if not given).
+    """
     print(f"\n{'='*60}")
     print(f"TRAINING CNN POSITION ENCODER: {model_name}")
     print(f"{'='*60}")
@@ -328,23 +961,38 @@ def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=51
 
     start_time = time.time()
 
-    # Split data into 80/20 train/val with random_state=42
-    train_fens, val_fens = train_test_split(unique_fens, test_size=0.2, random_state=42)
-    print(f"Training positions: {len(train_fens):,}")
-    print(f"Validation positions: {len(val_fens):,}\n")
+    # Decode every position once instead of once per sample per epoch
+    if bitboards is None:
+        bitboards = load_bitboard_cache(unique_fens)
+
+    # Split data into 80/20 train/val with random_state=42 (same positions as splitting the FEN list)
+    train_idx, val_idx = train_test_split(np.arange(len(unique_fens)), test_size=0.2, random_state=42)
+    print(f"Training positions: {len(train_idx):,}")
+    print(f"Validation positions: {len(val_idx):,}\n")
 
-    train_dataset = ChessPositionDataset(train_fens)
-    val_dataset = ChessPositionDataset(val_fens)
+    train_dataset = PackedPositionBatchDataset(bitboards, train_idx)
+    val_dataset = PackedPositionBatchDataset(bitboards, val_idx)
 
-    # Load training and validation data
-    train_loader = DataLoader(train_dataset, batch_size=config['batch_size'],
-                             shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=config['batch_size'], num_workers=0)
+    # Load training and validation data (one dataset call per batch)
+    # Distributed: every rank gets its shard of the positions (same shuffle on every rank, see set_loader_epoch)
+    if distributed_world()[1] > 1:
+        train_sampler = DistributedSampler(train_dataset, shuffle=True, seed=DISTRIBUTED_SEED)
+        val_sampler = DistributedSampler(val_dataset, shuffle=False)
+    else:
+        train_sampler, val_sampler = RandomSampler(train_dataset), SequentialSampler(val_dataset)
+    batch_size = local_batch_size(config['batch_size'])
+    train_loader = DataLoader(train_dataset, batch_size=None, num_workers=0,
+                              sampler=BatchSampler(train_sampler, batch_size, drop_last=False))
+    val_loader = DataLoader(val_dataset, batch_size=None, num_workers=0,
+                            sampler=BatchSampler(val_sampler, batch_size, drop_last=False))
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}\n")
 
     model = ChessAutoencoder(embedding_dim=embedding_dim, num_layers=num_layers).to(device)
+    perf = PerfMode(device, [model])
+    train_model = distributed_model(model)
+    timer = EpochTimer(device, Path(output_dir) / "profiles", model_name)
     optimizer = optim.Adam(model.parameters(), lr=config['lr'])
     criterion = nn.BCELoss()
 
@@ -359,47 +1007,69 @@ def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=51
     output_path = Path(output_dir)
     output_path.mkdir(exist_ok=True, parents=True)
 
-    # Training loop
-    for epoch in range(1, config['max_epochs'] + 1):
+    # Resume an interrupted run
+    state_file = output_path / f"{model_name}_training_state.pth"
+    state_components = {'model': model, 'optimizer': optimizer, 'scheduler': scheduler, 'early_stopping': early_stopping}
+    state_signature = {'config': config, 'embedding_dim': embedding_dim, 'num_layers': num_layers,
+                       'unique_positions': len(unique_fens)}
+    start_epoch, resumed = load_training_state(state_file, state_components, state_signature)
+    if resumed is not None:
+        best_val_loss, best_epoch = resumed['best_val_loss'], resumed['best_epoch']
+        start_time -= resumed['elapsed_time']
+        timer.epochs = resumed.get('epoch_timing', [])
+
+    # Training loop (epoch stays start_epoch if a resumed run had already finished its last epoch)
+    epoch = start_epoch
+    for epoch in range(start_epoch + 1, config['max_epochs'] + 1):
         epoch_start = time.time()
+        timer.start_epoch(epoch)
 
         # Train the CNN position autoencoder on train set
         model.train()
+        set_loader_epoch(train_loader, epoch)
         train_loss = 0
-        for board in train_loader:
-            board = board.to(device)
+        for board in timer.batches(train_loader):
+            with timer.phase('h2d'):
+                board = perf.boards(board.to(device))
             optimizer.zero_grad()
-            reconstruction, _ = model(board)
-            loss = criterion(reconstruction, board)
-            loss.backward()
-            optimizer.step()
+            with timer.phase('forward'):
+                with perf.autocast():
+                    reconstruction, _ = train_model(board)
+                loss = criterion(reconstruction.float(), board)
+            with timer.phase('backward'):
+                loss.backward()
+            with timer.phase('optimizer'):
+                optimizer.step()
             train_loss += loss.item()
 
-        train_loss /= len(train_loader)
+        train_loss = distributed_mean(train_loss, len(train_loader))
 
         # Validate against val set
         model.eval()
         val_loss = 0
-        with torch.no_grad():
+        with timer.phase('validation'), torch.no_grad():
             for board in val_loader:
-                board = board.to(device)
-                reconstruction, _ = model(board)
-                loss = criterion(reconstruction, board)
+                board = perf.boards(board.to(device))
+                with perf.autocast():
+                    reconstruction, _ = model(board)
+                loss = criterion(reconstruction.float(), board)
                 val_loss += loss.item()
 
-        val_loss /= len(val_loader)
+        val_loss = distributed_mean(val_loss, len(val_loader))
 
         epoch_time = time.time() - epoch_start
+        timing = timer.end_epoch()
 
         # Save best model (if val_loss is less than the previous best model)
         if val_loss < best_val_loss:
             best_val_loss = val_loss
             best_epoch = epoch
-            torch.save(model.state_dict(), output_path / f"best_{model_name}_autoencoder_checkpoint.pth")
-            torch.save(model.encoder.state_dict(), output_path / f"best_{model_name}_encoder.pth")
+            if is_main_process():
+                torch.save(model.state_dict(), output_path / f"best_{model_name}_autoencoder_checkpoint.pth")
+                torch.save(model.encoder.state_dict(), output_path / f"best_{model_name}_encoder.pth")
 
         # Print out epoch information
-        print(f"Epoch {epoch:3d}/{config['max_epochs']} ({epoch_time:.1f}s) - "
+        print(f"Epoch {epoch:3d}/{config['max_epochs']} ({epoch_time:.1f}s, {timing['samples_per_sec']:,.0f} samples/s) - "
               f"Train Loss: {train_loss:.6f} | Val Loss: {val_loss:.6f} | "
               f"Best: {best_val_loss:.6f} (epoch {best_epoch})")
 
@@ -411,13 +1081,22 @@ def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=51
             print(f"Best model was at epoch {best_epoch}\n")
             break
 
+        if CHECKPOINT_EVERY_EPOCHS and epoch % CHECKPOINT_EVERY_EPOCHS == 0 and is_main_process():
+            save_training_state(state_file, epoch, state_components, state_signature, best_val_loss=best_val_loss,
+                                best_epoch=best_epoch, elapsed_time=time.time() - start_time,
+                                epoch_timing=timer.epochs)
+
     # Load best model
+    distributed_barrier()
     model.load_state_dict(torch.load(output_path / f"best_{model_name}_autoencoder_checkpoint.pth"))
 
     elapsed_time = time.time() - start_time
 
     # Save final position encoder
-    torch.save(model.encoder.state_dict(), output_path / f"{model_name}_encoder.pth")
+    if is_main_process():
+        torch.save(model.encoder.state_dict(), output_path / f"{model_name}_encoder.pth")
+        clear_training_state(state_file)
+    distributed_barrier()
 
     metadata = {
         'model_type': 'cnn_position_encoder',
@@ -425,11 +1104,14 @@ def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=51
         'embedding_dim': embedding_dim,
         'num_layers': num_layers,
         'unique_positions': len(unique_fens),
-        'training_positions': len(train_fens),
-        'validation_positions': len(val_fens),
+        'training_positions': len(train_idx),
+        'validation_positions': len(val_idx),
         'best_epoch': best_epoch,
         'best_val_loss': float(best_val_loss),
         'training_time_seconds': elapsed_time,
+        'epochs_trained': epoch,
+        'perf_mode': perf.info(),
+        'throughput': timer.summary(),
         'config': config
     }
 
@@ -439,6 +1121,7 @@ def train_cnn_position_encoder(unique_fens, config, output_dir, embedding_dim=51
     print(f"Training time: {elapsed_time/60:.1f} minutes")
     print(f"Best epoch: {best_epoch}")
     print(f"Best val loss: {best_val_loss:.6f}")
+    print(f"Throughput: {timer.describe()}")
     print(f"{'='*60}\n")
 
     return model.encoder, metadata
@@ -469,39 +1152,129 @@ class SimplePieceValueMLP(nn.Module):
         self.mlp = nn.Sequential(*layers)
 
     def forward(self, x):
+        # Integer input: piece location codes (PIECE_FEATURE_ENCODING = 'codes') instead of dense features
+        if not x.is_floating_point():
+            return self.mlp[1:](piece_code_linear(self.mlp[0], x))
         return self.mlp(x)
 
+# Piece types of the one-hot piece type features (kings excluded)
+PIECE_TYPES = ['p', 'P', 'n', 'N', 'b', 'B', 'r', 'R', 'q', 'Q']
+PIECE_LOCATION_FEATURE_SPEC = "pieceloc14_v1" # Change when piece_location_features changes (invalidates the feature cache)
+PIECE_LOCATION_CODE_SPEC = "piececodes3_v1" # Same for piece_location_codes
+
+# Helper function to build the 14-dim piece location features of piece value rows
+def piece_location_features(df):
+    """
+    (rows, 14) float32: piece type one-hot, rank, file, rank^2, file^2 (ranks/files scaled to [0, 1]).
+    The same as the MLP #2 features, the first 12 columns are the MLP #1 features.
+    """
+    piece_type_onehot = np.zeros((len(df), len(PIECE_TYPES)), dtype=np.float32)
+
+    # Initialize one-hot vector
+    for i, piece_type in enumerate(PIECE_TYPES):
+        piece_type_onehot[:, i] = (df['piece_type'] == piece_type).astype(np.float32)
+
+    # Normalize piece rank/file
+    ranks = (df['rank'].values / 7.0).astype(np.float32).reshape(-1, 1)
+    files = (df['file'].values / 7.0).astype(np.float32).reshape(-1, 1)
+
+    # Also include rank^2 and file^2 (for fun) in piece location vector
+    return np.concatenate([
+        piece_type_onehot,
+        ranks,
+        files,
+        ranks**2,
+        files**2
+    ], axis=1)
+
+# Helper function to build the compact int8 piece location codes of piece value rows
+def piece_location_codes(df):
+    """
+    (rows, 3) int8: piece type (index into PIECE_TYPES, len(PIECE_TYPES) for any other piece), rank, file.
+    Holds the same information as piece_location_features in 3 bytes instead of 56 per row.
+    """
+    codes = np.empty((len(df), 3), dtype=np.int8)
+    piece_codes = pd.Categorical(df['piece_type'], categories=PIECE_TYPES).codes
+    codes[:, 0] = np.where(piece_codes < 0, len(PIECE_TYPES), piece_codes)
+    codes[:, 1] = df['rank'].values
+    codes[:, 2] = df['file'].values
+    return codes
+
+# Helper function to compute a first linear layer from piece location codes
+def piece_code_linear(linear, codes, dense_input=None):
+    """
+    Same output as linear(cat([dense_input, piece location features])) with the piece location features given as
+    piece_location_codes: the one-hot piece type becomes a lookup of its weight column (an embedding over the
+    transposed weight) and only the rank/file features are multiplied. Any other piece type gets a zero column.
+    """
+    codes = codes.long()
+    offset = 0 if dense_input is None else dense_input.shape[1]
+    num_location_features = linear.in_features - offset - len(PIECE_TYPES) # 2 (rank/file) or 4 (with rank^2/file^2)
+
+    # Rank/file features exactly as in piece_location_features
+    ranks = codes[:, 1:2].float() / 7.0
+    files = codes[:, 2:3].float() / 7.0
+    location = torch.cat([ranks, files, ranks**2, files**2], dim=1)[:, :num_location_features]
+
+    piece_weight = nn.functional.pad(linear.weight[:, offset:offset + len(PIECE_TYPES)], (0, 1))
+    out = nn.functional.linear(location, linear.weight[:, offset + len(PIECE_TYPES):], linear.bias)
+    out = out + nn.functional.embedding(codes[:, 0], piece_weight.t())
+    if dense_input is not None:
+        out = out + nn.functional.linear(dense_input, linear.weight[:, :offset])
+    return out
+
+# Memmapped features of the DataFrames used in this process {(id(df), spec): (weakref to df, features)}
+_feature_cache_memo = {}
+
+# Helper function to get the piece location features (or codes) of a split from the feature cache
+def load_piece_location_features(df, codes=False):
+    """
+    piece_location_features(df) (piece_location_codes(df) if codes) read from FEATURE_CACHE_DIR (computed and saved
+    the first time). Files are keyed by the feature spec and a hash of the piece_type/rank/file columns and opened as
+    copy-on-write memmaps, so every dataset built from the same split shares one copy of the matrix.
+    """
+    build_features = piece_location_codes if codes else piece_location_features
+    spec = PIECE_LOCATION_CODE_SPEC if codes else PIECE_LOCATION_FEATURE_SPEC
+    if FEATURE_CACHE_DIR is None or len(df) == 0:
+        return build_features(df)
+    memo = _feature_cache_memo.get((id(df), spec))
+    if memo is not None and memo[0]() is df and len(memo[1]) == len(df):
+        return memo[1]
+
+    digest = hashlib.blake2b(digest_size=8)
+    digest.update(hash_strings(df['piece_type']).tobytes())
+    for column in ['rank', 'file']:
+        digest.update(np.ascontiguousarray(df[column].values, dtype=np.int64).tobytes())
+    cache_path = Path(FEATURE_CACHE_DIR)
+    cache_path.mkdir(exist_ok=True, parents=True)
+    cache_file = cache_path / f"{spec}_{len(df)}_{digest.hexdigest()}.npy"
+
+    if not cache_file.exists():
+        # Every rank may build it, the file is only replaced by an identical one
+        build_start = time.time()
+        tmp_file = cache_path / f"{cache_file.name}.{os.getpid()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            np.save(f, build_features(df))
+        os.replace(tmp_file, cache_file)
+        print(f"Saved piece location {'codes' if codes else 'features'} to {cache_file} in {time.time() - build_start:.1f}s")
+
+    features = np.load(cache_file, mmap_mode='c')
+    _feature_cache_memo[(id(df), spec)] = (weakref.ref(df), features)
+    return features
+
 # Object to store values in pval dataset
 class SimplePieceValueDataset(Dataset):
     """Dataset for simple MLP piece value prediction"""
-    def __init__(self, df, include_quadratic=False):
-        # Extract features
-        piece_types = ['p', 'P', 'n', 'N', 'b', 'B', 'r', 'R', 'q', 'Q']
-        piece_type_onehot = np.zeros((len(df), len(piece_types)), dtype=np.float32)
-
-        # Convert piece type to one-hot vector
-        for i, piece_type in enumerate(piece_types):
-            piece_type_onehot[:, i] = (df['piece_type'] == piece_type).astype(np.float32)
-
-        # Normalize rank/files for each piece value entry
-        ranks = (df['rank'].values / 7.0).astype(np.float32)
-        files = (df['file'].values / 7.0).astype(np.float32)
-
-        # Add normalized rank^2 and file^2 for each entry if training requires it
-        if include_quadratic:
-            self.features = np.concatenate([
-                piece_type_onehot,
-                ranks.reshape(-1, 1),
-                files.reshape(-1, 1),
-                (ranks**2).reshape(-1, 1),
-                (files**2).reshape(-1, 1)
-            ], axis=1).astype(np.float32)
+    def __init__(self, df, include_quadratic=False, feature_cache=True):
+        # Extract features (piece type one-hot + normalized rank/file, plus rank^2 and file^2 if training requires it)
+        # A view of the cached features of df, unless feature_cache=False (e.g. streamed shuffle buffers)
+        if PIECE_FEATURE_ENCODING == 'codes':
+            # int8 codes, the model builds the features it needs in its first layer
+            self.features = load_piece_location_features(df, codes=True) if feature_cache else piece_location_codes(df)
         else:
-            self.features = np.concatenate([
-                piece_type_onehot,
-                ranks.reshape(-1, 1),
-                files.reshape(-1, 1)
-            ], axis=1).astype(np.float32)
+            num_features = 14 if include_quadratic else 12
+            features = load_piece_location_features(df) if feature_cache else piece_location_features(df)
+            self.features = features[:, :num_features]
 
         self.values = df['piece_value'].values.astype(np.float32)
 
@@ -514,6 +1287,136 @@ class SimplePieceValueDataset(Dataset):
             torch.tensor([self.values[idx]], dtype=torch.float32)
         )
 
+    def as_tensors(self):
+        """Whole dataset as contiguous tensors (same layout as a collated batch)"""
+        return (
+            torch.from_numpy(self.features),
+            torch.from_numpy(self.values).reshape(-1, 1)
+        )
+
+# Loader that slices whole batches out of tensors that already hold the full dataset
+class TensorBatchLoader:
+    """
+    Drop-in replacement for DataLoader over a dataset with as_tensors().
+    Each batch is one index (or slice) into every tensor, so there is no per-sample overhead.
+    With embedding_table set, the first tensor holds row indices into it and is replaced by the
+    gathered (float32) embedding rows of each batch.
+    With pin_device set, batches are copied into two alternating pinned buffers and moved to that
+    device asynchronously.
+    With world_size > 1 the loader only yields the rows of shard rank: a contiguous block of rows without
+    shuffle, otherwise every rank draws the same permutation (seeded by set_epoch) and takes every
+    world_size-th row of it, padded so all ranks get the same number of batches.
+    """
+    def __init__(self, tensors, batch_size, shuffle=False, pin_device=None, embedding_table=None,
+                 rank=0, world_size=1):
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.pin_device = pin_device
+        self.embedding_table = embedding_table
+        self.rank = rank
+        self.world_size = world_size
+        self.epoch = 0
+        if world_size > 1 and not shuffle:
+            bounds = np.linspace(0, len(tensors[0]), world_size + 1).astype(int)
+            tensors = tuple(t[bounds[rank]:bounds[rank + 1]] for t in tensors)
+        self.tensors = tensors
+        self.num_samples = len(tensors[0])
+        self.pinned_buffers = None
+
+    def __len__(self):
+        return (self._rank_samples() + self.batch_size - 1) // self.batch_size
+
+    def _rank_samples(self):
+        if self.shuffle and self.world_size > 1:
+            return (self.num_samples + self.world_size - 1) // self.world_size
+        return self.num_samples
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _gather_embeddings(self, position_idx):
+        if isinstance(self.embedding_table, torch.Tensor):
+            return self.embedding_table[position_idx.long()].float()
+        # numpy array or memmap (store on disk)
+        return torch.from_numpy(np.asarray(self.embedding_table[position_idx.numpy()], dtype=np.float32))
+
+    def __iter__(self):
+        num_samples = self._rank_samples()
+        if self.shuffle and self.world_size > 1:
+            generator = torch.Generator().manual_seed(DISTRIBUTED_SEED + self.epoch)
+            order = torch.randperm(self.num_samples, generator=generator)
+            order = order.repeat(-(-num_samples * self.world_size // self.num_samples))
+            order = order[self.rank:num_samples * self.world_size:self.world_size].to(self.tensors[0].device)
+        elif self.shuffle:
+            order = torch.randperm(self.num_samples, device=self.tensors[0].device)
+        for batch_num, start in enumerate(range(0, num_samples, self.batch_size)):
+            end = min(start + self.batch_size, num_samples)
+            if self.shuffle:
+                batch_idx = order[start:end]
+                batch = [t[batch_idx] for t in self.tensors]
+            else:
+                batch = [t[start:end] for t in self.tensors]
+            if self.embedding_table is not None:
+                batch[0] = self._gather_embeddings(batch[0])
+
+            if self.pin_device is None:
+                yield tuple(batch)
+                continue
+
+            if self.pinned_buffers is None:
+                self.pinned_buffers = [
+                    [torch.empty((self.batch_size,) + b.shape[1:], dtype=b.dtype).pin_memory() for b in batch]
+                    for _ in range(2)
+                ]
+            # The buffer used two batches ago is free again (its step has finished by now)
+            device_batch = []
+            for b, buffer in zip(batch, self.pinned_buffers[batch_num % 2]):
+                out = buffer[:len(b)]
+                out.copy_(b)
+                device_batch.append(out.to(self.pin_device, non_blocking=True))
+            yield tuple(device_batch)
+
+# Helper function to create the train/val/eval loader for a piece value dataset
+def make_batch_loader(dataset, batch_size, shuffle, device, shard=False):
+    """
+    Batch loader for dataset placed according to DATASET_TENSOR_PLACEMENT.
+    With shard (training loops) and torchrun, each rank loads its shard in batches of batch_size / world_size.
+    """
+    rank, world_size = distributed_world() if shard else (0, 1)
+    if world_size > 1:
+        batch_size = local_batch_size(batch_size)
+
+    if DATASET_TENSOR_PLACEMENT == 'none':
+        if world_size > 1:
+            sampler = DistributedSampler(dataset, shuffle=shuffle, seed=DISTRIBUTED_SEED)
+            return DataLoader(dataset, batch_size=batch_size, sampler=sampler, num_workers=0)
+        return DataLoader(dataset, batch_size=batch_size, shuffle=shuffle, num_workers=0)
+
+    tensors = dataset.as_tensors()
+    embedding_table = getattr(dataset, 'embedding_table', None)
+    if DATASET_TENSOR_PLACEMENT == 'device':
+        if embedding_table is not None:
+            embedding_table = torch.from_numpy(np.ascontiguousarray(embedding_table)).to(device)
+        return TensorBatchLoader(tuple(t.to(device) for t in tensors), batch_size, shuffle=shuffle,
+                                 embedding_table=embedding_table, rank=rank, world_size=world_size)
+    pin_device = device if DATASET_TENSOR_PLACEMENT == 'pinned' and device.type == 'cuda' else None
+    return TensorBatchLoader(tensors, batch_size, shuffle=shuffle, pin_device=pin_device,
+                             embedding_table=embedding_table, rank=rank, world_size=world_size)
+
+# Helper function to create the loader of piece value rows held in a DataFrame or streamed from parquet
+def make_piece_value_loader(data, make_dataset, batch_size, shuffle, device, shard=False):
+    """make_dataset builds the dataset from a DataFrame (rows of data, or one shuffle buffer when streaming)"""
+    if isinstance(data, ParquetPieceValueSource):
+        if shard and distributed_world()[1] > 1:
+            raise ValueError("Distributed training needs train/val DataFrames (TRAINING_DATA_MODE = 'memory')")
+        # Shuffle buffers are different every time, so their features are not cached
+        make_dataset = functools.partial(make_dataset, feature_cache=False)
+        dataset = StreamingPieceValueDataset(data, make_dataset, batch_size, shuffle=shuffle,
+                                             shuffle_buffer_rows=STREAM_SHUFFLE_BUFFER_ROWS)
+        return DataLoader(dataset, batch_size=None, num_workers=STREAM_NUM_WORKERS,
+                          pin_memory=device.type == 'cuda' and DATASET_TENSOR_PLACEMENT == 'pinned')
+    return make_batch_loader(make_dataset(data), batch_size, shuffle, device, shard=shard)
+
 # Helper function to train simple MLP model
 def train_mlp_model(train_df, val_df, config, include_quadratic, model_name, norm_params, output_dir):
     """Train simple MLP piece value prediction model"""
@@ -537,23 +1440,33 @@ def train_mlp_model(train_df, val_df, config, include_quadratic, model_name, nor
 
     start_time = time.time()
 
-    # Create and load train/val piece value dataset
-    train_dataset = SimplePieceValueDataset(train_df, include_quadratic=include_quadratic)
-    val_dataset = SimplePieceValueDataset(val_df, include_quadratic=include_quadratic)
-
-    train_loader = DataLoader(train_dataset, batch_size=config['batch_size'],
-                             shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=config['batch_size'], num_workers=0)
-
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}\n")
 
+    # Create and load train/val piece value dataset
+    make_dataset = functools.partial(SimplePieceValueDataset, include_quadratic=include_quadratic)
+    train_loader = make_piece_value_loader(train_df, make_dataset, config['batch_size'], shuffle=True, device=device, shard=True)
+    val_loader = make_piece_value_loader(val_df, make_dataset, config['batch_size'], shuffle=False, device=device, shard=True)
+
+    # Fixed val subsample checked every epoch, full val passes only when needed (see VAL_SUBSAMPLE_ROWS)
+    val_subsample = validation_subsample(val_df)
+    subsample_loader = None
+    if val_subsample is not None:
+        subsample_loader = make_piece_value_loader(val_subsample, make_dataset, config['batch_size'], shuffle=False,
+                                                   device=device, shard=True)
+        print(f"Validation subsample: {len(val_subsample):,} rows (full pass every {VAL_FULL_EVERY_EPOCHS} epochs "
+              f"or when the subsample loss is within {VAL_NOISE_STDS} standard errors of the best epoch)\n")
+    validation = ValidationPolicy(val_loader, subsample_loader)
+
     # Initialize the model
     model = SimplePieceValueMLP(
         input_dim=input_dim,
         hidden_sizes=config['hidden_sizes'],
         dropout=config['dropout']
     ).to(device)
+    perf = PerfMode(device, [model])
+    train_model = distributed_model(model)
+    timer = EpochTimer(device, Path(output_dir) / "profiles", model_name)
 
     # pick garen
     optimizer = optim.AdamW(
@@ -576,73 +1489,106 @@ def train_mlp_model(train_df, val_df, config, include_quadratic, model_name, nor
 
     output_path = Path(output_dir)
 
-    epoch = 0
+    # Resume an interrupted run
+    state_file = output_path / f"{model_name}_training_state.pth"
+    state_components = {'model': model, 'optimizer': optimizer, 'scheduler': scheduler, 'early_stopping': early_stopping}
+    state_signature = {'config': config, 'include_quadratic': include_quadratic, 'training_samples': len(train_df)}
+    epoch, resumed = load_training_state(state_file, state_components, state_signature)
+    if resumed is not None:
+        best_val_loss, best_epoch = resumed['best_val_loss'], resumed['best_epoch']
+        start_time -= resumed['elapsed_time']
+        timer.epochs = resumed.get('epoch_timing', [])
+        validation.load_state_dict(resumed.get('validation', validation.state_dict()))
+
+    # Validation loss of a batch
+    def val_batch_losses(batch):
+        features, target = batch[0].to(device), batch[1].to(device)
+        with perf.autocast():
+            pred = model(features)
+        return [criterion(pred.float(), target).item()]
 
     # Training loop
     while True:
         epoch += 1
         epoch_start = time.time()
+        timer.start_epoch(epoch)
 
         # Train the model on train set
         model.train()
+        set_loader_epoch(train_loader, epoch)
         train_loss = 0
-        for features, target in train_loader:
-            features, target = features.to(device), target.to(device)
+        num_batches = 0
+        for features, target in timer.batches(train_loader):
+            with timer.phase('h2d'):
+                features, target = features.to(device), target.to(device)
             optimizer.zero_grad()
-            pred = model(features)
-            loss = criterion(pred, target)
-            loss.backward()
-            optimizer.step()
+            with timer.phase('forward'):
+                with perf.autocast():
+                    pred = train_model(features)
+                loss = criterion(pred.float(), target)
+            with timer.phase('backward'):
+                loss.backward()
+            with timer.phase('optimizer'):
+                optimizer.step()
             train_loss += loss.item()
+            num_batches += 1
 
-        train_loss /= len(train_loader)
+        train_loss = distributed_mean(train_loss, num_batches)
 
-        # Validate the model on val set
+        # Validate the model on the val subsample and, if this may be a new best, on the full val set
         model.eval()
-        val_loss = 0
-        with torch.no_grad():
-            for features, target in val_loader:
-                features, target = features.to(device), target.to(device)
-                pred = model(features)
-                loss = criterion(pred, target)
-                val_loss += loss.item()
-
-        val_loss /= len(val_loader)
+        with timer.phase('validation'), torch.no_grad():
+            val_loss, subsample_loss = validation.run(epoch, val_batch_losses,
+                                                      ValidationPolicy.decision_due(early_stopping, scheduler))
 
         epoch_time = time.time() - epoch_start
+        timing = timer.end_epoch()
 
         # Denormalize using standardization params (mean/std)
         # This is a rough approximation, we are training using Huber Loss (~MSE for <100cp, ~MAE for >100cp) while final results use strictly MAE!
-        approx_error_std = np.sqrt(val_loss * 2)  # rough approximation
+        approx_error_std = np.sqrt((subsample_loss if val_loss is None else val_loss) * 2)  # rough approximation
         approx_error_cp = approx_error_std * norm_params['std']
 
-        # Save the best model
-        if val_loss < best_val_loss:
+        # Save the best model (full val passes only)
+        if val_loss is not None and val_loss < best_val_loss:
             best_val_loss = val_loss
             best_epoch = epoch
-            torch.save(model.state_dict(), output_path / f"best_{model_name}_checkpoint.pth")
+            if is_main_process():
+                torch.save(model.state_dict(), output_path / f"best_{model_name}_checkpoint.pth")
 
         # Print training loop info
-        print(f"Epoch {epoch:3d} ({epoch_time:.1f}s) - "
-              f"Train Loss: {train_loss:.6f} | Val Loss: {val_loss:.6f} | "
+        print(f"Epoch {epoch:3d} ({epoch_time:.1f}s, {timing['samples_per_sec']:,.0f} samples/s) - "
+              f"Train Loss: {train_loss:.6f} | Val Loss: {validation.describe(val_loss, subsample_loss)} | "
               f"~{approx_error_cp:.2f} cp | "
               f"Best: {best_val_loss:.6f} (epoch {best_epoch})")
 
-        scheduler.step(val_loss)
+        scheduler.step(validation.monitored_loss(val_loss))
 
         # Stop training if overfitting
-        if early_stopping(val_loss):
+        if early_stopping(validation.monitored_loss(val_loss)):
             print(f"\nEarly stopping triggered after {epoch} epochs")
             print(f"Best model was at epoch {best_epoch}\n")
             break
+        if epoch >= config.get('max_epochs', float('inf')):
+            print(f"\nStopped after max_epochs={epoch}, best model was at epoch {best_epoch}\n")
+            break
+
+        if CHECKPOINT_EVERY_EPOCHS and epoch % CHECKPOINT_EVERY_EPOCHS == 0 and is_main_process():
+            save_training_state(state_file, epoch, state_components, state_signature, best_val_loss=best_val_loss,
+                                best_epoch=best_epoch, elapsed_time=time.time() - start_time,
+                                epoch_timing=timer.epochs, validation=validation.state_dict())
 
     # Load best model
+    distributed_barrier()
     model.load_state_dict(torch.load(output_path / f"best_{model_name}_checkpoint.pth"))
 
     elapsed_time = time.time() - start_time
 
     # Save final model
-    torch.save(model.state_dict(), output_path / f"{model_name}_model.pth")
+    if is_main_process():
+        torch.save(model.state_dict(), output_path / f"{model_name}_model.pth")
+        clear_training_state(state_file)
+    distributed_barrier()
 
     metadata = {
         'model_type': model_name,
@@ -652,8 +1598,12 @@ def train_mlp_model(train_df, val_df, config, include_quadratic, model_name, nor
         'best_epoch': best_epoch,
         'best_val_loss': float(best_val_loss),
         'training_time_seconds': elapsed_time,
+        'epochs_trained': epoch,
+        'perf_mode': perf.info(),
+        'throughput': timer.summary(),
         'config': config,
         'input_dim': input_dim,
+        'piece_feature_encoding': PIECE_FEATURE_ENCODING,
         'improvements': ['AdamW', 'weight_decay', 'HuberLoss', 'BatchNorm1d', 'standardization']
     }
 
@@ -663,6 +1613,7 @@ def train_mlp_model(train_df, val_df, config, include_quadratic, model_name, nor
     print(f"Training time: {elapsed_time/60:.1f} minutes")
     print(f"Best epoch: {best_epoch}")
     print(f"Best val loss: {best_val_loss:.6f}")
+    print(f"Throughput: {timer.describe()}")
     print(f"{'='*60}\n")
 
     return model, metadata
@@ -672,8 +1623,8 @@ def evaluate_mlp_model(model, df, include_quadratic, norm_params, device):
     """
     Evaluate MLP model on a dataset and return MAE error in centipawns.
     """
-    dataset = SimplePieceValueDataset(df, include_quadratic=include_quadratic)
-    loader = DataLoader(dataset, batch_size=1024, num_workers=0)
+    make_dataset = functools.partial(SimplePieceValueDataset, include_quadratic=include_quadratic)
+    loader = make_piece_value_loader(df, make_dataset, 1024, shuffle=False, device=device)
 
     model.eval()
     total_abs_error = 0.0
@@ -738,36 +1689,37 @@ class CNNPieceValuePredictor(nn.Module):
         self.mlp = nn.Sequential(*layers)
 
     def forward(self, cnn_embedding, piece_loc):
+        # Integer piece_loc: piece location codes (PIECE_FEATURE_ENCODING = 'codes') instead of dense features
+        if not piece_loc.is_floating_point():
+            return self.mlp[1:](piece_code_linear(self.mlp[0], piece_loc, cnn_embedding))
         x = torch.cat([cnn_embedding, piece_loc], dim=1)
         return self.mlp(x)
 
 # Helper object to store peice value data with special column for CNN-encoded intermediate position representation vectors as embeddings
 class CNNPieceValueDataset(Dataset):
     """Dataset for CNN-based piece value prediction"""
-    def __init__(self, df, embed_column='cnn_position_embed'):
-        # Extract CNN embeddings
-        self.cnn_embeddings = np.stack(df[embed_column].values).astype(np.float32)
-
-        # Extract piece location features
-        piece_types = ['p', 'P', 'n', 'N', 'b', 'B', 'r', 'R', 'q', 'Q']
-        piece_type_onehot = np.zeros((len(df), len(piece_types)), dtype=np.float32)
-
-        # Initialize one-hot vector
-        for i, piece_type in enumerate(piece_types):
-            piece_type_onehot[:, i] = (df['piece_type'] == piece_type).astype(np.float32)
-        
-        # Normalize piece rank/file
-        ranks = (df['rank'].values / 7.0).astype(np.float32).reshape(-1, 1)
-        files = (df['file'].values / 7.0).astype(np.float32).reshape(-1, 1)
-
-        # Also include rank^2 and file^2 (for fun) in piece location vector
-        self.piece_locations = np.concatenate([
-            piece_type_onehot,
-            ranks,
-            files,
-            ranks**2,
-            files**2
-        ], axis=1)
+    def __init__(self, df, embed_column='cnn_position_embed', embedding_store=None, position_fens=None, feature_cache=True):
+        # Rows only hold an index into a table of unique position embeddings
+        if embedding_store is not None:
+            self.embedding_table = embedding_store.embeddings
+            self.position_idx = embedding_store.rows_for(df['fen'])
+        elif position_fens is not None:
+            # Embeddings computed on the fly, rows index position_fens (e.g. the rows of a bitboard cache)
+            self.embedding_table = None
+            self.position_idx = FenIndex.from_fens(position_fens).get_indexer(df['fen']).astype(np.int32)
+            if (self.position_idx < 0).any():
+                raise KeyError(f"{(self.position_idx < 0).sum():,} rows have FENs missing from position_fens")
+        else:
+            # Embeddings stored in df[embed_column] (one array per row)
+            self.embedding_table = np.stack(df[embed_column].values).astype(np.float32)
+            self.position_idx = np.arange(len(df), dtype=np.int32)
+
+        # Extract piece location features or int8 codes (shared with the other datasets of df through the feature cache)
+        codes = PIECE_FEATURE_ENCODING == 'codes'
+        if feature_cache:
+            self.piece_locations = load_piece_location_features(df, codes=codes)
+        else:
+            self.piece_locations = piece_location_codes(df) if codes else piece_location_features(df)
 
         self.values = df['piece_value'].values.astype(np.float32)
 
@@ -776,21 +1728,97 @@ class CNNPieceValueDataset(Dataset):
 
     def __getitem__(self, idx):
         return (
-            torch.from_numpy(self.cnn_embeddings[idx]),
+            torch.from_numpy(np.asarray(self.embedding_table[self.position_idx[idx]], dtype=np.float32)),
             torch.from_numpy(self.piece_locations[idx]),
             torch.tensor([self.values[idx]], dtype=torch.float32)
         )
 
+    def as_tensors(self):
+        """
+        Whole dataset as contiguous tensors (same layout as a collated batch), except the first
+        tensor holds position indices into self.embedding_table (gathered per batch by the loader).
+        """
+        return (
+            torch.from_numpy(self.position_idx),
+            torch.from_numpy(np.ascontiguousarray(self.piece_locations)),
+            torch.from_numpy(self.values).reshape(-1, 1)
+        )
+
+# Loader that batches whole positions (all of their piece rows) for on the fly position encoding
+class PositionGroupedBatchLoader:
+    """
+    Batches of CNNPieceValueDataset rows grouped by position.
+    Rows are laid out CSR style (piece_rows sorted by position, offsets[i]:offsets[i+1] are the rows
+    of positions[i]). Each batch draws shuffled positions until it has >= batch_size piece rows and yields
+    (boards, inverse, piece_loc, target) where boards are the unique positions of the batch and
+    inverse maps every piece row to its board, so the encoder runs once per board.
+    """
+    def __init__(self, dataset, bitboards, batch_size, shuffle=False):
+        self.bitboards = bitboards
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        _, self.piece_locations, self.values = dataset.as_tensors()
+
+        self.piece_rows = np.argsort(dataset.position_idx, kind='stable')
+        self.positions, starts, self.counts = np.unique(
+            dataset.position_idx[self.piece_rows], return_index=True, return_counts=True
+        )
+        self.offsets = np.append(starts, len(self.piece_rows))
+        self.num_samples = len(self.piece_rows)
+
+    def __len__(self):
+        return (self.num_samples + self.batch_size - 1) // self.batch_size
+
+    def __iter__(self):
+        num_positions = len(self.positions)
+        if num_positions == 0:
+            return
+        group_order = torch.randperm(num_positions).numpy() if self.shuffle else np.arange(num_positions)
+
+        # Cut the position order wherever the running piece count passes a multiple of batch_size
+        pieces_so_far = np.cumsum(self.counts[group_order])
+        cuts = np.searchsorted(pieces_so_far, np.arange(self.batch_size, pieces_so_far[-1], self.batch_size)) + 1
+        bounds = np.unique(np.concatenate([[0], cuts, [num_positions]]))
+
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            groups = group_order[a:b]
+            lengths = self.counts[groups]
+            # Row ranges of every group back to back: offsets[g] + 0..counts[g]-1
+            within = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+            rows = torch.from_numpy(self.piece_rows[np.repeat(self.offsets[groups], lengths) + within])
+            inverse = torch.from_numpy(np.repeat(np.arange(len(groups)), lengths))
+            boards = torch.from_numpy(unpack_board_tensors(self.bitboards[self.positions[groups]]))
+            yield boards, inverse, self.piece_locations[rows], self.values[rows]
+
+# Helper function to get (embedding, piece location, target) of a batch from either loader
+def cnn_pieceval_batch(batch, device, encoder=None):
+    """Embeddings are read from the batch, or computed by encoder for position grouped batches"""
+    if encoder is None:
+        cnn_emb, piece_loc, target = batch
+        return cnn_emb.to(device), piece_loc.to(device), target.to(device)
+
+    boards, inverse, piece_loc, target = batch
+    # Broadcast one embedding per unique board to all of its piece rows
+    cnn_emb = encoder(boards.to(device))[inverse.to(device)]
+    return cnn_emb, piece_loc.to(device), target.to(device)
+
 # Helper function to train augmented CNN+MLP piece value predictor
 def train_cnn_pieceval_model(train_df, val_df, config, norm_params, output_dir,
                               embedding_dim=512, hidden_sizes=[256, 128, 64],
                               dropout_rates=None, model_name="cnn_pieceval",
-                              embed_column='cnn_position_embed'):
-    """Train CNN-based piece value prediction model"""
+                              embed_column='cnn_position_embed', embedding_store=None,
+                              encoder_mode='precomputed', encoder=None, bitboards=None, position_fens=None):
+    """
+    Train CNN-based piece value prediction model.
+    encoder_mode 'precomputed': embeddings come from embedding_store if given, otherwise from df[embed_column].
+    encoder_mode 'frozen'/'finetune': encoder embeds the positions of each batch (bitboards row i is position_fens[i]),
+    'finetune' also trains the encoder and saves it as {model_name}_encoder.pth.
+    """
     print(f"\n{'='*60}")
     print(f"TRAINING CNN PIECE VALUE PREDICTOR: {model_name}")
     print(f"{'='*60}")
     print(f"Embedding column: {embed_column}")
+    print(f"Encoder mode: {encoder_mode}")
     print(f"Embedding dimension: {embedding_dim}")
     print(f"Hidden layer architecture: {hidden_sizes}")
     print(f"Number of hidden layers: {len(hidden_sizes)}")
@@ -805,26 +1833,62 @@ def train_cnn_pieceval_model(train_df, val_df, config, norm_params, output_dir,
 
     start_time = time.time()
 
-    # Load training and validation dataset
-    train_dataset = CNNPieceValueDataset(train_df, embed_column=embed_column)
-    val_dataset = CNNPieceValueDataset(val_df, embed_column=embed_column)
-
-    train_loader = DataLoader(train_dataset, batch_size=config['batch_size'],
-                             shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_dataset, batch_size=config['batch_size'], num_workers=0)
-
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}\n")
 
+    # Load training and validation dataset
+    if encoder_mode == 'precomputed':
+        make_dataset = functools.partial(CNNPieceValueDataset, embed_column=embed_column, embedding_store=embedding_store)
+        train_loader = make_piece_value_loader(train_df, make_dataset, config['batch_size'], shuffle=True, device=device, shard=True)
+        val_loader = make_piece_value_loader(val_df, make_dataset, config['batch_size'], shuffle=False, device=device, shard=True)
+        encoder = None
+        subsample_loader = None
+        val_subsample = validation_subsample(val_df)
+        if val_subsample is not None:
+            subsample_loader = make_piece_value_loader(val_subsample, make_dataset, config['batch_size'], shuffle=False,
+                                                       device=device, shard=True)
+    else:
+        if isinstance(train_df, ParquetPieceValueSource):
+            raise ValueError(f"encoder_mode '{encoder_mode}' needs train/val DataFrames (TRAINING_DATA_MODE = 'memory')")
+        if distributed_world()[1] > 1:
+            raise ValueError(f"encoder_mode '{encoder_mode}' does not support distributed training (use 'precomputed')")
+        train_dataset = CNNPieceValueDataset(train_df, position_fens=position_fens)
+        val_dataset = CNNPieceValueDataset(val_df, position_fens=position_fens)
+        train_loader = PositionGroupedBatchLoader(train_dataset, bitboards, config['batch_size'], shuffle=True)
+        val_loader = PositionGroupedBatchLoader(val_dataset, bitboards, config['batch_size'], shuffle=False)
+        subsample_loader = None
+        val_subsample = validation_subsample(val_df)
+        if val_subsample is not None:
+            subsample_dataset = CNNPieceValueDataset(val_subsample, position_fens=position_fens)
+            subsample_loader = PositionGroupedBatchLoader(subsample_dataset, bitboards, config['batch_size'], shuffle=False)
+        encoder = encoder.to(device)
+        finetune_encoder = encoder_mode == 'finetune'
+        for param in encoder.parameters():
+            param.requires_grad_(finetune_encoder)
+        encoder.eval()
+        print(f"Positions per epoch: {len(train_loader.positions):,} train, {len(val_loader.positions):,} val\n")
+
+    # Fixed val subsample checked every epoch, full val passes only when needed (see VAL_SUBSAMPLE_ROWS)
+    if subsample_loader is not None:
+        print(f"Validation subsample: {len(val_subsample):,} rows (full pass every {VAL_FULL_EVERY_EPOCHS} epochs "
+              f"or when the subsample loss is within {VAL_NOISE_STDS} standard errors of the best epoch)\n")
+    validation = ValidationPolicy(val_loader, subsample_loader)
+
     # Set graduated dropout rates
     model = CNNPieceValuePredictor(
         embedding_dim=embedding_dim,
         hidden_sizes=hidden_sizes,
         dropout_rates=dropout_rates
     ).to(device)
+    perf = PerfMode(device, [model] if encoder is None else [model, encoder])
+    train_model = distributed_model(model)
+    timer = EpochTimer(device, Path(output_dir) / "profiles", model_name)
 
+    param_groups = [{'params': model.parameters()}]
+    if encoder_mode == 'finetune':
+        param_groups.append({'params': encoder.parameters(), 'lr': config['encoder_lr']})
     optimizer = optim.AdamW(
-        model.parameters(),
+        param_groups,
         lr=config['lr'],
         weight_decay=config['weight_decay']
     )
@@ -842,78 +1906,149 @@ def train_cnn_pieceval_model(train_df, val_df, config, norm_params, output_dir,
 
     output_path = Path(output_dir)
 
-    epoch = 0
+    # Resume an interrupted run
+    state_file = output_path / f"{model_name}_training_state.pth"
+    state_components = {'model': model, 'optimizer': optimizer, 'scheduler': scheduler, 'early_stopping': early_stopping}
+    if encoder_mode == 'finetune':
+        state_components['encoder'] = encoder
+    state_signature = {'config': config, 'embedding_dim': embedding_dim, 'hidden_sizes': hidden_sizes,
+                       'dropout_rates': dropout_rates, 'encoder_mode': encoder_mode, 'training_samples': len(train_df)}
+    epoch, resumed = load_training_state(state_file, state_components, state_signature)
+    if resumed is not None:
+        best_val_loss, best_epoch = resumed['best_val_loss'], resumed['best_epoch']
+        start_time -= resumed['elapsed_time']
+        timer.epochs = resumed.get('epoch_timing', [])
+        validation.load_state_dict(resumed.get('validation', validation.state_dict()))
+
+    # Validation loss of a batch
+    def val_batch_losses(batch):
+        with perf.autocast():
+            cnn_emb, piece_loc, target = cnn_pieceval_batch(batch, device, encoder)
+            pred = model(cnn_emb, piece_loc)
+        return [criterion(pred.float(), target).item()]
 
     # Training loop
     while True:
         epoch += 1
         epoch_start = time.time()
+        timer.start_epoch(epoch)
 
         # Train the model on training data
         model.train()
+        if encoder_mode == 'finetune':
+            encoder.train()
+        set_loader_epoch(train_loader, epoch)
         train_loss = 0
-        for cnn_emb, piece_loc, target in train_loader:
-            cnn_emb, piece_loc, target = cnn_emb.to(device), piece_loc.to(device), target.to(device)
+        num_batches = 0
+        for batch in timer.batches(train_loader):
             optimizer.zero_grad()
-            pred = model(cnn_emb, piece_loc)
-            loss = criterion(pred, target)
-            loss.backward()
-            optimizer.step()
+            # Encoder forward counts as forward for frozen/finetuned encoders
+            with timer.phase('h2d' if encoder is None else 'forward'), perf.autocast():
+                cnn_emb, piece_loc, target = cnn_pieceval_batch(batch, device, encoder)
+            with timer.phase('forward'):
+                with perf.autocast():
+                    pred = train_model(cnn_emb, piece_loc)
+                loss = criterion(pred.float(), target)
+            with timer.phase('backward'):
+                loss.backward()
+            with timer.phase('optimizer'):
+                optimizer.step()
             train_loss += loss.item()
+            num_batches += 1
 
-        train_loss /= len(train_loader)
+        train_loss = distributed_mean(train_loss, num_batches)
 
         # Validate the model on validation data
         model.eval()
-        val_loss = 0
-        with torch.no_grad():
-            for cnn_emb, piece_loc, target in val_loader:
-                cnn_emb, piece_loc, target = cnn_emb.to(device), piece_loc.to(device), target.to(device)
-                pred = model(cnn_emb, piece_loc)
-                loss = criterion(pred, target)
-                val_loss += loss.item()
-
-        val_loss /= len(val_loader)
+        if encoder is not None:
+            encoder.eval()
+        with timer.phase('validation'), torch.no_grad():
+            val_loss, subsample_loss = validation.run(epoch, val_batch_losses,
+                                                      ValidationPolicy.decision_due(early_stopping, scheduler))
 
         epoch_time = time.time() - epoch_start
+        timing = timer.end_epoch()
 
         # Print approximate error in cp for display
         # Our training uses Huber Loss while we do validation in pure MAE
         # so the approximate cp error will appear larger in training loop
-        approx_error_std = np.sqrt(val_loss * 2)
+        approx_error_std = np.sqrt((subsample_loss if val_loss is None else val_loss) * 2)
         approx_error_cp = approx_error_std * norm_params['std']
 
-        # Save the best model
-        if val_loss < best_val_loss:
+        # Save the best model (full val passes only)
+        if val_loss is not None and val_loss < best_val_loss:
             best_val_loss = val_loss
             best_epoch = epoch
-            torch.save(model.state_dict(), output_path / f"best_{model_name}_checkpoint.pth")
+            if is_main_process():
+                torch.save(model.state_dict(), output_path / f"best_{model_name}_checkpoint.pth")
+                if encoder_mode == 'finetune':
+                    torch.save(encoder.state_dict(), output_path / f"best_{model_name}_encoder.pth")
 
         # Print training loop info
-        print(f"Epoch {epoch:3d} ({epoch_time:.1f}s) - "
-              f"Train Loss: {train_loss:.6f} | Val Loss: {val_loss:.6f} | "
+        print(f"Epoch {epoch:3d} ({epoch_time:.1f}s, {timing['samples_per_sec']:,.0f} samples/s) - "
+              f"Train Loss: {train_loss:.6f} | Val Loss: {validation.describe(val_loss, subsample_loss)} | "
               f"~{approx_error_cp:.2f} cp | "
               f"Best: {best_val_loss:.6f} (epoch {best_epoch})")
 
-        scheduler.step(val_loss)
+        scheduler.step(validation.monitored_loss(val_loss))
 
         # Stop in case of overfitting
-        if early_stopping(val_loss):
+        if early_stopping(validation.monitored_loss(val_loss)):
             print(f"\nEarly stopping triggered after {epoch} epochs")
             print(f"Best model was at epoch {best_epoch}\n")
             break
+        if epoch >= config.get('max_epochs', float('inf')):
+            print(f"\nStopped after max_epochs={epoch}, best model was at epoch {best_epoch}\n")
+            break
+
+        if CHECKPOINT_EVERY_EPOCHS and epoch % CHECKPOINT_EVERY_EPOCHS == 0 and is_main_process():
+            save_training_state(state_file, epoch, state_components, state_signature, best_val_loss=best_val_loss,
+                                best_epoch=best_epoch, elapsed_time=time.time() - start_time,
+                                epoch_timing=timer.epochs, validation=validation.state_dict())
 
     # Load best model
+    distributed_barrier()
     model.load_state_dict(torch.load(output_path / f"best_{model_name}_checkpoint.pth"))
 
     elapsed_time = time.time() - start_time
 
     # Save final model
-    torch.save(model.state_dict(), output_path / f"{model_name}_model.pth")
+    if encoder_mode == 'finetune':
+        encoder.load_state_dict(torch.load(output_path / f"best_{model_name}_encoder.pth"))
+    if is_main_process():
+        torch.save(model.state_dict(), output_path / f"{model_name}_model.pth")
+        if encoder_mode == 'finetune':
+            torch.save(encoder.state_dict(), output_path / f"{model_name}_encoder.pth")
+        clear_training_state(state_file)
+    distributed_barrier()
+
+    metadata = cnn_pieceval_metadata(
+        model_name, encoder_mode, embedding_dim, hidden_sizes, dropout_rates,
+        train_df, val_df, best_epoch, best_val_loss, elapsed_time, config
+    )
+    metadata['epochs_trained'] = epoch
+    metadata['perf_mode'] = perf.info()
+    metadata['throughput'] = timer.summary()
 
-    metadata = {
+    # Print training loop confirmation message and return model
+    print(f"\n{'='*60}")
+    print("CNN PIECE VALUE PREDICTOR TRAINING COMPLETE")
+    print(f"{'='*60}")
+    print(f"Training time: {elapsed_time/60:.1f} minutes")
+    print(f"Best epoch: {best_epoch}")
+    print(f"Best val loss: {best_val_loss:.6f}")
+    print(f"Throughput: {timer.describe()}")
+    print(f"{'='*60}\n")
+
+    return model, metadata
+
+# Helper function to build the metadata of a trained CNN piece value predictor
+def cnn_pieceval_metadata(model_name, encoder_mode, embedding_dim, hidden_sizes, dropout_rates,
+                          train_df, val_df, best_epoch, best_val_loss, elapsed_time, config):
+    return {
         'model_type': 'cnn_pieceval',
         'model_name': model_name,
+        'encoder_mode': encoder_mode,
         'embedding_dim': embedding_dim,
         'hidden_sizes': hidden_sizes,
         'dropout_rates': dropout_rates,
@@ -929,36 +2064,339 @@ def train_cnn_pieceval_model(train_df, val_df, config, norm_params, output_dir,
             'piece_location': 14,
             'total': embedding_dim + 14
         },
+        'piece_feature_encoding': PIECE_FEATURE_ENCODING,
         'improvements': ['AdamW', 'weight_decay', 'HuberLoss', 'BatchNorm1d',
                          'graduated_dropout', 'standardization']
     }
 
-    # Print training loop confirmation message and return model
+# Helper function to train several augmented CNN+MLP piece value heads in one pass over the data
+def train_cnn_pieceval_heads(train_df, val_df, config, norm_params, output_dir, heads,
+                             embedding_dim=512, embed_column='cnn_position_embed', embedding_store=None,
+                             encoder_mode='precomputed', encoder=None, bitboards=None, position_fens=None):
+    """
+    Train CNN piece value heads of the same encoder together (same arguments as train_cnn_pieceval_model).
+    heads is a list of {'model_name', 'hidden_sizes', 'dropout_rates'}.
+    Every batch is loaded and moved to the device once and fed to every active head; for 'precomputed'
+    and 'frozen' the embeddings are shared too, 'finetune' gives every head its own copy of encoder.
+    Each head has its own optimizer, scheduler and early stopping, and saves the same files as
+    train_cnn_pieceval_model. Returns {model_name: (model, metadata)}.
+    """
+    print(f"\n{'='*60}")
+    print(f"TRAINING {len(heads)} CNN PIECE VALUE PREDICTORS TOGETHER")
+    print(f"{'='*60}")
+    print(f"Embedding column: {embed_column}")
+    print(f"Encoder mode: {encoder_mode}")
+    print(f"Embedding dimension: {embedding_dim}")
+    for head in heads:
+        print(f"  - {head['model_name']}: {head['hidden_sizes']}, dropout {head['dropout_rates']}")
+    print(f"Training samples: {len(train_df):,}")
+    print(f"Validation samples: {len(val_df):,}")
+    print(f"Batch size: {config['batch_size']}")
+    print(f"Learning rate: {config['lr']}")
+    print(f"Weight decay: {config['weight_decay']}")
+    print(f"Loss function: HuberLoss(delta={HUBER_DELTA})")
+    print(f"{'='*60}\n")
+
+    start_time = time.time()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    print(f"Using device: {device}\n")
+
+    # Load training and validation dataset (shared by all heads)
+    shared_encoder = None
+    if encoder_mode == 'precomputed':
+        make_dataset = functools.partial(CNNPieceValueDataset, embed_column=embed_column, embedding_store=embedding_store)
+        train_loader = make_piece_value_loader(train_df, make_dataset, config['batch_size'], shuffle=True, device=device, shard=True)
+        val_loader = make_piece_value_loader(val_df, make_dataset, config['batch_size'], shuffle=False, device=device, shard=True)
+        subsample_loader = None
+        val_subsample = validation_subsample(val_df)
+        if val_subsample is not None:
+            subsample_loader = make_piece_value_loader(val_subsample, make_dataset, config['batch_size'], shuffle=False,
+                                                       device=device, shard=True)
+    else:
+        if isinstance(train_df, ParquetPieceValueSource):
+            raise ValueError(f"encoder_mode '{encoder_mode}' needs train/val DataFrames (TRAINING_DATA_MODE = 'memory')")
+        if distributed_world()[1] > 1:
+            raise ValueError(f"encoder_mode '{encoder_mode}' does not support distributed training (use 'precomputed')")
+        train_dataset = CNNPieceValueDataset(train_df, position_fens=position_fens)
+        val_dataset = CNNPieceValueDataset(val_df, position_fens=position_fens)
+        train_loader = PositionGroupedBatchLoader(train_dataset, bitboards, config['batch_size'], shuffle=True)
+        val_loader = PositionGroupedBatchLoader(val_dataset, bitboards, config['batch_size'], shuffle=False)
+        subsample_loader = None
+        val_subsample = validation_subsample(val_df)
+        if val_subsample is not None:
+            subsample_dataset = CNNPieceValueDataset(val_subsample, position_fens=position_fens)
+            subsample_loader = PositionGroupedBatchLoader(subsample_dataset, bitboards, config['batch_size'], shuffle=False)
+        encoder = encoder.to(device)
+        for param in encoder.parameters():
+            param.requires_grad_(False)
+        encoder.eval()
+        if encoder_mode == 'frozen':
+            shared_encoder = encoder
+        print(f"Positions per epoch: {len(train_loader.positions):,} train, {len(val_loader.positions):,} val\n")
+
+    # Fixed val subsample checked every epoch, full val passes only when a head needs one (see VAL_SUBSAMPLE_ROWS)
+    if subsample_loader is not None:
+        print(f"Validation subsample: {len(val_subsample):,} rows (full pass every {VAL_FULL_EVERY_EPOCHS} epochs "
+              f"or when a head's subsample loss is within {VAL_NOISE_STDS} standard errors of its best epoch)\n")
+
+    criterion = nn.HuberLoss(delta=HUBER_DELTA)
+    output_path = Path(output_dir)
+
+    # Per head state
+    states = []
+    for head in heads:
+        model = CNNPieceValuePredictor(
+            embedding_dim=embedding_dim,
+            hidden_sizes=head['hidden_sizes'],
+            dropout_rates=head['dropout_rates']
+        ).to(device)
+
+        head_encoder = None
+        param_groups = [{'params': model.parameters()}]
+        if encoder_mode == 'finetune':
+            head_encoder = copy.deepcopy(encoder)
+            for param in head_encoder.parameters():
+                param.requires_grad_(True)
+            param_groups.append({'params': head_encoder.parameters(), 'lr': config['encoder_lr']})
+        optimizer = optim.AdamW(param_groups, lr=config['lr'], weight_decay=config['weight_decay'])
+
+        states.append({
+            'head': head,
+            'model': model,
+            'encoder': head_encoder,
+            'optimizer': optimizer,
+            'scheduler': optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=5),
+            'early_stopping': EarlyStopping(patience=config['patience']),
+            'validation': ValidationPolicy(val_loader, subsample_loader),
+            'best_val_loss': float('inf'),
+            'best_epoch': 0,
+            'elapsed_time': None,
+            'epochs_trained': None,
+        })
+
+    perf = PerfMode(device, [state['model'] for state in states]
+                    + [state['encoder'] for state in states if state['encoder'] is not None]
+                    + ([shared_encoder] if shared_encoder is not None else []))
+    for state in states:
+        state['train_model'] = distributed_model(state['model'])
+    # One timer for the whole group (phases are summed over the heads)
+    timer = EpochTimer(device, output_path / "profiles", f"{heads[0]['model_name']}_heads")
+
+    # Embeddings of a batch shared by all heads, or computed by each head's own (finetuned) encoder
+    def head_inputs(state, batch, shared):
+        if shared is not None:
+            return shared
+        return cnn_pieceval_batch(batch, device, state['encoder'])
+
+    # Resume an interrupted run (one state file for the whole group of heads)
+    state_file = output_path / f"{heads[0]['model_name']}_heads_training_state.pth"
+    state_components = {}
+    for i, state in enumerate(states):
+        for name in ('model', 'optimizer', 'scheduler', 'early_stopping', 'encoder'):
+            if state[name] is not None:
+                state_components[f"{i}_{name}"] = state[name]
+    state_signature = {'config': config, 'embedding_dim': embedding_dim, 'heads': heads,
+                       'encoder_mode': encoder_mode, 'training_samples': len(train_df)}
+    epoch, resumed = load_training_state(state_file, state_components, state_signature)
+    if resumed is not None:
+        for state, head_progress in zip(states, resumed['heads']):
+            state.update(head_progress)
+        for state, validation_state in zip(states, resumed.get('validation', [])):
+            state['validation'].load_state_dict(validation_state)
+        start_time -= resumed['elapsed_time']
+        timer.epochs = resumed.get('epoch_timing', [])
+    active = [state for state in states if state['elapsed_time'] is None]
+
+    # Validation losses of a batch for every active head
+    def val_batch_losses(batch):
+        if encoder_mode == 'finetune':
+            batch = tuple(t.to(device) for t in batch)
+            shared = None
+        else:
+            with perf.autocast():
+                shared = cnn_pieceval_batch(batch, device, shared_encoder)
+        losses = []
+        for state in active:
+            with perf.autocast():
+                cnn_emb, piece_loc, target = head_inputs(state, batch, shared)
+                pred = state['model'](cnn_emb, piece_loc)
+            losses.append(criterion(pred.float(), target).item())
+        return losses
+
+    # Training loop
+    while active:
+        epoch += 1
+        epoch_start = time.time()
+        timer.start_epoch(epoch)
+
+        # Train the active heads on training data
+        for state in active:
+            state['model'].train()
+            if state['encoder'] is not None:
+                state['encoder'].train()
+            state['train_loss'] = 0.0
+        set_loader_epoch(train_loader, epoch)
+        num_batches = 0
+        for batch in timer.batches(train_loader):
+            if encoder_mode == 'finetune':
+                with timer.phase('h2d'):
+                    batch = tuple(t.to(device) for t in batch)
+                shared = None
+            else:
+                with timer.phase('h2d' if shared_encoder is None else 'forward'), torch.no_grad(), perf.autocast():
+                    shared = cnn_pieceval_batch(batch, device, shared_encoder)
+            for state in active:
+                state['optimizer'].zero_grad()
+                with timer.phase('forward'):
+                    with perf.autocast():
+                        cnn_emb, piece_loc, target = head_inputs(state, batch, shared)
+                        pred = state['train_model'](cnn_emb, piece_loc)
+                    loss = criterion(pred.float(), target)
+                with timer.phase('backward'):
+                    loss.backward()
+                with timer.phase('optimizer'):
+                    state['optimizer'].step()
+                state['train_loss'] += loss.item()
+            num_batches += 1
+
+        # Validate the active heads on the val subsample, and all of them on the full val set if any head may be a new best
+        for state in active:
+            state['model'].eval()
+            if state['encoder'] is not None:
+                state['encoder'].eval()
+            state['train_loss'] = distributed_mean(state['train_loss'], num_batches)
+        with timer.phase('validation'), torch.no_grad():
+            subsample_losses, subsample_batch_losses = [None] * len(active), [None] * len(active)
+            if subsample_loader is not None:
+                subsample_losses, batch_loss_matrix = validation_losses(subsample_loader, val_batch_losses, len(active))
+                subsample_batch_losses = list(batch_loss_matrix.T)
+            full_pass = [state['validation'].full_pass(epoch, batch_losses,
+                                                       ValidationPolicy.decision_due(state['early_stopping'], state['scheduler']))
+                         for state, batch_losses in zip(active, subsample_batch_losses)]
+            val_losses = [None] * len(active)
+            if any(full_pass):
+                val_losses, _ = validation_losses(val_loader, val_batch_losses, len(active))
+            # (heads that did not need the full pass still use it)
+            for state, val_loss, subsample_loss, batch_losses in zip(
+                    active, val_losses, subsample_losses, subsample_batch_losses):
+                state['val_loss'] = val_loss
+                state['subsample_loss'] = subsample_loss
+                state['validation'].update(state['val_loss'], batch_losses)
+
+        epoch_time = time.time() - epoch_start
+        timing = timer.end_epoch()
+
+        print(f"Epoch {epoch:3d} ({epoch_time:.1f}s, {len(active)} heads, {timing['samples_per_sec']:,.0f} samples/s)")
+        for state in list(active):
+            model_name = state['head']['model_name']
+            val_loss = state['val_loss']
+            approx_error_cp = np.sqrt((state['subsample_loss'] if val_loss is None else val_loss) * 2) * norm_params['std']
+
+            # Save the best model (full val passes only)
+            if val_loss is not None and val_loss < state['best_val_loss']:
+                state['best_val_loss'] = val_loss
+                state['best_epoch'] = epoch
+                if is_main_process():
+                    torch.save(state['model'].state_dict(), output_path / f"best_{model_name}_checkpoint.pth")
+                    if encoder_mode == 'finetune':
+                        torch.save(state['encoder'].state_dict(), output_path / f"best_{model_name}_encoder.pth")
+
+            print(f"  {model_name} - "
+                  f"Train Loss: {state['train_loss']:.6f} | "
+                  f"Val Loss: {ValidationPolicy.describe(val_loss, state['subsample_loss'])} | "
+                  f"~{approx_error_cp:.2f} cp | "
+                  f"Best: {state['best_val_loss']:.6f} (epoch {state['best_epoch']})")
+
+            state['scheduler'].step(ValidationPolicy.monitored_loss(val_loss))
+
+            # Stop this head in case of overfitting, the others keep going
+            if state['early_stopping'](ValidationPolicy.monitored_loss(val_loss)):
+                print(f"  Early stopping {model_name} after {epoch} epochs (best epoch {state['best_epoch']})")
+                state['elapsed_time'] = time.time() - start_time
+                state['epochs_trained'] = epoch
+                active.remove(state)
+
+        if active and epoch >= config.get('max_epochs', float('inf')):
+            print(f"  Stopped {len(active)} heads after max_epochs={epoch}")
+            for state in active:
+                state['elapsed_time'] = time.time() - start_time
+                state['epochs_trained'] = epoch
+            active = []
+
+        if active and CHECKPOINT_EVERY_EPOCHS and epoch % CHECKPOINT_EVERY_EPOCHS == 0 and is_main_process():
+            head_progress = [{key: state[key] for key in ('best_val_loss', 'best_epoch', 'elapsed_time', 'epochs_trained')}
+                             for state in states]
+            save_training_state(state_file, epoch, state_components, state_signature,
+                                heads=head_progress, elapsed_time=time.time() - start_time,
+                                epoch_timing=timer.epochs,
+                                validation=[state['validation'].state_dict() for state in states])
+
+    # Load best models, save final models
+    distributed_barrier()
+    results = {}
+    for state in states:
+        head = state['head']
+        model_name = head['model_name']
+        model = state['model']
+        model.load_state_dict(torch.load(output_path / f"best_{model_name}_checkpoint.pth"))
+        if encoder_mode == 'finetune':
+            state['encoder'].load_state_dict(torch.load(output_path / f"best_{model_name}_encoder.pth"))
+        if is_main_process():
+            torch.save(model.state_dict(), output_path / f"{model_name}_model.pth")
+            if encoder_mode == 'finetune':
+                torch.save(state['encoder'].state_dict(), output_path / f"{model_name}_encoder.pth")
+
+        metadata = cnn_pieceval_metadata(
+            model_name, encoder_mode, embedding_dim, head['hidden_sizes'], head['dropout_rates'],
+            train_df, val_df, state['best_epoch'], state['best_val_loss'], state['elapsed_time'], config
+        )
+        metadata['multi_head_group'] = [h['model_name'] for h in heads]
+        metadata['epochs_trained'] = state['epochs_trained']
+        metadata['perf_mode'] = perf.info()
+        metadata['throughput'] = timer.summary()
+        results[model_name] = (model, metadata)
+    if is_main_process():
+        clear_training_state(state_file)
+    distributed_barrier()
+
+    elapsed_time = time.time() - start_time
+
+    # Print training loop confirmation message and return models
     print(f"\n{'='*60}")
     print("CNN PIECE VALUE PREDICTOR TRAINING COMPLETE")
     print(f"{'='*60}")
-    print(f"Training time: {elapsed_time/60:.1f} minutes")
-    print(f"Best epoch: {best_epoch}")
-    print(f"Best val loss: {best_val_loss:.6f}")
+    print(f"Training time: {elapsed_time/60:.1f} minutes ({len(heads)} heads)")
+    print(f"Throughput: {timer.describe()}")
+    for state in states:
+        print(f"{state['head']['model_name']}: best epoch {state['best_epoch']}, "
+              f"best val loss {state['best_val_loss']:.6f}")
     print(f"{'='*60}\n")
 
-    return model, metadata
+    return results
 
 # Helper function to evaluate augmented MLP+CNN piece value predictor
-def evaluate_cnn_pieceval_model(model, df, norm_params, device, embed_column='cnn_position_embed'):
+def evaluate_cnn_pieceval_model(model, df, norm_params, device, embed_column='cnn_position_embed', embedding_store=None,
+                                encoder=None, bitboards=None, position_fens=None):
     """
     Evaluate CNN piece value model on a dataset and return MAE in centipawns.
+    If encoder is given, positions are embedded on the fly (bitboards row i is position_fens[i]).
     """
-    dataset = CNNPieceValueDataset(df, embed_column=embed_column)
-    loader = DataLoader(dataset, batch_size=1024, num_workers=0)
+    if encoder is None:
+        make_dataset = functools.partial(CNNPieceValueDataset, embed_column=embed_column, embedding_store=embedding_store)
+        loader = make_piece_value_loader(df, make_dataset, 1024, shuffle=False, device=device)
+    else:
+        dataset = CNNPieceValueDataset(df, position_fens=position_fens)
+        loader = PositionGroupedBatchLoader(dataset, bitboards, 1024, shuffle=False)
+        encoder = encoder.to(device).eval()
 
     model.eval()
     total_abs_error = 0.0
     total_samples = 0
 
     with torch.no_grad():
-        for cnn_emb, piece_loc, target in loader:
-            cnn_emb, piece_loc, target = cnn_emb.to(device), piece_loc.to(device), target.to(device)
+        for batch in loader:
+            cnn_emb, piece_loc, target = cnn_pieceval_batch(batch, device, encoder)
             pred = model(cnn_emb, piece_loc)
             abs_error = torch.abs(pred - target).sum().item()
             total_abs_error += abs_error
@@ -970,54 +2408,243 @@ def evaluate_cnn_pieceval_model(model, df, norm_params, device, embed_column='cn
 
     return float(mae_cp)
 
+# ========================================
+# MODEL ZOO EVALUATION (ONE PASS PER SPLIT)
+# ========================================
+
+# Helper function to read a split (DataFrame or ParquetPieceValueSource) one chunk of rows at a time
+def _eval_chunks(data, chunk_rows=EVAL_CHUNK_ROWS):
+    """Yields (rows, piece location features of the rows), DataFrame features come from the feature cache"""
+    if isinstance(data, ParquetPieceValueSource):
+        for row_group in data.row_groups:
+            chunk = data.read_row_group(row_group)
+            yield chunk, piece_location_features(chunk)
+    else:
+        features = load_piece_location_features(data)
+        for start in range(0, len(data), chunk_rows):
+            yield data.iloc[start:start + chunk_rows], features[start:start + chunk_rows]
+
+# Helper function to run a group of models with the same architecture on one batch
+def _model_group_runner(models, stack_weights):
+    """
+    Returns run(inputs) -> (num_models, batch) predictions, inputs holds the input tuple of every model.
+    With stack_weights several models are one vmapped functional_call over their stacked weights,
+    inputs shared by all models (the same tensor) are broadcast instead of stacked.
+    """
+    if len(models) == 1 or not stack_weights:
+        return lambda inputs: torch.stack([model(*x).reshape(-1) for model, x in zip(models, inputs)])
+
+    params, buffers = torch.func.stack_module_state(models)
+    base_model = copy.deepcopy(models[0]).to('meta')
+
+    def call(params, buffers, *args):
+        return torch.func.functional_call(base_model, (params, buffers), args).reshape(-1)
+
+    def run(inputs):
+        shared = [all(x[i] is inputs[0][i] for x in inputs) for i in range(len(inputs[0]))]
+        args = [inputs[0][i] if shared[i] else torch.stack([x[i] for x in inputs]) for i in range(len(shared))]
+        in_dims = (0, 0) + tuple(None if s else 0 for s in shared)
+        return torch.vmap(call, in_dims=in_dims)(params, buffers, *args)
+
+    return run
+
+# Function to evaluate many piece value models with one pass over a split
+def evaluate_model_zoo(data, zoo, norm_params, device, bitboards=None, position_fens=None,
+                       batch_size=EVAL_BATCH_SIZE, stack_weights=EVAL_STACK_WEIGHTS, by_piece_type=EVAL_BY_PIECE_TYPE):
+    """
+    Evaluate every model of zoo on data (DataFrame or ParquetPieceValueSource) and return
+    {name: {'mae_cp': ..., 'mae_cp_by_piece_type': {piece_type: ...}}} (breakdown only if by_piece_type).
+
+    zoo is a list of dicts with 'name', 'model' and the input of the model, one of:
+    - 'input_dim': SimplePieceValueMLP on the first 12 (MLP #1) or all 14 (MLP #2) piece location features
+    - 'embedding_store': CNNPieceValuePredictor on embeddings gathered from an EmbeddingStore
+    - 'encoder': CNNPieceValuePredictor on embeddings computed by encoder (bitboards row i is position_fens[i])
+    Models given the same store or encoder object share its embeddings, each encoder runs once per batch
+    on the unique boards of the batch.
+    """
+    # Key of the input of every model (models with equal keys get the same tensors)
+    def input_key(entry):
+        if 'embedding_store' in entry:
+            return ('store', str(entry['embedding_store'].store_dir))
+        if 'encoder' in entry:
+            return ('encoder', id(entry['encoder']))
+        return ('features', entry['input_dim'])
+
+    keys = [input_key(entry) for entry in zoo]
+    stores = {key: entry['embedding_store'] for key, entry in zip(keys, zoo) if key[0] == 'store'}
+    encoders = {key: entry['encoder'].to(device).eval() for key, entry in zip(keys, zoo) if key[0] == 'encoder'}
+    feature_dims = sorted({key[1] for key in keys if key[0] == 'features'})
+    if encoders and (bitboards is None or position_fens is None):
+        raise ValueError("bitboards and position_fens are required to evaluate models with an encoder")
+    position_index = FenIndex.from_fens(position_fens) if encoders else None
+
+    # Group models by architecture
+    groups = {}
+    for i, entry in enumerate(zoo):
+        entry['model'].to(device).eval()
+        groups.setdefault(repr(entry['model']), []).append(i)
+    runners = [(rows, _model_group_runner([zoo[i]['model'] for i in rows], stack_weights)) for rows in groups.values()]
+
+    # Summed absolute errors of every model per piece type (last bucket: any other piece type)
+    num_buckets = len(PIECE_TYPES) + 1
+    abs_errors = torch.zeros(len(zoo), num_buckets, dtype=torch.float64, device=device)
+    counts = np.zeros(num_buckets, dtype=np.int64)
+
+    with torch.no_grad():
+        for chunk, chunk_features in _eval_chunks(data):
+            piece_loc = torch.from_numpy(chunk_features)
+            target = torch.from_numpy(chunk['piece_value'].values.astype(np.float32))
+            piece_codes = pd.Categorical(chunk['piece_type'], categories=PIECE_TYPES).codes.astype(np.int64)
+            piece_codes[piece_codes < 0] = len(PIECE_TYPES)
+            counts += np.bincount(piece_codes, minlength=num_buckets)
+            piece_codes = torch.from_numpy(piece_codes)
+
+            # Rows of every position in the embedding stores / bitboards
+            store_rows = {key: store.rows_for(chunk['fen']) for key, store in stores.items()}
+            if encoders:
+                position_rows = position_index.get_indexer(chunk['fen'])
+                if (position_rows < 0).any():
+                    raise KeyError(f"{(position_rows < 0).sum():,} rows have FENs missing from position_fens")
+
+            for start in range(0, len(chunk), batch_size):
+                batch = slice(start, start + batch_size)
+                loc = piece_loc[batch].to(device)
+                inputs = {('features', dim): (loc[:, :dim],) for dim in feature_dims}
+                for key, store in stores.items():
+                    cnn_emb = np.asarray(store.embeddings[store_rows[key][batch]], dtype=np.float32)
+                    inputs[key] = (torch.from_numpy(cnn_emb).to(device), loc)
+                if encoders:
+                    # Encode every unique board once and broadcast it to all of its piece rows
+                    positions, inverse = np.unique(position_rows[batch], return_inverse=True)
+                    boards = torch.from_numpy(unpack_board_tensors(bitboards[positions])).to(device)
+                    inverse = torch.from_numpy(inverse).to(device)
+                    for key, encoder in encoders.items():
+                        inputs[key] = (encoder(boards)[inverse], loc)
+
+                batch_target = target[batch].to(device)
+                batch_codes = piece_codes[batch].to(device)
+                for rows, run in runners:
+                    errors = (run([inputs[keys[i]] for i in rows]) - batch_target).abs().double()
+                    for i, model_errors in zip(rows, errors):
+                        abs_errors[i].index_add_(0, batch_codes, model_errors)
+
+    # MAE in standardized space -> centipawns
+    abs_errors = abs_errors.cpu().numpy()
+    results = {}
+    for i, entry in enumerate(zoo):
+        result = {'mae_cp': float(abs_errors[i].sum() / counts.sum() * norm_params['std'])}
+        if by_piece_type:
+            result['mae_cp_by_piece_type'] = {
+                piece_type: float(abs_errors[i, j] / counts[j] * norm_params['std'])
+                for j, piece_type in enumerate(PIECE_TYPES + ['other']) if counts[j]
+            }
+        results[entry['name']] = result
+
+    return results
+
 # ========================================
 # CNN-ENCODED INTERMEDIATE POSITION REPRESENTATION EMBEDDING GENERATION
 # ========================================
 
-def generate_embeddings_for_fens(fens, encoder, model_name="cnn"):
+# Helper function to hash the weights of an encoder (stores record the hash of the encoder that wrote them)
+def encoder_state_hash(encoder):
+    """Hex digest of every state_dict entry (name, shape, dtype and bytes)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for name, tensor in sorted(encoder.state_dict().items()):
+        tensor = tensor.detach().cpu().contiguous()
+        digest.update(f"{name}:{tuple(tensor.shape)}:{tensor.dtype};".encode())
+        digest.update(tensor.reshape(-1).view(torch.uint8).numpy().tobytes())
+    return digest.hexdigest()
+
+def generate_embeddings_for_fens(fens, encoder, store_dir, model_name="cnn", dtype=EMBEDDING_STORE_DTYPE, bitboards=None):
     """
     Generate CNN embeddings for a list of unique FEN positions.
-    Returns a dictionary mapping FEN -> embedding array.
+    Writes them to an EmbeddingStore in store_dir and returns the store (see generate_embeddings_for_encoders).
+    """
+    stores = generate_embeddings_for_encoders(fens, {store_dir: (model_name, encoder)}, dtype=dtype, bitboards=bitboards)
+    return stores[store_dir]
+
+def generate_embeddings_for_encoders(fens, encoders, dtype=EMBEDDING_STORE_DTYPE, bitboards=None,
+                                     batch_size=EMBEDDING_BATCH_SIZE):
+    """
+    Bring the embedding stores of several encoders up to date with a list of unique FEN positions in one pass.
+    encoders is {store_dir: (model_name, encoder)}. A store written by the same encoder weights (encoder_hash in its meta)
+    and dtype only gets the FENs missing from it encoded and appended, so calling this again is a no-op. Any other
+    store is rebuilt with row i = embedding of fens[i], from the packed bitboard cache of fens (bitboards, built if not given).
+    Every batch of boards runs through all encoders that need it and is written straight into their memmapped stores.
+    Returns {store_dir: EmbeddingStore}.
     """
     print(f"\n{'='*60}")
-    print(f"GENERATING CNN POSITION EMBEDDINGS: {model_name}")
+    print(f"GENERATING CNN POSITION EMBEDDINGS: {', '.join(model_name for model_name, _ in encoders.values())}")
     print(f"{'='*60}")
     print(f"Unique positions: {len(fens):,}")
-    print(f"{'='*60}\n")
+    print(f"Embedding stores ({np.dtype(dtype).name}):")
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    encoder = encoder.to(device)
-    encoder.eval()
-
-    # Generate embeddings for unique FENs
-    print("Generating embeddings for unique positions...")
-    fen_to_embedding = {}
-
-    batch_fens = []
-    batch_size = 128 # set to avoid memory errors
-
-    with torch.no_grad():
-        for i, fen in enumerate(tqdm(fens, desc="Encoding positions")):
-            batch_fens.append(fen)
-
-            if len(batch_fens) >= batch_size or i == len(fens) - 1:
-                # Convert batch to tensors
-                batch_tensors = torch.stack([
-                    torch.from_numpy(fen_to_board_tensor(f)) for f in batch_fens
-                ]).to(device)
+    stores = {}
+    # FEN lists to encode -> (fens, [(store, encoder, first row)]), stores needing the same FENs share one pass
+    passes = {}
+    for store_dir, (model_name, encoder) in encoders.items():
+        encoder_hash = encoder_state_hash(encoder)
+        store = EmbeddingStore.open(store_dir) if EmbeddingStore.exists(store_dir) else None
+        if store is not None and store.meta['info'].get('encoder_hash') == encoder_hash and store.dtype == np.dtype(dtype):
+            pass_fens = store.missing(fens)
+            if not pass_fens:
+                print(f"  {store_dir}: up to date ({len(store):,} positions)")
+                stores[store_dir] = store
+                continue
+            print(f"  {store_dir}: appending {len(pass_fens):,} new positions to {len(store):,}")
+            start = store.append(pass_fens)
+            pass_key = hashlib.blake2b(hash_strings(pass_fens).tobytes(), digest_size=8).hexdigest()
+        else:
+            reason = "new store" if store is None else "rebuilding (encoder weights or dtype changed)"
+            print(f"  {store_dir}: {reason}")
+            store = EmbeddingStore.create(store_dir, fens, encoder.embedding_dim, dtype=dtype,
+                                          info={'model_name': model_name, 'num_layers': encoder.num_layers,
+                                                'encoder_hash': encoder_hash})
+            pass_fens, start, pass_key = fens, 0, 'all'
+        stores[store_dir] = store
+        passes.setdefault(pass_key, (pass_fens, []))[1].append((store, encoder.to(device).eval(), start))
+    print(f"{'='*60}\n")
 
-                # Generate embeddings
-                embeddings = encoder(batch_tensors).cpu().numpy()
+    generate_start = time.time()
+    num_encoded = 0
+    for pass_key, (pass_fens, targets) in passes.items():
+        models = [encoder for _, encoder, _ in targets]
+        perf = PerfMode(device, models)
+
+        if pass_key == 'all':
+            # Sequential batches of whole rows of the bitboard cache (rows stay in order)
+            if bitboards is None:
+                bitboards = load_bitboard_cache(fens)
+            dataset = PackedPositionBatchDataset(bitboards, np.arange(len(fens)))
+            loader = DataLoader(dataset, batch_size=None, num_workers=0, pin_memory=device.type == 'cuda',
+                                sampler=BatchSampler(SequentialSampler(dataset), batch_size, drop_last=False))
+        else:
+            # New positions are decoded directly
+            loader = (torch.from_numpy(fens_to_board_tensors(pass_fens[i:i + batch_size]))
+                      for i in range(0, len(pass_fens), batch_size))
 
-                # Store in dictionary
-                for fen, emb in zip(batch_fens, embeddings):
-                    fen_to_embedding[fen] = emb
+        with torch.inference_mode(), perf.autocast():
+            row = 0
+            for boards in tqdm(loader, total=(len(pass_fens) + batch_size - 1) // batch_size, desc="Encoding positions"):
+                boards = perf.boards(boards.to(device, non_blocking=True))
+                # Cast on the device so only store dtype bytes are copied back
+                for store, encoder, start in targets:
+                    store.write(start + row, encoder(boards).to(getattr(torch, store.dtype.name)).cpu().numpy())
+                row += len(boards)
+        num_encoded += len(pass_fens) * len(targets)
 
-                batch_fens = []
+        for store, _, _ in targets:
+            store.finalize()
 
-    print(f"Generated {len(fen_to_embedding):,} embeddings\n")
+    if num_encoded:
+        elapsed = time.time() - generate_start
+        total_bytes = sum(store.nbytes() for store in stores.values())
+        print(f"Encoded {num_encoded:,} position embeddings ({total_bytes / 1e9:.2f} GB of stores) in {elapsed:.1f}s "
+              f"({num_encoded / max(elapsed, 1e-9):,.0f} embeddings/sec)\n")
 
-    return fen_to_embedding
+    return stores
 
 
 # ========================================
@@ -1038,6 +2665,149 @@ def load_parquet_chunked(parquet_file, chunk_size=10000):
     print(f"Loaded {len(df):,} rows\n")
     return df
 
+# Helper method to get the folds of a fold dataset that are not held out for validation
+def training_folds(dataset_dir, val_folds):
+    fold_dirs = sorted(p.name for p in Path(dataset_dir).glob("fold=*"))
+    all_folds = [int(name.split("=", 1)[1]) for name in fold_dirs]
+    return [f for f in all_folds if f not in val_folds]
+
+# Helper method for the file in UNIQUE_FENS_DIR holding the unique FENs of a pair of train/val ParquetPieceValueSources
+def unique_fens_path(train_source, val_source):
+    source_key = hashlib.blake2b(json.dumps(train_source.files + val_source.files).encode(), digest_size=8).hexdigest()
+    return Path(UNIQUE_FENS_DIR) / f"unique_fens_{source_key}.txt"
+
+# Helper method to load train/val DFs from a fold dataset (only the needed fold directories are read)
+def load_fold_split(dataset_dir, val_folds):
+    """
+    Load held out val_folds as validation and every other fold as training data.
+    """
+    train_folds = training_folds(dataset_dir, val_folds)
+    print(f"Loading folds from {dataset_dir}: train folds {train_folds}, val folds {list(val_folds)}")
+
+    train_df = load_folds(dataset_dir, train_folds).drop(columns=['fold'])
+    val_df = load_folds(dataset_dir, val_folds).drop(columns=['fold'])
+
+    print(f"Loaded {len(train_df):,} training rows and {len(val_df):,} validation rows\n")
+    return train_df, val_df
+
+# Helper method to load the train/val data (STEP 1) and standardize piece values (STEP 2)
+def load_training_data():
+    """
+    Returns train_df/val_df (DataFrames with standardized piece_value, or ParquetPieceValueSources that
+    standardize while streaming if TRAINING_DATA_MODE = 'streaming'), norm_params and the unique FENs of
+    the training set ('unique_fens') and of both sets ('all_unique_fens'). When streaming those are UniqueFenLists
+    (one file in UNIQUE_FENS_DIR, the training FENs are its first rows) instead of lists.
+    """
+    print(f"\n{'='*80}")
+    print("STEP 1: LOADING DATA")
+    print(f"{'='*80}")
+
+    if TRAINING_DATA_MODE == 'streaming':
+        if CNN_ENCODER_MODE != 'precomputed':
+            raise ValueError(f"TRAINING_DATA_MODE = 'streaming' needs CNN_ENCODER_MODE = 'precomputed', not '{CNN_ENCODER_MODE}'")
+        # Only row group metadata is read here, rows are streamed during training
+        if FOLD_DATASET_DIR is not None:
+            train_df = ParquetPieceValueSource.from_folds(FOLD_DATASET_DIR, training_folds(FOLD_DATASET_DIR, VAL_FOLDS))
+            val_df = ParquetPieceValueSource.from_folds(FOLD_DATASET_DIR, VAL_FOLDS)
+        else:
+            train_df = ParquetPieceValueSource([TRAINING_PARQUET])
+            val_df = ParquetPieceValueSource([VALIDATION_PARQUET])
+        print(f"Streaming {len(train_df):,} training rows ({len(train_df.row_groups)} row groups) "
+              f"and {len(val_df):,} validation rows ({len(val_df.row_groups)} row groups)")
+        print(f"Shuffle buffer: {STREAM_SHUFFLE_BUFFER_ROWS:,} rows, loader workers: {STREAM_NUM_WORKERS}")
+        print("Scanning piece value statistics...\n")
+        # Unique FENs go straight to disk: train FENs first, then val FENs not in train
+        # (same order as pd.concat([train_df['fen'], val_df['fen']]).unique())
+        fens_writer = UniqueFenListWriter(unique_fens_path(train_df, val_df))
+        train_stats = scan_piece_value_files(train_df, fens_writer)
+        num_train_fens = len(fens_writer)
+        val_stats = scan_piece_value_files(val_df, fens_writer)
+        all_unique_fens = fens_writer.close()
+        unique_fens = all_unique_fens.head(num_train_fens)
+        print(f"Unique FENs written to {all_unique_fens.path}\n")
+    else:
+        # Load training and validation DF
+        if FOLD_DATASET_DIR is not None:
+            train_df, val_df = load_fold_split(FOLD_DATASET_DIR, VAL_FOLDS)
+        else:
+            train_df = load_parquet_chunked(TRAINING_PARQUET, CHUNK_SIZE)
+            val_df = load_parquet_chunked(VALIDATION_PARQUET, CHUNK_SIZE)
+        train_stats = summarize_piece_values(train_df)
+        val_stats = summarize_piece_values(val_df)
+        unique_fens = train_stats['unique_fens']
+        # Same order as pd.concat([train_df['fen'], val_df['fen']]).unique()
+        all_unique_fens = list(dict.fromkeys(train_stats['unique_fens'] + val_stats['unique_fens']))
+
+    print("Training dataset statistics:")
+    print(f"  Total piece values: {train_stats['rows']:,}")
+    print(f"  Unique positions: {train_stats['unique_positions']:,}")
+    print(f"  Unique games: {train_stats['unique_games']:,}")
+    print(f"  Piece value range: [{train_stats['min']}, {train_stats['max']}]")
+    print(f"  Piece value mean: {train_stats['mean']:.2f}")
+    print(f"  Piece value std: {train_stats['std']:.2f}")
+
+    print("\nValidation dataset statistics:")
+    print(f"  Total piece values: {val_stats['rows']:,}")
+    print(f"  Unique positions: {val_stats['unique_positions']:,}")
+    print(f"  Unique games: {val_stats['unique_games']:,}")
+    print(f"  Piece value range: [{val_stats['min']}, {val_stats['max']}]")
+
+    # Verify game-level split integrity (on sorted 64-bit hashes, much cheaper than sets of strings)
+    game_overlap = np.intersect1d(train_stats['game_hashes'], val_stats['game_hashes'], assume_unique=True)
+    if len(game_overlap):
+        print(f"\n  WARNING: {len(game_overlap)} games appear in both train and val sets!")
+        print(f"  Consider re-running optimized_create_val_train_splits.py")
+    else:
+        print(f"\n  Game-level split verified: 0 games overlap between train and val")
+    val_fens = val_stats['fen_hashes']
+    fen_overlap = np.intersect1d(train_stats['fen_hashes'], val_fens, assume_unique=True)
+    print(f"  Val positions also in train: {len(fen_overlap):,} ({len(fen_overlap)/max(len(val_fens), 1):.1%} of val FENs)")
+
+    # ========================================
+    # Normalize piece values using standardization
+    # ========================================
+    print(f"\n{'='*80}")
+    print("STEP 2: NORMALIZING PIECE VALUES (STANDARDIZATION)")
+    print(f"{'='*80}")
+
+    # Use training data to compute normalization parameters
+    value_mean = train_stats['mean']
+    value_std = train_stats['std']
+
+    print(f"Training set piece value statistics:")
+    print(f"  Mean: {value_mean:.2f} cp")
+    print(f"  Std:  {value_std:.2f} cp")
+    print(f"  Min:  {train_stats['min']} cp")
+    print(f"  Max:  {train_stats['max']} cp")
+
+    norm_params = {
+        'mean': float(value_mean),
+        'std': float(value_std),
+        'normalization_type': 'standardization'
+    }
+
+    print(f"\nNormalized: (value - {value_mean:.2f}) / {value_std:.2f}")
+    if TRAINING_DATA_MODE == 'streaming':
+        # Applied to every row group as it is read
+        train_df.norm_params = norm_params
+        val_df.norm_params = norm_params
+    else:
+        # Standardize both datasets using training statistics
+        train_df['piece_value'] = (train_df['piece_value'] - value_mean) / value_std
+        val_df['piece_value'] = (val_df['piece_value'] - value_mean) / value_std
+
+        # Print normalized data statistics
+        print(f"New train mean: {train_df['piece_value'].mean():.4f} (should be ~0)")
+        print(f"New train std:  {train_df['piece_value'].std():.4f} (should be ~1)\n")
+
+    return {
+        'train_df': train_df,
+        'val_df': val_df,
+        'norm_params': norm_params,
+        'unique_fens': unique_fens,
+        'all_unique_fens': all_unique_fens,
+    }
+
 
 # ========================================
 # MAIN METHOD (RUN THE STUFF)
@@ -1045,6 +2815,9 @@ def load_parquet_chunked(parquet_file, chunk_size=10000):
 
 # The main method
 def main():
+    # Join the other ranks when launched with torchrun (only rank 0 prints from here on)
+    world_size = init_distributed()[1]
+
     # Calculate total models being trained in the loop
     total_models = len(CNN_EMBEDDING_DIMS) * len(CNN_LAYER_DEPTHS) * len(CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS)
     total_models_all = 3 + total_models  # 3 MLPs + CNN models
@@ -1073,75 +2846,22 @@ def main():
     output_dir = Path(OUTPUT_DIR)
     output_dir.mkdir(exist_ok=True, parents=True)
 
-    # ========================================
-    # Load pval data and get unique FENs
-    # ========================================
-    print(f"\n{'='*80}")
-    print("STEP 1: LOADING DATA")
-    print(f"{'='*80}")
-
-    # Load training and validation DF
-    train_df = load_parquet_chunked(TRAINING_PARQUET, CHUNK_SIZE)
-    val_df = load_parquet_chunked(VALIDATION_PARQUET, CHUNK_SIZE)
-
-    print("Training dataset statistics:")
-    print(f"  Total piece values: {len(train_df):,}")
-    print(f"  Unique positions: {train_df['fen'].nunique():,}")
-    print(f"  Unique games: {train_df['game_id'].nunique():,}")
-    print(f"  Piece value range: [{train_df['piece_value'].min()}, {train_df['piece_value'].max()}]")
-    print(f"  Piece value mean: {train_df['piece_value'].mean():.2f}")
-    print(f"  Piece value std: {train_df['piece_value'].std():.2f}")
-
-    print("\nValidation dataset statistics:")
-    print(f"  Total piece values: {len(val_df):,}")
-    print(f"  Unique positions: {val_df['fen'].nunique():,}")
-    print(f"  Unique games: {val_df['game_id'].nunique():,}")
-    print(f"  Piece value range: [{val_df['piece_value'].min()}, {val_df['piece_value'].max()}]")
-
-    # Verify game-level split integrity
-    train_games = set(train_df['game_id'].unique())
-    val_games = set(val_df['game_id'].unique())
-    game_overlap = train_games & val_games
-    if game_overlap:
-        print(f"\n  WARNING: {len(game_overlap)} games appear in both train and val sets!")
-        print(f"  Consider re-running optimized_create_val_train_splits.py")
-    else:
-        print(f"\n  Game-level split verified: 0 games overlap between train and val")
-
-    # Get unique FENs for position encoder training (from training set only)
-    unique_fens = train_df['fen'].unique().tolist()
+    if world_size > 1:
+        print(f"Distributed data parallel training on {world_size} ranks ({DISTRIBUTED_BACKEND}), "
+              f"{torch.get_num_threads()} threads per rank")
+    elif PERF_MODE:
+        torch.set_num_threads(perf_num_threads())
+    if PERF_MODE:
+        print(f"PERF_MODE on with {torch.get_num_threads()} threads (settings of each model are saved in its metadata)")
 
     # ========================================
-    # Normalize piece values using standardization
+    # Load pval data, get unique FENs and normalize piece values
     # ========================================
-    print(f"\n{'='*80}")
-    print("STEP 2: NORMALIZING PIECE VALUES (STANDARDIZATION)")
-    print(f"{'='*80}")
+    data = load_training_data()
+    train_df, val_df, norm_params = data['train_df'], data['val_df'], data['norm_params']
 
-    # Use training data to compute normalization parameters
-    value_mean = train_df['piece_value'].mean()
-    value_std = train_df['piece_value'].std()
-
-    print(f"Training set piece value statistics:")
-    print(f"  Mean: {value_mean:.2f} cp")
-    print(f"  Std:  {value_std:.2f} cp")
-    print(f"  Min:  {train_df['piece_value'].min()} cp")
-    print(f"  Max:  {train_df['piece_value'].max()} cp")
-
-    # Standardize both datasets using training statistics
-    train_df['piece_value'] = (train_df['piece_value'] - value_mean) / value_std
-    val_df['piece_value'] = (val_df['piece_value'] - value_mean) / value_std
-
-    norm_params = {
-        'mean': float(value_mean),
-        'std': float(value_std),
-        'normalization_type': 'standardization'
-    }
-
-    # Print normalized data statistics
-    print(f"\nNormalized: (value - {value_mean:.2f}) / {value_std:.2f}")
-    print(f"New train mean: {train_df['piece_value'].mean():.4f} (should be ~0)")
-    print(f"New train std:  {train_df['piece_value'].std():.4f} (should be ~1)\n")
+    # Unique FENs for position encoder training (from training set only)
+    unique_fens = data['unique_fens']
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
     print(f"Using device: {device}\n")
@@ -1212,14 +2932,12 @@ def main():
     print(f"{'='*80}")
 
     # Get all unique FENs from both training and validation sets
-    all_unique_fens = pd.concat([train_df['fen'], val_df['fen']]).unique().tolist()
-
-    # Load original parquet files (we'll add columns to these)
-    train_df_original = pd.read_parquet(TRAINING_PARQUET)
-    val_df_original = pd.read_parquet(VALIDATION_PARQUET)
+    all_unique_fens = data['all_unique_fens']
 
     cnn_models_metadata = {}
     encoder_configs = []  # Track all encoder configs for later use
+    unique_fen_bitboards = None  # Packed bitboard cache shared by every encoder (built on first use)
+    embedding_encoders = {}  # Encoders whose embeddings are generated together after training {store_dir: (name, encoder)}
 
     for embedding_dim in CNN_EMBEDDING_DIMS:
         for num_layers in CNN_LAYER_DEPTHS:
@@ -1230,6 +2948,7 @@ def main():
             encoder_configs.append({
                 'model_name': encoder_model_name,
                 'embed_column': embed_column_name,
+                'embedding_store': str(output_dir / f"{embed_column_name}_store"),
                 'embedding_dim': embedding_dim,
                 'num_layers': num_layers
             })
@@ -1262,6 +2981,9 @@ def main():
                 print(f"Embedding column name: {embed_column_name}")
                 print(f"{'='*80}")
 
+                if unique_fen_bitboards is None:
+                    unique_fen_bitboards = load_bitboard_cache(unique_fens)
+
                 # Train CNN position encoder
                 encoder, encoder_metadata = train_cnn_position_encoder(
                     unique_fens,
@@ -1269,25 +2991,16 @@ def main():
                     output_dir,
                     embedding_dim=embedding_dim,
                     num_layers=num_layers,
-                    model_name=encoder_model_name
+                    model_name=encoder_model_name,
+                    bitboards=unique_fen_bitboards
                 )
 
-            # Generate embeddings for all unique FENs
-            fen_to_embedding = generate_embeddings_for_fens(
-                all_unique_fens,
-                encoder,
-                model_name=encoder_model_name
-            )
-
-            # Temporarily add embeddings to training dataframe
-            print(f"Adding {embed_column_name} column to training data...")
-            train_df_original[embed_column_name] = train_df_original['fen'].map(fen_to_embedding)
-
-            # Temporarily add embeddings to validation dataframe
-            print(f"Adding {embed_column_name} column to validation data...")
-            val_df_original[embed_column_name] = val_df_original['fen'].map(fen_to_embedding)
-
-            print(f"Embeddings added successfully!\n")
+            # Embeddings of all encoders are generated together once every encoder is trained
+            # (not needed if pval heads run the encoder themselves)
+            if CNN_ENCODER_MODE == 'precomputed':
+                embedding_encoders[encoder_configs[-1]['embedding_store']] = (encoder_model_name, encoder)
+            else:
+                print(f"CNN_ENCODER_MODE={CNN_ENCODER_MODE}: embeddings are computed during pval training\n")
 
             # Store encoder metadata
             cnn_models_metadata[encoder_model_name] = {
@@ -1296,48 +3009,28 @@ def main():
             }
 
             # Clear GPU memory for encoder
-            del encoder, fen_to_embedding
+            del encoder
             gc.collect()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
 
-    # Save embeddings to separate lookup files
-    # Saving them in the main parquet leads to VERY large files (40 GB+)
-    print(f"\n{'='*80}")
-    print("SAVING EMBEDDING LOOKUP FILES")
-    print(f"{'='*80}")
-    print("NOTE: Embeddings stored separately to avoid parquet file bloat")
-    print("      (Each 512d embedding x millions of rows = 40GB+ if stored inline)")
-
-    # Save FEN -> embedding mappings as separate pickle files
-    for config in encoder_configs:
-        embed_column_name = config['embed_column']
-
-        # Create lookup dict efficiently by dropping duplicates first
-        train_unique = train_df_original.drop_duplicates(subset='fen')[['fen', embed_column_name]]
-        fen_embed_lookup = dict(zip(train_unique['fen'], train_unique[embed_column_name]))
-
-        # Add any val-only FENs
-        val_unique = val_df_original.drop_duplicates(subset='fen')[['fen', embed_column_name]]
-        for fen, embed in zip(val_unique['fen'], val_unique[embed_column_name]):
-            if fen not in fen_embed_lookup:
-                fen_embed_lookup[fen] = embed
-
-        # Save as pickle (preserves FEN -> numpy array mapping efficiently)
-        embed_file = output_dir / f"{embed_column_name}_lookup.pkl"
-        with open(embed_file, 'wb') as f:
-            pickle.dump(fen_embed_lookup, f)
-        print(f"  Saved {embed_file} ({len(fen_embed_lookup):,} unique FENs)")
-
-        # Remove embedding column from dataframes to keep parquet files small
-        train_df_original.drop(columns=[embed_column_name], inplace=True)
-        val_df_original.drop(columns=[embed_column_name], inplace=True)
-
-    print()
-
-    # Clean up original dataframes (embeddings now saved to pickle files)
-    del train_df_original, val_df_original
+    # Packed bitboard cache of every train/val FEN (boards decoded once, used for embedding generation and frozen/finetuned encoders)
+    all_fen_bitboards = load_bitboard_cache(all_unique_fens)
+
+    # Generate embeddings for all unique FENs with every encoder in one pass
+    # Saved to separate memmapped stores, saving them in the main parquet leads to VERY large files (40 GB+)
+    # (written by rank 0 when distributed, the other ranks open the stores in step 5)
+    if embedding_encoders:
+        if is_main_process():
+            embedding_stores = generate_embeddings_for_encoders(all_unique_fens, embedding_encoders, bitboards=all_fen_bitboards)
+            for store in embedding_stores.values():
+                print(f"Saved {store.meta['info']['model_name']} embeddings to {store.store_dir}")
+            del embedding_stores
+        distributed_barrier()
+    del embedding_encoders
     gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
     # ========================================
     # Train Augmented CNN+MLP Piece Value Predictors
@@ -1354,67 +3047,126 @@ def main():
         embedding_dim = config['embedding_dim']
         num_layers = config['num_layers']
 
-        # Load embedding lookup for this encoder
-        embed_file = output_dir / f"{embed_column_name}_lookup.pkl"
-        print(f"\nLoading embeddings from {embed_file}...")
-        with open(embed_file, 'rb') as f:
-            fen_to_embedding = pickle.load(f)
-        print(f"  Loaded {len(fen_to_embedding):,} FEN -> embedding mappings")
-
-        # Create dataframes with embeddings for this encoder only
-        train_df_with_embed = train_df.copy()
-        val_df_with_embed = val_df.copy()
-        # Add embedding columns
-        train_df_with_embed[embed_column_name] = train_df_with_embed['fen'].map(fen_to_embedding)
-        val_df_with_embed[embed_column_name] = val_df_with_embed['fen'].map(fen_to_embedding)
+        # Open embedding store for this encoder (rows are gathered per batch, nothing is copied into the DFs)
+        embedding_store = None
+        if CNN_ENCODER_MODE == 'precomputed':
+            embedding_store = EmbeddingStore.open(config['embedding_store'])
+            print(f"\nUsing embeddings from {embedding_store.store_dir} ({len(embedding_store):,} positions)")
+        else:
+            print(f"\nUsing {CNN_ENCODER_MODE} encoder {encoder_model_name}")
 
         # Train piece value predictors with different hidden layer architectures
-        for num_hidden_layers in sorted(CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS.keys()):
-            model_counter += 1
-            hidden_sizes = CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS[num_hidden_layers] # CNN autoencoder layer count
-            dropout_rates = CNN_PIECEVAL_DROPOUT_RATES[num_hidden_layers] # dropout
-            hidden_arch_str = '-'.join(map(str, hidden_sizes)) # MLP layer count + nuerons
-
-            # Full model name with piece value predictor architecture
-            full_model_name = f"{encoder_model_name}_pval_{hidden_arch_str}"
+        if CNN_PIECEVAL_MULTI_HEAD:
+            heads = []
+            for num_hidden_layers in sorted(CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS.keys()):
+                hidden_sizes = CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS[num_hidden_layers]
+                heads.append({
+                    'model_name': f"{encoder_model_name}_pval_{'-'.join(map(str, hidden_sizes))}",
+                    'hidden_sizes': hidden_sizes,
+                    'dropout_rates': CNN_PIECEVAL_DROPOUT_RATES[num_hidden_layers],
+                })
 
             print(f"\n{'='*80}")
-            print(f"TRAINING MODEL {model_counter}/{total_models}: {full_model_name}")
+            print(f"TRAINING MODELS {model_counter + 1}-{model_counter + len(heads)}/{total_models} TOGETHER")
             print(f"Using embeddings from: {embed_column_name}")
-            print(f"Graduated dropout rates: {dropout_rates}")
             print(f"{'='*80}")
 
-            # Train CNN piece value predictor
-            pieceval_model, pieceval_metadata = train_cnn_pieceval_model(
-                train_df_with_embed,
-                val_df_with_embed,
+            # Every pval head starts from the trained encoder
+            encoder = None
+            if CNN_ENCODER_MODE != 'precomputed':
+                encoder = ChessCNNEncoder(embedding_dim=embedding_dim, num_layers=num_layers)
+                encoder.load_state_dict(torch.load(output_dir / f"{encoder_model_name}_encoder.pth"))
+
+            head_results = train_cnn_pieceval_heads(
+                train_df,
+                val_df,
                 CNN_PIECEVAL_CONFIG,
                 norm_params,
                 output_dir,
+                heads,
                 embedding_dim=embedding_dim,
-                hidden_sizes=hidden_sizes,
-                dropout_rates=dropout_rates,
-                model_name=full_model_name,
-                embed_column=embed_column_name
+                embed_column=embed_column_name,
+                embedding_store=embedding_store,
+                encoder_mode=CNN_ENCODER_MODE,
+                encoder=encoder,
+                bitboards=all_fen_bitboards,
+                position_fens=all_unique_fens
             )
 
             # Store metadata
-            cnn_models_metadata[full_model_name] = {
-                'encoder': cnn_models_metadata[encoder_model_name]['encoder'],
-                'embed_column': embed_column_name,
-                'pieceval': pieceval_metadata
-            }
+            for full_model_name, (_, pieceval_metadata) in head_results.items():
+                cnn_models_metadata[full_model_name] = {
+                    'encoder': cnn_models_metadata[encoder_model_name]['encoder'],
+                    'embed_column': embed_column_name,
+                    'pieceval': pieceval_metadata
+                }
+            model_counter += len(heads)
 
             # Clear GPU memory
-            del pieceval_model
+            del head_results, encoder
             gc.collect()
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
 
-            print(f"\nCompleted training for {full_model_name} ({model_counter}/{total_models})")
+            print(f"\nCompleted training for {len(heads)} heads of {encoder_model_name} ({model_counter}/{total_models})")
+        else:
+            for num_hidden_layers in sorted(CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS.keys()):
+                model_counter += 1
+                hidden_sizes = CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS[num_hidden_layers] # CNN autoencoder layer count
+                dropout_rates = CNN_PIECEVAL_DROPOUT_RATES[num_hidden_layers] # dropout
+                hidden_arch_str = '-'.join(map(str, hidden_sizes)) # MLP layer count + nuerons
+
+                # Full model name with piece value predictor architecture
+                full_model_name = f"{encoder_model_name}_pval_{hidden_arch_str}"
+
+                print(f"\n{'='*80}")
+                print(f"TRAINING MODEL {model_counter}/{total_models}: {full_model_name}")
+                print(f"Using embeddings from: {embed_column_name}")
+                print(f"Graduated dropout rates: {dropout_rates}")
+                print(f"{'='*80}")
+
+                # Every pval head starts from the trained encoder
+                encoder = None
+                if CNN_ENCODER_MODE != 'precomputed':
+                    encoder = ChessCNNEncoder(embedding_dim=embedding_dim, num_layers=num_layers)
+                    encoder.load_state_dict(torch.load(output_dir / f"{encoder_model_name}_encoder.pth"))
+
+                # Train CNN piece value predictor
+                pieceval_model, pieceval_metadata = train_cnn_pieceval_model(
+                    train_df,
+                    val_df,
+                    CNN_PIECEVAL_CONFIG,
+                    norm_params,
+                    output_dir,
+                    embedding_dim=embedding_dim,
+                    hidden_sizes=hidden_sizes,
+                    dropout_rates=dropout_rates,
+                    model_name=full_model_name,
+                    embed_column=embed_column_name,
+                    embedding_store=embedding_store,
+                    encoder_mode=CNN_ENCODER_MODE,
+                    encoder=encoder,
+                    bitboards=all_fen_bitboards,
+                    position_fens=all_unique_fens
+                )
+
+                # Store metadata
+                cnn_models_metadata[full_model_name] = {
+                    'encoder': cnn_models_metadata[encoder_model_name]['encoder'],
+                    'embed_column': embed_column_name,
+                    'pieceval': pieceval_metadata
+                }
+
+                # Clear GPU memory
+                del pieceval_model, encoder
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
 
-        # Clear dataframes and embedding lookup for this encoder before moving to next
-        del train_df_with_embed, val_df_with_embed, fen_to_embedding
+                print(f"\nCompleted training for {full_model_name} ({model_counter}/{total_models})")
+
+        # Close embedding store for this encoder before moving to next
+        del embedding_store
         gc.collect()
         if torch.cuda.is_available():
             torch.cuda.empty_cache()
@@ -1426,109 +3178,72 @@ def main():
     print("STEP 6: EVALUATING ALL MODELS (MAE in centipawns)")
     print(f"{'='*80}")
 
-    evaluation_results = {}
-
-    # Evaluate MLP models
-    print("\nEvaluating MLP models...")
-
-    # MLP #1
-    mlp1_model_loaded = SimplePieceValueMLP(input_dim=12, hidden_sizes=MLP_CONFIG['hidden_sizes'], dropout=MLP_CONFIG['dropout']).to(device)
-    mlp1_model_loaded.load_state_dict(torch.load(output_dir / "mlp1_model.pth"))
-    mlp1_train_error = evaluate_mlp_model(mlp1_model_loaded, train_df, include_quadratic=False, norm_params=norm_params, device=device)
-    mlp1_val_error = evaluate_mlp_model(mlp1_model_loaded, val_df, include_quadratic=False, norm_params=norm_params, device=device)
-    evaluation_results['mlp1'] = {'train_error_cp': mlp1_train_error, 'val_error_cp': mlp1_val_error}
-    print(f"  mlp1: Train={mlp1_train_error:.2f} cp, Val={mlp1_val_error:.2f} cp")
-    del mlp1_model_loaded
-
-    # MLP #2
-    mlp2_model_loaded = SimplePieceValueMLP(input_dim=14, hidden_sizes=MLP_CONFIG['hidden_sizes'], dropout=MLP_CONFIG['dropout']).to(device)
-    mlp2_model_loaded.load_state_dict(torch.load(output_dir / "mlp2_model.pth"))
-    mlp2_train_error = evaluate_mlp_model(mlp2_model_loaded, train_df, include_quadratic=True, norm_params=norm_params, device=device)
-    mlp2_val_error = evaluate_mlp_model(mlp2_model_loaded, val_df, include_quadratic=True, norm_params=norm_params, device=device)
-    evaluation_results['mlp2'] = {'train_error_cp': mlp2_train_error, 'val_error_cp': mlp2_val_error}
-    print(f"  mlp2: Train={mlp2_train_error:.2f} cp, Val={mlp2_val_error:.2f} cp")
-    del mlp2_model_loaded
-
-    # Gupta's 2023 MLP
-    chessable_model_loaded = SimplePieceValueMLP(input_dim=12, hidden_sizes=CHESSABLE_RESEARCH_2023_CONFIG['hidden_sizes'], dropout=CHESSABLE_RESEARCH_2023_CONFIG['dropout']).to(device)
-    chessable_model_loaded.load_state_dict(torch.load(output_dir / "chessable2023_model.pth"))
-    chessable_train_error = evaluate_mlp_model(chessable_model_loaded, train_df, include_quadratic=False, norm_params=norm_params, device=device)
-    chessable_val_error = evaluate_mlp_model(chessable_model_loaded, val_df, include_quadratic=False, norm_params=norm_params, device=device)
-    evaluation_results['chessable2023'] = {'train_error_cp': chessable_train_error, 'val_error_cp': chessable_val_error}
-    print(f"  chessable2023: Train={chessable_train_error:.2f} cp, Val={chessable_val_error:.2f} cp")
-    del chessable_model_loaded
+    # Load every saved model with its input (frozen heads share one copy of their encoder)
+    zoo = []
+    for name, input_dim, model_config in [('mlp1', 12, MLP_CONFIG), ('mlp2', 14, MLP_CONFIG),
+                                          ('chessable2023', 12, CHESSABLE_RESEARCH_2023_CONFIG)]:
+        model = SimplePieceValueMLP(input_dim=input_dim, hidden_sizes=model_config['hidden_sizes'], dropout=model_config['dropout'])
+        model.load_state_dict(torch.load(output_dir / f"{name}_model.pth"))
+        zoo.append({'name': name, 'model': model, 'input_dim': input_dim})
 
-    # Empty GPU memory
-    gc.collect()
-    if torch.cuda.is_available():
-        torch.cuda.empty_cache()
-
-    # Evaluate augmented CNN+MLP models
-    print("\nEvaluating CNN models...")
-
-    # Evaluate each config of CNN+MLP model
     for config in encoder_configs:
         encoder_model_name = config['model_name']
-        embed_column_name = config['embed_column']
         embedding_dim = config['embedding_dim']
 
-        # Load embedding lookup for this encoder
-        embed_file = output_dir / f"{embed_column_name}_lookup.pkl"
-        with open(embed_file, 'rb') as f:
-            fen_to_embedding = pickle.load(f)
-
-        # Create dataframes with embeddings for this encoder only
-        train_df_with_embed = train_df.copy()
-        val_df_with_embed = val_df.copy()
-        train_df_with_embed[embed_column_name] = train_df_with_embed['fen'].map(fen_to_embedding)
-        val_df_with_embed[embed_column_name] = val_df_with_embed['fen'].map(fen_to_embedding)
+        # Input of this encoder's heads: its embedding store or the trained encoder
+        head_input = {}
+        if CNN_ENCODER_MODE == 'precomputed':
+            head_input = {'embedding_store': EmbeddingStore.open(config['embedding_store'])}
+        elif CNN_ENCODER_MODE == 'frozen':
+            encoder = ChessCNNEncoder(embedding_dim=embedding_dim, num_layers=config['num_layers'])
+            encoder.load_state_dict(torch.load(output_dir / f"{encoder_model_name}_encoder.pth"))
+            head_input = {'encoder': encoder}
 
-        # Evaluate each piece value predictor variant
         for num_hidden_layers in sorted(CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS.keys()):
             hidden_sizes = CNN_PIECEVAL_HIDDEN_LAYER_VARIANTS[num_hidden_layers]
-            dropout_rates = CNN_PIECEVAL_DROPOUT_RATES[num_hidden_layers]
-            hidden_arch_str = '-'.join(map(str, hidden_sizes))
-            full_model_name = f"{encoder_model_name}_pval_{hidden_arch_str}"
+            full_model_name = f"{encoder_model_name}_pval_{'-'.join(map(str, hidden_sizes))}"
 
             # Load model (with graduated dropout)
             cnn_model_loaded = CNNPieceValuePredictor(
                 embedding_dim=embedding_dim,
                 hidden_sizes=hidden_sizes,
-                dropout_rates=dropout_rates
-            ).to(device)
+                dropout_rates=CNN_PIECEVAL_DROPOUT_RATES[num_hidden_layers]
+            )
             cnn_model_loaded.load_state_dict(torch.load(output_dir / f"{full_model_name}_model.pth"))
 
-            # Evaluate
-            cnn_train_error = evaluate_cnn_pieceval_model(
-                cnn_model_loaded,
-                train_df_with_embed,
-                norm_params=norm_params,
-                device=device,
-                embed_column=embed_column_name
-            )
-            cnn_val_error = evaluate_cnn_pieceval_model(
-                cnn_model_loaded,
-                val_df_with_embed,
-                norm_params=norm_params,
-                device=device,
-                embed_column=embed_column_name
-            )
+            # Finetuned heads have their own copy of the encoder
+            model_input = head_input
+            if CNN_ENCODER_MODE == 'finetune':
+                encoder = ChessCNNEncoder(embedding_dim=embedding_dim, num_layers=config['num_layers'])
+                encoder.load_state_dict(torch.load(output_dir / f"{full_model_name}_encoder.pth"))
+                model_input = {'encoder': encoder}
 
-            evaluation_results[full_model_name] = {'train_error_cp': cnn_train_error, 'val_error_cp': cnn_val_error}
+            zoo.append({'name': full_model_name, 'model': cnn_model_loaded, **model_input})
 
-            print(f"  {full_model_name}: Train={cnn_train_error:.2f} cp, Val={cnn_val_error:.2f} cp")
+    # One pass over each split runs every model
+    print(f"\nEvaluating {len(zoo)} models (one pass over train and val)...")
+    split_results = {}
+    for split, df in [('train', train_df), ('val', val_df)]:
+        split_start = time.time()
+        split_results[split] = evaluate_model_zoo(df, zoo, norm_params, device,
+                                                  bitboards=all_fen_bitboards, position_fens=all_unique_fens)
+        print(f"  {split}: {len(df):,} rows in {time.time() - split_start:.1f}s")
 
-            # Empty GPU memory
-            del cnn_model_loaded
-            gc.collect()
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
+    evaluation_results = {}
+    for entry in zoo:
+        name = entry['name']
+        train_result, val_result = split_results['train'][name], split_results['val'][name]
+        evaluation_results[name] = {'train_error_cp': train_result['mae_cp'], 'val_error_cp': val_result['mae_cp']}
+        if EVAL_BY_PIECE_TYPE:
+            evaluation_results[name]['train_error_cp_by_piece_type'] = train_result['mae_cp_by_piece_type']
+            evaluation_results[name]['val_error_cp_by_piece_type'] = val_result['mae_cp_by_piece_type']
+        print(f"  {name}: Train={train_result['mae_cp']:.2f} cp, Val={val_result['mae_cp']:.2f} cp")
 
-        # Clean up this encoder's data before moving to next
-        del train_df_with_embed, val_df_with_embed, fen_to_embedding
-        gc.collect()
-        if torch.cuda.is_available():
-            torch.cuda.empty_cache()
+    # Empty GPU memory
+    del zoo
+    gc.collect()
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
 
     # ========================================
     # Save Final Model Eval Results
@@ -1567,8 +3282,9 @@ def main():
 
     # Save to JSON
     metrics_file = output_dir / "all_models_metrics.json"
-    with open(metrics_file, 'w') as f:
-        json.dump(results, f, indent=2)
+    if is_main_process():
+        with open(metrics_file, 'w') as f:
+            json.dump(results, f, indent=2)
 
     print(f"Saved metrics to {metrics_file}\n")
 
@@ -1651,6 +3367,9 @@ def main():
     print(f"  - {total_models} CNN-based models")
     print(f"{'='*80}\n")
 
+    if world_size > 1:
+        dist.destroy_process_group()
+
 # main(main)
 if __name__ == "__main__":
 
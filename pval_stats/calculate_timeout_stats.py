@@ -3,46 +3,194 @@ AI SLOP
 
 Calculate average proportion of timeouts for positions for each worker.
 
-This script parses a SLURM output file to extract:
+This script parses one or more SLURM output files to extract:
 - Positions processed per worker
 - Piece values gathered per worker
 - Timeouts per worker
+- When each game was started/finished (from the program timer's "Program has been running for ~N seconds" lines)
 
-And calculates the percentage of piece values lost to timeouts.
+And calculates the percentage of piece values lost to timeouts, throughput over time and stragglers.
+
+Large logs are split into byte chunks that are scanned in parallel.
+Results for all logs are written to SUMMARY_JSON, and one row per game to GAMES_PARQUET.
+
+Usage:
+    python calculate_timeout_stats.py slurm.46942719.out "slurm.4*.out" ...
 """
 
 import re
+import os
+import sys
+import glob
+import json
+import statistics
 from collections import defaultdict
-
-def parse_slurm_output(filepath):
-    """Parse the SLURM output file to extract worker statistics."""
-
-    # Pattern to match final worker stats lines
-    # Example: "Worker 107: Stats - 54 games, 5886 positions, 101517 pieces, 1150 timeouts"
-    pattern = re.compile(
-        r'Worker (\d+): Stats - (\d+) games, (\d+) positions, (\d+) pieces, (\d+) timeouts'
-    )
-
+from multiprocessing import Pool, cpu_count
+
+DEFAULT_FILE = "slurm.46942719.out" # CHANGE THIS AS NEEDED (used when no files are given)
+
+SUMMARY_JSON = "timeout_stats_summary.json" # Aggregate results for every log
+GAMES_PARQUET = "timeout_stats_games.parquet" # One row per game (needs pandas + pyarrow)
+
+CHUNK_BYTES = 64 * 1024 * 1024 # Logs are scanned in parallel chunks of this size
+THROUGHPUT_BUCKET_SECS = 600 # Width of throughput-over-time buckets
+STRAGGLER_FACTOR = 1.5 # Worker is a straggler if it finishes after this * median worker finish time
+
+# Pattern to match final worker stats lines
+# Example: "Worker 107: Stats - 54 games, 5886 positions, 101517 pieces, 1150 timeouts"
+STATS_PATTERN = re.compile(
+    r'Worker (\d+): Stats - (\d+) games, (\d+) positions, (\d+) pieces, (\d+) timeouts'
+)
+# Example: "Worker 0: Starting game w0_g0 (original index 0)"
+START_PATTERN = re.compile(r'Worker (\d+): Starting game (\S+)')
+# Example: "Worker 0: Finished game w0_g0, found 1400 pieces"
+FINISH_PATTERN = re.compile(r'Worker (\d+): Finished game (\S+), found (\d+) pieces')
+# Example: "Program has been running for ~60 seconds"
+TICK_PATTERN = re.compile(r'Program has been running for ~(\d+) seconds')
+
+def scan_chunk(args):
+    """
+    Scan the lines starting in bytes [start, end) of a log.
+    Lines from different workers can run together, so every pattern is matched anywhere in a line.
+    Event times are the last timer tick seen before them (None if no tick was seen yet in this chunk).
+    """
+    filepath, chunk_index, start, end = args
     worker_stats = {}
-
-    with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
-        for line in f:
-            match = pattern.search(line)
-            if match:
-                worker_id = int(match.group(1))
-                games_total = int(match.group(2))
-                positions = int(match.group(3))
-                pieces = int(match.group(4))
-                timeouts = int(match.group(5))
-
-                worker_stats[worker_id] = {
-                    'games': games_total,
-                    'positions': positions,
-                    'pieces': pieces,
-                    'timeouts': timeouts
+    events = [] # (kind, worker_id, game_id, pieces, elapsed_secs)
+    last_tick = None
+    first_tick = None
+
+    with open(filepath, 'rb') as f:
+        # Skip the line that started in the previous chunk
+        if start > 0:
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            raw_line = f.readline()
+            if not raw_line:
+                break
+            line = raw_line.decode('utf-8', errors='ignore')
+
+            if 'Program has been running' in line:
+                for match in TICK_PATTERN.finditer(line):
+                    last_tick = int(match.group(1))
+                    if first_tick is None:
+                        first_tick = last_tick
+
+            if 'Worker' not in line:
+                continue
+
+            for match in START_PATTERN.finditer(line):
+                events.append(('start', int(match.group(1)), match.group(2), None, last_tick))
+            for match in FINISH_PATTERN.finditer(line):
+                events.append(('finish', int(match.group(1)), match.group(2), int(match.group(3)), last_tick))
+            for match in STATS_PATTERN.finditer(line):
+                worker_stats[int(match.group(1))] = {
+                    'games': int(match.group(2)),
+                    'positions': int(match.group(3)),
+                    'pieces': int(match.group(4)),
+                    'timeouts': int(match.group(5))
                 }
 
-    return worker_stats
+    return filepath, chunk_index, {'worker_stats': worker_stats, 'events': events, 'last_tick': last_tick}
+
+def chunk_ranges(filepath):
+    """Split a file into (filepath, chunk_index, start, end) byte ranges"""
+    size = os.path.getsize(filepath)
+    ranges = []
+    for chunk_index, start in enumerate(range(0, max(size, 1), CHUNK_BYTES)):
+        ranges.append((filepath, chunk_index, start, min(start + CHUNK_BYTES, size)))
+    return ranges
+
+def parse_slurm_outputs(filepaths, processes=None):
+    """
+    Parse many SLURM output files in parallel chunks.
+    Returns {filepath: {'worker_stats': {...}, 'events': [...]}} with every event time resolved.
+    """
+    tasks = [task for filepath in filepaths for task in chunk_ranges(filepath)]
+    chunks = defaultdict(dict)
+
+    with Pool(processes or min(cpu_count(), max(len(tasks), 1))) as pool:
+        for filepath, chunk_index, result in pool.imap_unordered(scan_chunk, tasks):
+            chunks[filepath][chunk_index] = result
+
+    parsed = {}
+    for filepath in filepaths:
+        worker_stats = {}
+        events = []
+        # Events before a chunk's first tick happened after the previous chunk's last tick
+        carried_tick = 0
+        for chunk_index in sorted(chunks[filepath]):
+            result = chunks[filepath][chunk_index]
+            worker_stats.update(result['worker_stats'])
+            for kind, worker_id, game_id, pieces, elapsed in result['events']:
+                events.append((kind, worker_id, game_id, pieces, carried_tick if elapsed is None else elapsed))
+                if elapsed is not None:
+                    carried_tick = elapsed
+            if result['last_tick'] is not None:
+                carried_tick = result['last_tick']
+        parsed[filepath] = {'worker_stats': worker_stats, 'events': events}
+    return parsed
+
+def parse_slurm_output(filepath):
+    """Parse the SLURM output file to extract worker statistics."""
+    return parse_slurm_outputs([filepath])[filepath]['worker_stats']
+
+def build_game_records(job, events):
+    """Pair start/finish events into one record per game (times are elapsed seconds, 60s resolution)"""
+    games = {}
+    for kind, worker_id, game_id, pieces, elapsed in events:
+        record = games.setdefault(game_id, {
+            'job': job, 'worker_id': worker_id, 'game_id': game_id,
+            'start_secs': None, 'finish_secs': None, 'pieces': None, 'duration_secs': None
+        })
+        if kind == 'start':
+            record['start_secs'] = elapsed
+        else:
+            record['finish_secs'] = elapsed
+            record['pieces'] = pieces
+    for record in games.values():
+        if record['start_secs'] is not None and record['finish_secs'] is not None:
+            record['duration_secs'] = record['finish_secs'] - record['start_secs']
+    return list(games.values())
+
+def calculate_throughput(game_records):
+    """Games and pieces finished per THROUGHPUT_BUCKET_SECS bucket"""
+    buckets = defaultdict(lambda: {'games': 0, 'pieces': 0})
+    for record in game_records:
+        if record['finish_secs'] is None:
+            continue
+        bucket = record['finish_secs'] // THROUGHPUT_BUCKET_SECS * THROUGHPUT_BUCKET_SECS
+        buckets[bucket]['games'] += 1
+        buckets[bucket]['pieces'] += record['pieces']
+    return [{'bucket_start_secs': b, **buckets[b]} for b in sorted(buckets)]
+
+def find_stragglers(game_records):
+    """Workers that finished their last game much later than the median worker, plus the slowest games"""
+    worker_finish = defaultdict(int)
+    unfinished = defaultdict(int)
+    for record in game_records:
+        if record['finish_secs'] is None:
+            unfinished[record['worker_id']] += 1
+        else:
+            worker_finish[record['worker_id']] = max(worker_finish[record['worker_id']], record['finish_secs'])
+
+    median_finish = statistics.median(worker_finish.values()) if worker_finish else 0
+    stragglers = [
+        {'worker_id': w, 'last_finish_secs': t, 'vs_median': t / median_finish if median_finish else None}
+        for w, t in sorted(worker_finish.items(), key=lambda x: -x[1])
+        if median_finish and t > STRAGGLER_FACTOR * median_finish
+    ]
+    slowest_games = sorted(
+        (r for r in game_records if r['duration_secs'] is not None),
+        key=lambda r: -r['duration_secs']
+    )[:10]
+    return {
+        'median_worker_finish_secs': median_finish,
+        'straggler_workers': stragglers,
+        'workers_with_unfinished_games': dict(unfinished),
+        'slowest_games': slowest_games,
+    }
 
 def calculate_statistics(worker_stats):
     """Calculate timeout statistics."""
@@ -75,7 +223,7 @@ def calculate_statistics(worker_stats):
         # Timeouts represent piece value calculations that failed
         # (due to tiemout constraints or either position being invalid)
         # Each position has multiple pieces, so timeouts / (pieces processed + timeouts) gives % lost
-        total_attempted = pieces + timeouts 
+        total_attempted = pieces + timeouts
         if total_attempted > 0:
             timeout_pct = (timeouts / total_attempted) * 100
         else:
@@ -119,7 +267,7 @@ def calculate_statistics(worker_stats):
         print(f"  Max worker timeout %: {max_timeout:.4f}%")
         print()
         print()
-        
+
     return {
         'total_positions': total_positions,
         'total_pieces': total_pieces,
@@ -128,21 +276,98 @@ def calculate_statistics(worker_stats):
         'worker_timeout_proportions': worker_timeout_proportions
     }
 
-def main():
-    file = "slurm.46942719.out" # CHANGE THIS AS NEEDED
+def print_throughput_and_stragglers(throughput, stragglers):
+    """Print throughput-over-time and straggler reports for one job"""
+    print("THROUGHPUT OVER TIME")
+    print("=" * 80)
+    print(f"{'Minutes':<12} {'Games':<10} {'Pieces':<12}")
+    for bucket in throughput:
+        minutes = f"{bucket['bucket_start_secs'] // 60}-{(bucket['bucket_start_secs'] + THROUGHPUT_BUCKET_SECS) // 60}"
+        print(f"{minutes:<12} {bucket['games']:<10} {bucket['pieces']:<12,}")
 
-    print(f"Parsing {file}...")
-    worker_stats = parse_slurm_output(file)
+    print("\nSTRAGGLERS")
+    print("=" * 80)
+    print(f"Median worker finish: {stragglers['median_worker_finish_secs'] / 60:.1f} minutes")
+    for s in stragglers['straggler_workers']:
+        print(f"  Worker {s['worker_id']}: last game finished at {s['last_finish_secs'] / 60:.1f} minutes ({s['vs_median']:.2f}x median)")
+    if not stragglers['straggler_workers']:
+        print(f"  No workers finished later than {STRAGGLER_FACTOR}x the median")
+    for worker_id, count in stragglers['workers_with_unfinished_games'].items():
+        print(f"  Worker {worker_id}: {count} game(s) started but never finished")
+    print("Slowest games:")
+    for r in stragglers['slowest_games']:
+        print(f"  {r['game_id']} (worker {r['worker_id']}): ~{r['duration_secs'] / 60:.0f} minutes, {r['pieces']} pieces")
+    print()
+
+def write_game_records(game_records, output_file):
+    """Write one row per game to parquet (skipped if pandas/pyarrow are missing)"""
+    try:
+        import pandas as pd
+    except ImportError:
+        print(f"pandas not installed, skipping {output_file}")
+        return
+    pd.DataFrame(game_records).to_parquet(output_file, index=False)
+    print(f"Saved {len(game_records):,} game records to {output_file}")
 
-    if not worker_stats:
-        print("No worker statistics found in the file!")
+def main():
+    # Expand every argument as a glob so quoted patterns work too
+    patterns = sys.argv[1:] or [DEFAULT_FILE]
+    files = sorted({path for pattern in patterns for path in (glob.glob(pattern) or [pattern])})
+    missing = [f for f in files if not os.path.exists(f)]
+    if missing:
+        print(f"Files not found: {missing}")
         return
 
-    print(f"Found data for {len(worker_stats)} workers\n")
+    print(f"Parsing {len(files)} file(s): {files}")
+    parsed = parse_slurm_outputs(files)
+
+    summary = {'files': files, 'jobs': {}}
+    all_worker_stats = {}
+    all_game_records = []
+
+    # Jobs are named by their path relative to the directory shared by all files, so same-named logs
+    # from different directories stay separate jobs (a lone file or files in one directory keep their basename)
+    scan_root = os.path.commonpath([os.path.dirname(os.path.abspath(f)) for f in files])
+
+    for filepath in files:
+        job = os.path.relpath(os.path.abspath(filepath), scan_root)
+        worker_stats = parsed[filepath]['worker_stats']
+        game_records = build_game_records(job, parsed[filepath]['events'])
+        all_game_records.extend(game_records)
+
+        print(f"\n{'#' * 80}\n{job}\n{'#' * 80}")
+        if not worker_stats and not game_records:
+            print("No worker statistics found in the file!")
+            continue
+        print(f"Found data for {len(worker_stats)} workers, {len(game_records)} games\n")
+
+        results = calculate_statistics(worker_stats) if worker_stats else {}
+        throughput = calculate_throughput(game_records)
+        stragglers = find_stragglers(game_records)
+        print_throughput_and_stragglers(throughput, stragglers)
+
+        for worker_id, stats in worker_stats.items():
+            all_worker_stats[f"{job}:{worker_id}"] = stats
+        summary['jobs'][job] = {
+            'worker_stats': {str(k): v for k, v in worker_stats.items()},
+            'results': results,
+            'throughput': throughput,
+            'stragglers': stragglers,
+        }
+
+    if not all_worker_stats and not all_game_records:
+        print("No worker statistics found in any file!")
+        return
 
-    results = calculate_statistics(worker_stats)
+    # Totals over every job
+    if len(files) > 1 and all_worker_stats:
+        print(f"\n{'#' * 80}\nALL JOBS\n{'#' * 80}")
+        summary['all_jobs'] = calculate_statistics(all_worker_stats)
 
-    print(results)
+    with open(SUMMARY_JSON, 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(f"Saved summary to {SUMMARY_JSON}")
+    write_game_records(all_game_records, GAMES_PARQUET)
 
 if __name__ == "__main__":
     main()